@@ -6,6 +6,7 @@ from flask_migrate import Migrate
 from backend.config import Config
 from backend.models import db, Modulo
 from backend.routes import bp
+from backend.commands import register_commands
 
 DEFAULT_MODULES = [
     "ABAP", "BASIS", "BI", "BO", "BCP", "BW", "CO", "ECP", "FI", "MM",
@@ -66,6 +67,11 @@ def create_app(config_object=Config):
     # ----------------------
     app.register_blueprint(bp, url_prefix="/api")
 
+    # ----------------------
+    # COMANDOS CLI (flask <comando>)
+    # ----------------------
+    register_commands(app)
+
     # ----------------------
     # ENDPOINTS DE SALUD
     # ----------------------
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+
+class TTLCache:
+    """Caché en proceso, acotada (LRU) y con expiración por entrada."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            expires_at, value = item
+            if expires_at <= now:
+                self._data.pop(key, None)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else float(ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[1] if item else default
+
+    def discard_where(self, predicate):
+        """Elimina las entradas cuyo valor cumple `predicate(value)`."""
+        with self._lock:
+            keys = [k for k, (_exp, v) in self._data.items() if predicate(v)]
+            for k in keys:
+                self._data.pop(k, None)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class DataVersions:
+    """
+    Contadores de versión por dominio de datos (permisos, catálogos, ...).
+    Las cachés guardan la versión con la que se calcularon y se descartan
+    cuando el contador avanza.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            return self._versions.get(name, 0)
+
+    def bump(self, *names):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+
+data_versions = DataVersions()
+
+_PENDING_KEY = "_data_versions_pending"
+_SHARED_KEY = "_data_versions_shared"
+
+# Última versión leída de la tabla data_version, por nombre (ver version_compartida).
+_VERSIONES_BD = TTLCache(maxsize=64, ttl=5)
+
+
+def bump_on_commit(session, *names, compartida=False):
+    """
+    Marca dominios a versionar cuando la transacción de `session` confirme.
+    Con compartida=True además incrementa data_version en esa transacción,
+    como version_on_write(compartida=True).
+    """
+    if session is None:
+        data_versions.bump(*names)
+        return
+    session.info.setdefault(_PENDING_KEY, set()).update(names)
+    if compartida:
+        _marcar_compartidas(session, session.connection(), names)
+
+
+def bump_compartida(engine, *names):
+    """
+    Avanza `names` ya, en este proceso y en data_version (transacción propia).
+    Para invalidaciones que ocurren después del commit de la request o de
+    escrituras masivas que no disparan eventos ORM.
+    """
+    with engine.begin() as connection:
+        for name in names:
+            _incrementar_version_bd(connection, name)
+    data_versions.bump(*names)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_pending_versions(session):
+    session.info.pop(_SHARED_KEY, None)
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        data_versions.bump(*pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_versions(session):
+    session.info.pop(_SHARED_KEY, None)
+    session.info.pop(_PENDING_KEY, None)
+
+
+def _incrementar_version_bd(connection, name):
+    from backend.models import DataVersion
+
+    tabla = DataVersion.__table__
+    result = connection.execute(
+        update(tabla).where(tabla.c.nombre == name).values(version=tabla.c.version + 1)
+    )
+    if not result.rowcount:
+        connection.execute(insert(tabla).values(nombre=name, version=1))
+
+
+def _marcar_compartidas(session, connection, names):
+    hechas = session.info.setdefault(_SHARED_KEY, set())
+    for name in names:
+        if name not in hechas:
+            hechas.add(name)
+            _incrementar_version_bd(connection, name)
+
+
+def version_compartida(bind, name, ttl=0):
+    """
+    Versión de `name` válida entre workers: (contador local, fila de data_version).
+    El contador local cambia en cuanto este proceso confirma; la fila de BD
+    refleja los commits de cualquier proceso. Con `ttl` > 0 la lectura de BD
+    se reutiliza hasta `ttl` segundos.
+    """
+    from backend.models import DataVersion
+
+    valor = _VERSIONES_BD.get(name) if ttl > 0 else None
+    if valor is None:
+        valor = int(bind.execute(
+            select(DataVersion.version).where(DataVersion.nombre == name)
+        ).scalar() or 0)
+        if ttl > 0:
+            _VERSIONES_BD.set(name, valor, ttl)
+
+    return data_versions.get(name), valor
+
+
+def version_on_write(name, *models, compartida=False):
+    """
+    Versiona `name` tras el commit de cualquier INSERT/UPDATE/DELETE ORM sobre `models`.
+    Con compartida=True además incrementa la fila `name` de data_version dentro
+    de la misma transacción (una vez por transacción), para que los demás
+    workers detecten el cambio con version_compartida().
+    """
+
+    def _mark(_mapper, connection, target):
+        session = object_session(target)
+        bump_on_commit(session, name)
+        if compartida and session is not None:
+            _marcar_compartidas(session, connection, (name,))
+
+    for model in models:
+        for evt in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, evt, _mark)
@@ -0,0 +1,317 @@
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from backend.models import (
+    db, Registro, Consultor, Equipo, CalendarioLaboral, DiaNoLaborableEmpresa, Oportunidad,
+    parse_fecha_registro, norm_key_for_match, estado_oferta_excluido,
+)
+
+
+def register_commands(app):
+    app.cli.add_command(registros_backfill_fecha_date)
+    app.cli.add_command(registros_backfill_horas_adicionales)
+    app.cli.add_command(registros_verificar_horas_adicionales)
+    app.cli.add_command(calendario_generar)
+    app.cli.add_command(calendario_dia_empresa)
+    app.cli.add_command(registros_resumen_reconstruir)
+    app.cli.add_command(registros_resumen_verificar)
+    app.cli.add_command(registros_proyectos_recalcular)
+    app.cli.add_command(oportunidades_backfill_norm)
+    app.cli.add_command(coe_calificacion_recalcular)
+
+
+@click.command("registros-backfill-fecha-date")
+@click.option("--batch-size", default=2000, show_default=True, type=int)
+@click.option("--todos", is_flag=True, help="Recalcula también filas que ya tienen fecha_date.")
+@with_appcontext
+def registros_backfill_fecha_date(batch_size, todos):
+    """Rellena Registro.fecha_date a partir de Registro.fecha (por lotes de id)."""
+    last_id = 0
+    actualizados = 0
+    invalidos = 0
+
+    while True:
+        q = db.session.query(Registro.id, Registro.fecha).filter(Registro.id > last_id)
+        if not todos:
+            q = q.filter(Registro.fecha_date.is_(None))
+        rows = q.order_by(Registro.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+
+        mappings = []
+        for rid, fecha in rows:
+            fecha_date = parse_fecha_registro(fecha)
+            if fecha_date is None:
+                invalidos += 1
+                continue
+            mappings.append({"id": rid, "fecha_date": fecha_date})
+
+        if mappings:
+            db.session.bulk_update_mappings(Registro, mappings)
+        db.session.commit()
+
+        actualizados += len(mappings)
+        last_id = rows[-1][0]
+
+    click.echo(f"fecha_date actualizada: {actualizados} | fechas no reconocidas: {invalidos}")
+
+
+def _lotes_horas_adicionales(batch_size, solo_pendientes):
+    """Itera lotes (id, valor_guardado, valor_recalculado) por keyset de id."""
+    from backend.routes import _calcular_horas_adicionales_por_horario
+
+    last_id = 0
+    while True:
+        q = (
+            db.session.query(
+                Registro.id,
+                Registro.hora_inicio,
+                Registro.hora_fin,
+                Registro.horario_trabajo,
+                Registro.horas_adicionales,
+                Registro.horas_adicionales_calc,
+                Registro.equipo,
+                Equipo.nombre.label("equipo_consultor"),
+            )
+            .outerjoin(Consultor, Registro.consultor_id == Consultor.id)
+            .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
+            .filter(Registro.id > last_id)
+        )
+        if solo_pendientes:
+            q = q.filter(Registro.horas_adicionales_calc.is_(None))
+        rows = q.order_by(Registro.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+
+        yield [
+            (
+                r.id,
+                r.horas_adicionales_calc,
+                _calcular_horas_adicionales_por_horario(
+                    r.hora_inicio,
+                    r.hora_fin,
+                    r.horario_trabajo,
+                    r.equipo_consultor or r.equipo,
+                    r.horas_adicionales,
+                ),
+            )
+            for r in rows
+        ]
+        last_id = rows[-1].id
+
+
+@click.command("registros-backfill-horas-adicionales")
+@click.option("--batch-size", default=2000, show_default=True, type=int)
+@click.option("--todos", is_flag=True, help="Recalcula también filas ya clasificadas.")
+@with_appcontext
+def registros_backfill_horas_adicionales(batch_size, todos):
+    """Persiste Registro.horas_adicionales_calc / es_hora_adicional por lotes de id."""
+    actualizados = 0
+
+    for lote in _lotes_horas_adicionales(batch_size, solo_pendientes=not todos):
+        mappings = [
+            {
+                "id": rid,
+                "horas_adicionales_calc": valor,
+                "es_hora_adicional": str(valor or "").strip().upper() in ("SÍ", "SI"),
+            }
+            for rid, guardado, valor in lote
+            if guardado != valor
+        ]
+        if mappings:
+            db.session.bulk_update_mappings(Registro, mappings)
+        db.session.commit()
+        actualizados += len(mappings)
+
+    click.echo(f"horas_adicionales_calc actualizada: {actualizados}")
+
+
+@click.command("registros-verificar-horas-adicionales")
+@click.option("--batch-size", default=2000, show_default=True, type=int)
+@click.option("--muestras", default=20, show_default=True, type=int,
+              help="Cantidad de diferencias a listar.")
+@with_appcontext
+def registros_verificar_horas_adicionales(batch_size, muestras):
+    """Compara el valor guardado con el recalculado y reporta las diferencias."""
+    revisados = 0
+    pendientes = 0
+    diferencias = []
+
+    for lote in _lotes_horas_adicionales(batch_size, solo_pendientes=False):
+        for rid, guardado, valor in lote:
+            revisados += 1
+            if guardado is None:
+                pendientes += 1
+            elif guardado != valor:
+                diferencias.append((rid, guardado, valor))
+
+    for rid, guardado, valor in diferencias[:muestras]:
+        click.echo(f"registro {rid}: guardado={guardado} recalculado={valor}")
+
+    click.echo(
+        f"revisados: {revisados} | sin clasificar: {pendientes} | diferencias: {len(diferencias)}"
+    )
+    if diferencias or pendientes:
+        click.echo("Ejecuta `flask registros-backfill-horas-adicionales --todos` para corregir.")
+        raise click.exceptions.Exit(1)
+
+
+def _regenerar_calendario(desde, hasta):
+    from backend.routes import _filas_calendario_laboral
+
+    filas = _filas_calendario_laboral(desde, hasta)
+    db.session.query(CalendarioLaboral).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(CalendarioLaboral, filas)
+    db.session.commit()
+    return len(filas)
+
+
+@click.command("calendario-generar")
+@click.option("--desde-anio", type=int, default=None, help="Por defecto: año actual - 3.")
+@click.option("--hasta-anio", type=int, default=None, help="Por defecto: año actual + 2.")
+@with_appcontext
+def calendario_generar(desde_anio, hasta_anio):
+    """Regenera calendario_laboral completo (festivos CO + días de empresa)."""
+    hoy = date.today()
+    desde_anio = desde_anio or hoy.year - 3
+    hasta_anio = hasta_anio or hoy.year + 2
+    if hasta_anio < desde_anio:
+        raise click.BadParameter("--hasta-anio debe ser >= --desde-anio")
+
+    total = _regenerar_calendario(date(desde_anio, 1, 1), date(hasta_anio, 12, 31))
+    click.echo(f"calendario_laboral: {total} días ({desde_anio}-{hasta_anio})")
+
+
+@click.command("calendario-dia-empresa")
+@click.argument("fecha")
+@click.option("--descripcion", default=None)
+@click.option("--quitar", is_flag=True, help="Elimina el día en lugar de agregarlo.")
+@with_appcontext
+def calendario_dia_empresa(fecha, descripcion, quitar):
+    """Agrega/quita un día no laborable de la empresa (YYYY-MM-DD) y recalcula el calendario."""
+    try:
+        fecha_d = datetime.strptime(fecha, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter("usa YYYY-MM-DD", param_hint="fecha")
+
+    dia = DiaNoLaborableEmpresa.query.filter_by(fecha=fecha_d).first()
+    if quitar:
+        if dia:
+            db.session.delete(dia)
+    elif dia:
+        dia.descripcion = descripcion or dia.descripcion
+    else:
+        db.session.add(DiaNoLaborableEmpresa(fecha=fecha_d, descripcion=descripcion))
+    db.session.commit()
+
+    desde, hasta = db.session.query(
+        func.min(CalendarioLaboral.fecha), func.max(CalendarioLaboral.fecha)
+    ).one()
+    if desde and hasta:
+        total = _regenerar_calendario(desde, hasta)
+        click.echo(f"calendario_laboral recalculado: {total} días")
+    else:
+        click.echo("calendario_laboral vacío: ejecuta `flask calendario-generar`.")
+
+
+@click.command("registros-resumen-reconstruir")
+@click.option("--batch-size", default=5000, show_default=True, type=int)
+@with_appcontext
+def registros_resumen_reconstruir(batch_size):
+    """Reconstruye registro_resumen_diario desde registro."""
+    from backend.rollups import reconstruir_resumen
+
+    filas = reconstruir_resumen(db.session, batch_size)
+    db.session.commit()
+    click.echo(f"filas de resumen: {filas}")
+
+
+@click.command("registros-resumen-verificar")
+@click.option("--batch-size", default=5000, show_default=True, type=int)
+@click.option("--muestras", default=20, show_default=True, type=int,
+              help="Cantidad de diferencias a listar.")
+@with_appcontext
+def registros_resumen_verificar(batch_size, muestras):
+    """Compara registro_resumen_diario con un recálculo desde registro."""
+    from backend.rollups import diferencias_resumen
+
+    diferencias = diferencias_resumen(db.session, batch_size)
+    for clave, guardado, esperado in diferencias[:muestras]:
+        click.echo(f"clave {clave}: guardado={guardado} recalculado={esperado}")
+
+    click.echo(f"diferencias: {len(diferencias)}")
+    if diferencias:
+        click.echo("Ejecuta `flask registros-resumen-reconstruir` para corregir.")
+        raise click.exceptions.Exit(1)
+
+
+@click.command("registros-proyectos-recalcular")
+@click.option("--proyecto-id", "proyecto_ids", multiple=True, type=int,
+              help="Limita el recálculo a estos proyectos (repetible).")
+@click.option("--batch-size", default=5000, show_default=True, type=int)
+@with_appcontext
+def registros_proyectos_recalcular(proyecto_ids, batch_size):
+    """Recalcula registro_proyecto_match con las reglas actuales de proyectos y mapeos."""
+    from backend.proyecto_matches import recalcular_matches
+
+    total = recalcular_matches(db.session, proyecto_ids or None, batch_size)
+    db.session.commit()
+    click.echo(f"asociaciones registro-proyecto: {total}")
+
+
+@click.command("oportunidades-backfill-norm")
+@click.option("--batch-size", default=2000, show_default=True, type=int)
+@with_appcontext
+def oportunidades_backfill_norm(batch_size):
+    """Recalcula estado_oferta_norm, resultado_oferta_norm y estado_excluido."""
+    last_id = 0
+    actualizados = 0
+
+    while True:
+        rows = (
+            db.session.query(Oportunidad.id, Oportunidad.estado_oferta, Oportunidad.resultado_oferta)
+            .filter(Oportunidad.id > last_id)
+            .order_by(Oportunidad.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+
+        db.session.bulk_update_mappings(Oportunidad, [
+            {
+                "id": oid,
+                "estado_oferta_norm": norm_key_for_match(estado)[:100] or None,
+                "resultado_oferta_norm": norm_key_for_match(resultado)[:100] or None,
+                "estado_excluido": estado_oferta_excluido(estado),
+            }
+            for oid, estado, resultado in rows
+        ])
+        db.session.commit()
+
+        actualizados += len(rows)
+        last_id = rows[-1][0]
+
+    click.echo(f"oportunidades actualizadas: {actualizados}")
+
+
+@click.command("coe-calificacion-recalcular")
+@click.option("--batch-size", default=1000, show_default=True, type=int)
+@click.option("--usuario", default="sistema", show_default=True,
+              help="Valor para actualizado_por en las filas modificadas.")
+@with_appcontext
+def coe_calificacion_recalcular(batch_size, usuario):
+    """Recalcula los campos derivados de la calificación COE SAP Funcional (fechas, SLA, totales, estados)."""
+    from backend.routes import _coe_ext_recalcular_calificaciones
+
+    resultado = _coe_ext_recalcular_calificaciones(usuario, batch_size)
+    for campo, cambios in resultado["cambiosPorCampo"].items():
+        click.echo(f"{campo}: {cambios}")
+
+    click.echo(
+        f"calificaciones: {resultado['total']} "
+        f"actualizadas: {resultado['actualizados']} sin cambios: {resultado['sin_cambios']}"
+    )
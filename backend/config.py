@@ -19,3 +19,7 @@ class Config:
         "pool_recycle": 280,
     }
 
+    # Caché de resolución de sesión (token -> Login + Consultor)
+    SESSION_CACHE_TTL = int(os.environ.get("SESSION_CACHE_TTL", "60"))
+    SESSION_CACHE_MAXSIZE = int(os.environ.get("SESSION_CACHE_MAXSIZE", "2048"))
+
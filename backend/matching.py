@@ -0,0 +1,49 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Autómata multi-patrón: una pasada por el texto encuentra todos los
+    patrones contenidos. patrones: {texto: iterable de ids}.
+    """
+
+    def __init__(self, patrones):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [frozenset()]
+
+        for patron, ids in patrones.items():
+            s = 0
+            for ch in patron:
+                nxt = self.goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[s][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(frozenset())
+                s = nxt
+            self.out[s] = self.out[s] | frozenset(ids)
+
+        cola = deque(self.goto[0].values())
+        while cola:
+            s = cola.popleft()
+            for ch, t in self.goto[s].items():
+                cola.append(t)
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(ch, 0) if s else 0
+                self.out[t] = self.out[t] | self.out[self.fail[t]]
+
+    def buscar(self, texto):
+        goto, fail, out = self.goto, self.fail, self.out
+        encontrados = set()
+        s = 0
+        for ch in texto:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                encontrados |= out[s]
+        return encontrados
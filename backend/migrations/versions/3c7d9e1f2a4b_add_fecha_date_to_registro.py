@@ -0,0 +1,105 @@
+"""add fecha_date to registro
+
+Revision ID: 3c7d9e1f2a4b
+Revises: f09993041fbe
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7d9e1f2a4b'
+down_revision = 'f09993041fbe'
+branch_labels = None
+depends_on = None
+
+
+def _column_exists(table_name: str, column_name: str) -> bool:
+    conn = op.get_bind()
+    return bool(conn.execute(sa.text("""
+        SELECT COUNT(*)
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :t
+          AND COLUMN_NAME = :c
+    """), {"t": table_name, "c": column_name}).scalar())
+
+
+def _index_exists(table_name: str, index_name: str) -> bool:
+    conn = op.get_bind()
+    return bool(conn.execute(sa.text("""
+        SELECT COUNT(*)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_NAME = :t
+          AND INDEX_NAME = :i
+    """), {"t": table_name, "i": index_name}).scalar())
+
+
+# Mismos formatos que models.REGISTRO_FECHA_FORMATOS / parse_fecha_registro
+# (texto recortado a 10 caracteres). El REGEXP evita pasar a STR_TO_DATE
+# textos de otro formato.
+_FECHA_TXT = "LEFT(TRIM(fecha), 10)"
+_FECHA_SQL = f"""
+    CASE
+        WHEN {_FECHA_TXT} REGEXP '^[0-9]{{4}}-[0-9]{{1,2}}-[0-9]{{1,2}}$'
+            THEN STR_TO_DATE({_FECHA_TXT}, '%Y-%m-%d')
+        WHEN {_FECHA_TXT} REGEXP '^[0-9]{{1,2}}/[0-9]{{1,2}}/[0-9]{{4}}$'
+            THEN STR_TO_DATE({_FECHA_TXT}, '%d/%m/%Y')
+        WHEN {_FECHA_TXT} REGEXP '^[0-9]{{1,2}}-[0-9]{{1,2}}-[0-9]{{4}}$'
+            THEN STR_TO_DATE({_FECHA_TXT}, '%d-%m-%Y')
+    END
+"""
+_LOTE_BACKFILL = 50000
+
+
+def _backfill_fecha_date():
+    """Llena fecha_date por rangos de id para no bloquear registro en una sola sentencia."""
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM registro")).scalar()
+
+    # Sin modo estricto una fecha imposible (p. ej. 31/02) queda en NULL en vez
+    # de abortar el UPDATE, igual que parse_fecha_registro.
+    conn.execute(sa.text("SET @sql_mode_previo = @@SESSION.sql_mode"))
+    conn.execute(sa.text("SET SESSION sql_mode = ''"))
+    try:
+        for desde in range(0, max_id, _LOTE_BACKFILL):
+            conn.execute(sa.text(f"""
+                UPDATE registro
+                SET fecha_date = {_FECHA_SQL}
+                WHERE id > :desde AND id <= :hasta
+                  AND fecha_date IS NULL
+            """), {"desde": desde, "hasta": desde + _LOTE_BACKFILL})
+    finally:
+        conn.execute(sa.text("SET SESSION sql_mode = @sql_mode_previo"))
+
+
+def upgrade():
+    if not _column_exists("registro", "fecha_date"):
+        op.add_column("registro", sa.Column("fecha_date", sa.Date(), nullable=True))
+
+    # Los filtros de fecha dependen de fecha_date desde este despliegue:
+    # se llena aquí. `flask registros-backfill-fecha-date` queda para
+    # re-verificar con la lógica Python del @validates.
+    _backfill_fecha_date()
+
+    if not _index_exists("registro", "ix_registro_fecha_date_usuario"):
+        op.create_index(
+            "ix_registro_fecha_date_usuario",
+            "registro",
+            ["fecha_date", "usuario_consultor"],
+        )
+    if not _index_exists("registro", "ix_registro_fecha_date_cliente"):
+        op.create_index(
+            "ix_registro_fecha_date_cliente",
+            "registro",
+            ["fecha_date", "cliente"],
+        )
+
+
+def downgrade():
+    op.drop_index("ix_registro_fecha_date_cliente", table_name="registro")
+    op.drop_index("ix_registro_fecha_date_usuario", table_name="registro")
+    op.drop_column("registro", "fecha_date")
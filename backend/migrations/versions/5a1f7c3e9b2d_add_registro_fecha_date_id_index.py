@@ -0,0 +1,28 @@
+"""add (fecha_date, id) index to registro
+
+Revision ID: 5a1f7c3e9b2d
+Revises: 8e2b4c6d1f3a
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a1f7c3e9b2d'
+down_revision = '8e2b4c6d1f3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Soporta la paginación keyset de GET /registros (ORDER BY fecha_date DESC, id DESC).
+    op.create_index(
+        "ix_registro_fecha_date_id",
+        "registro",
+        ["fecha_date", "id"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_registro_fecha_date_id", table_name="registro")
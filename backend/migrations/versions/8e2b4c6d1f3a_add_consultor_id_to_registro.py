@@ -0,0 +1,55 @@
+"""add consultor_id to registro
+
+Revision ID: 8e2b4c6d1f3a
+Revises: 3c7d9e1f2a4b
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b4c6d1f3a'
+down_revision = '3c7d9e1f2a4b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("registro", sa.Column("consultor_id", sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        "fk_registro_consultor_id",
+        "registro",
+        "consultor",
+        ["consultor_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+    op.create_index(
+        "ix_registro_consultor_id_fecha_date",
+        "registro",
+        ["consultor_id", "fecha_date"],
+    )
+
+    # Backfill: mismas reglas que resolver_consultor_id (usuario y luego nombre)
+    op.execute("""
+        UPDATE registro r
+        JOIN consultor c
+          ON LOWER(TRIM(r.usuario_consultor)) = LOWER(TRIM(c.usuario))
+        SET r.consultor_id = c.id
+        WHERE r.consultor_id IS NULL
+    """)
+    op.execute("""
+        UPDATE registro r
+        JOIN consultor c
+          ON LOWER(TRIM(r.usuario_consultor)) = LOWER(TRIM(c.nombre))
+        SET r.consultor_id = c.id
+        WHERE r.consultor_id IS NULL
+    """)
+
+
+def downgrade():
+    op.drop_index("ix_registro_consultor_id_fecha_date", table_name="registro")
+    op.drop_constraint("fk_registro_consultor_id", "registro", type_="foreignkey")
+    op.drop_column("registro", "consultor_id")
@@ -0,0 +1,36 @@
+"""add data_version
+
+Revision ID: a8c2e4f6b0d1
+Revises: f3c5a7e9b1d2
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c2e4f6b0d1'
+down_revision = 'f3c5a7e9b1d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tabla = op.create_table(
+        "data_version",
+        sa.Column("nombre", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False, server_default=sa.text("0")),
+        sa.PrimaryKeyConstraint("nombre"),
+    )
+    op.bulk_insert(tabla, [
+        {"nombre": nombre, "version": 0}
+        for nombre in (
+            "permisos", "proyecto_mapeos", "clientes", "coe_estados", "sesiones", "catalogos",
+            "oportunidades", "calificacion",
+        )
+    ])
+
+
+def downgrade():
+    op.drop_table("data_version")
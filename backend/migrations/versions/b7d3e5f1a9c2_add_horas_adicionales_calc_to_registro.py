@@ -0,0 +1,28 @@
+"""add horas_adicionales_calc / es_hora_adicional to registro
+
+Revision ID: b7d3e5f1a9c2
+Revises: 5a1f7c3e9b2d
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e5f1a9c2'
+down_revision = '5a1f7c3e9b2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("registro", sa.Column("horas_adicionales_calc", sa.String(length=10), nullable=True))
+    op.add_column("registro", sa.Column("es_hora_adicional", sa.Boolean(), nullable=True))
+    # El cálculo depende de reglas de horario en Python:
+    # rellenar con `flask registros-backfill-horas-adicionales`.
+
+
+def downgrade():
+    op.drop_column("registro", "es_hora_adicional")
+    op.drop_column("registro", "horas_adicionales_calc")
@@ -0,0 +1,45 @@
+"""add calendario_laboral and dia_no_laborable_empresa
+
+Revision ID: c4e8a2f6d0b1
+Revises: b7d3e5f1a9c2
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f6d0b1'
+down_revision = 'b7d3e5f1a9c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "calendario_laboral",
+        sa.Column("fecha", sa.Date(), nullable=False),
+        sa.Column("es_laborable", sa.Boolean(), nullable=False),
+        sa.Column("es_festivo", sa.Boolean(), nullable=False),
+        sa.Column("es_no_laborable_empresa", sa.Boolean(), nullable=False),
+        sa.Column("meta_horas", sa.Numeric(5, 2), nullable=False),
+        sa.Column("meta_horas_acum", sa.Numeric(12, 2), nullable=False),
+        sa.Column("dias_laborables_acum", sa.Integer(), nullable=False),
+        sa.Column("dias_festivos_acum", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("fecha"),
+    )
+    op.create_table(
+        "dia_no_laborable_empresa",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("fecha", sa.Date(), nullable=False),
+        sa.Column("descripcion", sa.String(length=200), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("fecha"),
+    )
+    # Se llena con `flask calendario-generar`.
+
+
+def downgrade():
+    op.drop_table("dia_no_laborable_empresa")
+    op.drop_table("calendario_laboral")
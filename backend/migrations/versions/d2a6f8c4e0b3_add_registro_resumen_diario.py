@@ -0,0 +1,101 @@
+"""add registro_resumen_diario rollup
+
+Revision ID: d2a6f8c4e0b3
+Revises: c4e8a2f6d0b1
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f8c4e0b3'
+down_revision = 'c4e8a2f6d0b1'
+branch_labels = None
+depends_on = None
+
+
+# Mismas normalizaciones que backend.rollups.dimensiones_de / clave_de: texto
+# recortado (vacío -> NULL), usuario en minúsculas, NULL marcado con \x00 y
+# partes unidas con \x1f antes del md5. Si la clave difiere de la que calcula
+# Python, los deltas de update/delete no encuentran la fila del backfill.
+_NULO = "CHAR(0 USING utf8mb4)"
+_DIMENSIONES_SQL = (
+    ("fecha_date", "fecha_date"),
+    ("consultor_id", "consultor_id"),
+    ("usuario_consultor", "LOWER(NULLIF(TRIM(usuario_consultor), ''))"),
+    ("equipo", "NULLIF(TRIM(equipo), '')"),
+    ("cliente", "NULLIF(TRIM(cliente), '')"),
+    ("ocupacion_id", "ocupacion_id"),
+    ("tarea_id", "tarea_id"),
+    ("proyecto_id", "proyecto_id"),
+)
+
+
+def _backfill_resumen():
+    # Se agrupa por la clave y no por las columnas: con la collation *_ci
+    # "Cliente" y "CLIENTE" caerían en un mismo grupo, y en Python no.
+    nombres = [nombre for nombre, _ in _DIMENSIONES_SQL]
+    partes = ", ".join(f"COALESCE(CAST({expr} AS CHAR), {_NULO})" for _, expr in _DIMENSIONES_SQL)
+    dims = ",\n                ".join(f"{expr} AS {nombre}" for nombre, expr in _DIMENSIONES_SQL)
+    op.get_bind().execute(sa.text(f"""
+        INSERT INTO registro_resumen_diario
+            (clave, {", ".join(nombres)}, registros, total_horas, horas)
+        SELECT
+            d.clave,
+            {", ".join(f"MIN(d.{n})" for n in nombres)},
+            COUNT(*),
+            ROUND(SUM(COALESCE(d.total_horas, 0)), 4),
+            ROUND(SUM(COALESCE(d.total_horas, d.tiempo_invertido, 0)), 4)
+        FROM (
+            SELECT
+                MD5(CONCAT_WS(CHAR(31 USING utf8mb4), {partes})) AS clave,
+                {dims},
+                total_horas,
+                tiempo_invertido
+            FROM registro
+        ) d
+        GROUP BY d.clave
+    """))
+
+
+def upgrade():
+    op.create_table(
+        "registro_resumen_diario",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("clave", sa.String(length=32), nullable=False),
+        sa.Column("fecha_date", sa.Date(), nullable=True),
+        sa.Column("consultor_id", sa.Integer(), nullable=True),
+        sa.Column("usuario_consultor", sa.String(length=100), nullable=True),
+        sa.Column("equipo", sa.String(length=50), nullable=True),
+        sa.Column("cliente", sa.String(length=100), nullable=True),
+        sa.Column("ocupacion_id", sa.Integer(), nullable=True),
+        sa.Column("tarea_id", sa.Integer(), nullable=True),
+        sa.Column("proyecto_id", sa.Integer(), nullable=True),
+        sa.Column("registros", sa.Integer(), nullable=False),
+        sa.Column("total_horas", sa.Numeric(14, 4), nullable=False),
+        sa.Column("horas", sa.Numeric(14, 4), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("clave"),
+    )
+    op.create_index(
+        "ix_registro_resumen_fecha_consultor",
+        "registro_resumen_diario",
+        ["fecha_date", "consultor_id"],
+    )
+    op.create_index(
+        "ix_registro_resumen_consultor_fecha",
+        "registro_resumen_diario",
+        ["consultor_id", "fecha_date"],
+    )
+    # Los reportes leen el rollup desde este despliegue y los listeners solo
+    # aplican deltas: se llena aquí. `flask registros-resumen-verificar`
+    # compara contra el cálculo en Python.
+    _backfill_resumen()
+
+
+def downgrade():
+    op.drop_index("ix_registro_resumen_consultor_fecha", table_name="registro_resumen_diario")
+    op.drop_index("ix_registro_resumen_fecha_consultor", table_name="registro_resumen_diario")
+    op.drop_table("registro_resumen_diario")
@@ -0,0 +1,123 @@
+"""add registro_proyecto_match
+
+Revision ID: e7b1d3f5a9c4
+Revises: d2a6f8c4e0b3
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b1d3f5a9c4'
+down_revision = 'd2a6f8c4e0b3'
+branch_labels = None
+depends_on = None
+
+_LOTE_REGEX = 5000
+
+# Mismas reglas que backend.proyecto_matches.MotorProyectos: proyecto_id
+# explícito, código del proyecto y CONTAINS como subcadena, EXACT contra el
+# texto recortado; todo sobre UPPER(nro_caso_cliente) y UPPER(descripcion).
+_NRO = "UPPER(COALESCE(r.nro_caso_cliente, ''))"
+_DESC = "UPPER(COALESCE(r.descripcion, ''))"
+_VALOR = "UPPER(TRIM(m.valor_origen))"
+_TIPO = "COALESCE(NULLIF(UPPER(TRIM(m.tipo_match)), ''), 'EXACT')"
+_CODIGO = "UPPER(TRIM(p.codigo))"
+
+
+def _backfill_matches():
+    conn = op.get_bind()
+    conn.execute(sa.text(f"""
+        INSERT INTO registro_proyecto_match (registro_id, proyecto_id)
+        SELECT r.id, p.id
+        FROM registro r
+        JOIN proyecto p ON p.id = r.proyecto_id
+        UNION
+        SELECT r.id, p.id
+        FROM proyecto p
+        JOIN registro r
+          ON LOCATE({_CODIGO}, {_NRO}) > 0 OR LOCATE({_CODIGO}, {_DESC}) > 0
+        WHERE COALESCE({_CODIGO}, '') <> ''
+        UNION
+        SELECT r.id, m.proyecto_id
+        FROM proyecto_mapeos m
+        JOIN registro r
+          ON (
+            {_TIPO} = 'EXACT'
+            AND (TRIM({_NRO}) = {_VALOR} OR TRIM({_DESC}) = {_VALOR})
+          ) OR (
+            {_TIPO} = 'CONTAINS'
+            AND (LOCATE({_VALOR}, {_NRO}) > 0 OR LOCATE({_VALOR}, {_DESC}) > 0)
+          )
+        WHERE m.activo = 1
+          AND COALESCE({_VALOR}, '') <> ''
+    """))
+
+    # REGEX se evalúa con `re` como en la aplicación (REGEXP de MySQL no
+    # acepta la misma sintaxis). Normalmente no hay reglas de este tipo.
+    patrones = []
+    for proyecto_id, valor in conn.execute(sa.text(f"""
+        SELECT m.proyecto_id, {_VALOR}
+        FROM proyecto_mapeos m
+        WHERE m.activo = 1 AND {_TIPO} = 'REGEX' AND COALESCE({_VALOR}, '') <> ''
+    """)):
+        try:
+            patrones.append((re.compile(valor, re.IGNORECASE), proyecto_id))
+        except re.error:
+            continue
+    if not patrones:
+        return
+
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text("""
+            SELECT id, nro_caso_cliente, descripcion
+            FROM registro
+            WHERE id > :last_id
+            ORDER BY id
+            LIMIT :lote
+        """), {"last_id": last_id, "lote": _LOTE_REGEX}).all()
+        if not rows:
+            break
+
+        nuevos = [
+            {"registro_id": rid, "proyecto_id": pid}
+            for rid, nro, desc in rows
+            for patron, pid in patrones
+            if any(patron.search((texto or "").upper()) for texto in (nro, desc))
+        ]
+        if nuevos:
+            conn.execute(sa.text("""
+                INSERT IGNORE INTO registro_proyecto_match (registro_id, proyecto_id)
+                VALUES (:registro_id, :proyecto_id)
+            """), nuevos)
+        last_id = rows[-1].id
+
+
+def upgrade():
+    op.create_table(
+        "registro_proyecto_match",
+        sa.Column("registro_id", sa.Integer(), nullable=False),
+        sa.Column("proyecto_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["registro_id"], ["registro.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["proyecto_id"], ["proyecto.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("registro_id", "proyecto_id"),
+    )
+    op.create_index(
+        "ix_registro_proyecto_match_proyecto",
+        "registro_proyecto_match",
+        ["proyecto_id", "registro_id"],
+    )
+    # Los filtros por proyecto leen esta tabla desde este despliegue: se
+    # llena aquí. `flask registros-proyectos-recalcular` queda para
+    # recalcular con el motor de la aplicación.
+    _backfill_matches()
+
+
+def downgrade():
+    op.drop_index("ix_registro_proyecto_match_proyecto", table_name="registro_proyecto_match")
+    op.drop_table("registro_proyecto_match")
@@ -0,0 +1,95 @@
+"""add normalized estado/resultado columns to oportunidades
+
+Revision ID: f3c5a7e9b1d2
+Revises: e7b1d3f5a9c4
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c5a7e9b1d2'
+down_revision = 'e7b1d3f5a9c4'
+branch_labels = None
+depends_on = None
+
+# models.EXCLUDE_NORM_SET al momento de esta migración
+_ESTADOS_EXCLUIDOS = (
+    "OTP", "OTE", "OTL", "OT", "PROSPECCION", "REGISTRO",
+    "PENDIENTE APROBACION SAP", "EJECUCION CONTRACTUAL", "N/A",
+)
+
+
+def _sql_norm(col):
+    """Misma normalización SQL que usaban los filtros antes de persistir *_norm."""
+    c = sa.func.upper(sa.func.trim(sa.func.replace(col, "\u00A0", " ")))
+    for a, b in [("Á", "A"), ("É", "E"), ("Í", "I"), ("Ó", "O"), ("Ú", "U"), ("Ü", "U"), ("Ñ", "N")]:
+        c = sa.func.replace(c, a, b)
+    c = sa.func.replace(c, "0TP", "OTP")
+    c = sa.func.replace(c, "0TE", "OTE")
+    c = sa.func.replace(c, "0TL", "OTL")
+    c = sa.func.replace(c, "  ", " ")
+    c = sa.func.replace(c, "  ", " ")
+    return c
+
+
+def _backfill_norm():
+    """Llena las columnas nuevas para que filtros y exclusión funcionen desde el despliegue."""
+    t = sa.table(
+        "oportunidades",
+        sa.column("estado_oferta", sa.String),
+        sa.column("resultado_oferta", sa.String),
+        sa.column("estado_oferta_norm", sa.String),
+        sa.column("resultado_oferta_norm", sa.String),
+        sa.column("estado_excluido", sa.Boolean),
+    )
+    estado = _sql_norm(t.c.estado_oferta)
+    resultado = _sql_norm(t.c.resultado_oferta)
+
+    excluido = sa.or_(
+        t.c.estado_oferta.is_(None),
+        estado.in_(_ESTADOS_EXCLUIDOS),
+        *[estado.like(f"%{x}%") for x in _ESTADOS_EXCLUIDOS],
+    )
+
+    op.execute(
+        t.update().values(
+            estado_oferta_norm=sa.func.nullif(sa.func.left(estado, 100), ""),
+            resultado_oferta_norm=sa.func.nullif(sa.func.left(resultado, 100), ""),
+            estado_excluido=sa.case((excluido, True), else_=False),
+        )
+    )
+
+
+def upgrade():
+    op.add_column("oportunidades", sa.Column("estado_oferta_norm", sa.String(length=100), nullable=True))
+    op.add_column("oportunidades", sa.Column("resultado_oferta_norm", sa.String(length=100), nullable=True))
+    op.add_column(
+        "oportunidades",
+        sa.Column("estado_excluido", sa.Boolean(), nullable=False, server_default=sa.text("0")),
+    )
+
+    # `flask oportunidades-backfill-norm` sigue disponible para recalcular
+    # con la normalización Python de los eventos del modelo.
+    _backfill_norm()
+
+    op.create_index(
+        "ix_oportunidades_excluido_estado",
+        "oportunidades",
+        ["estado_excluido", "estado_oferta_norm"],
+    )
+    op.create_index(
+        "ix_oportunidades_resultado_norm",
+        "oportunidades",
+        ["resultado_oferta_norm"],
+    )
+
+
+def downgrade():
+    op.drop_index("ix_oportunidades_resultado_norm", table_name="oportunidades")
+    op.drop_index("ix_oportunidades_excluido_estado", table_name="oportunidades")
+    op.drop_column("oportunidades", "estado_excluido")
+    op.drop_column("oportunidades", "resultado_oferta_norm")
+    op.drop_column("oportunidades", "estado_oferta_norm")
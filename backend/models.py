@@ -1,7 +1,9 @@
-from datetime import datetime
+from datetime import datetime, date
+import re
+import unicodedata
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, text, UniqueConstraint
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, text, UniqueConstraint, event, func, select, inspect
+from sqlalchemy.orm import relationship, backref, validates
 from sqlalchemy.ext.hybrid import hybrid_property
 from decimal import Decimal
 from sqlalchemy.dialects.mysql import BIGINT
@@ -103,6 +105,7 @@ class Consultor(db.Model):
     registros = relationship(
         'Registro',
         back_populates='consultor',
+        foreign_keys='Registro.usuario_consultor',
         lazy=True
     )
 
@@ -119,12 +122,44 @@ class Consultor(db.Model):
         lazy="select"
     )
 
+REGISTRO_FECHA_FORMATOS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y")
+
+
+def parse_fecha_registro(value):
+    """
+    Convierte Registro.fecha (texto) a date con las mismas reglas que el
+    COALESCE(STR_TO_DATE(...)) histórico: YYYY-MM-DD, DD/MM/YYYY, DD-MM-YYYY.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+
+    s = str(value).strip()[:10]
+    for fmt in REGISTRO_FECHA_FORMATOS:
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
 class Registro(db.Model):
     __tablename__ = 'registro'
+    __table_args__ = (
+        db.Index("ix_registro_fecha_date_usuario", "fecha_date", "usuario_consultor"),
+        db.Index("ix_registro_fecha_date_cliente", "fecha_date", "cliente"),
+        db.Index("ix_registro_consultor_id_fecha_date", "consultor_id", "fecha_date"),
+        db.Index("ix_registro_fecha_date_id", "fecha_date", "id"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
 
     fecha = db.Column(db.String(20), nullable=False)
+    # Copia nativa de `fecha` (se sincroniza en @validates) para rangos indexables
+    fecha_date = db.Column(db.Date, nullable=True)
     cliente = db.Column(db.String(100), nullable=False)
 
     nro_caso_cliente = db.Column(db.String(50))
@@ -149,6 +184,10 @@ class Registro(db.Model):
 
     tiempo_facturable = db.Column(db.Float)
     horas_adicionales = db.Column(db.String(10))
+    # Clasificación calculada al escribir (Sí / No / N/D) según horario y equipo;
+    # NULL = fila aún sin backfill, se calcula al vuelo.
+    horas_adicionales_calc = db.Column(db.String(10), nullable=True)
+    es_hora_adicional = db.Column(db.Boolean, nullable=True)
     descripcion = db.Column(db.Text)
 
     total_horas = db.Column(db.Float)
@@ -179,10 +218,104 @@ class Registro(db.Model):
         db.ForeignKey('consultor.usuario')
     )
 
+    # Clave resuelta (LOWER(TRIM(usuario)) o nombre) -> Consultor.id.
+    # Se llena en before_insert/before_update; los JOIN usan igualdad sobre ella.
+    consultor_id = db.Column(
+        db.Integer,
+        db.ForeignKey("consultor.id", ondelete="SET NULL"),
+        nullable=True
+    )
+
     consultor = relationship(
         'Consultor',
         back_populates='registros',
-        primaryjoin="Registro.usuario_consultor == Consultor.usuario"
+        primaryjoin="Registro.usuario_consultor == Consultor.usuario",
+        foreign_keys=[usuario_consultor]
+    )
+
+    @validates("fecha")
+    def _sync_fecha_date(self, _key, value):
+        self.fecha_date = parse_fecha_registro(value)
+        return value
+
+
+def resolver_consultor_id(connection, usuario_consultor):
+    """Consultor.id para un usuario_consultor: primero por usuario, luego por nombre."""
+    key = str(usuario_consultor or "").strip().lower()
+    if not key:
+        return None
+
+    for col in (Consultor.usuario, Consultor.nombre):
+        cid = connection.execute(
+            select(Consultor.id).where(func.lower(func.trim(col)) == key).limit(1)
+        ).scalar()
+        if cid:
+            return int(cid)
+    return None
+
+
+@event.listens_for(Registro, "before_insert")
+def _registro_consultor_id_insert(_mapper, connection, target):
+    if target.consultor_id is None:
+        target.consultor_id = resolver_consultor_id(connection, target.usuario_consultor)
+
+
+@event.listens_for(Registro, "before_update")
+def _registro_consultor_id_update(_mapper, connection, target):
+    if inspect(target).attrs.usuario_consultor.history.has_changes():
+        target.consultor_id = resolver_consultor_id(connection, target.usuario_consultor)
+
+
+class RegistroResumenDiario(db.Model):
+    """
+    Rollup diario de Registro por (fecha, consultor, equipo, cliente, ocupación,
+    tarea, proyecto). Se mantiene en la misma transacción que los cambios a
+    Registro (ver backend/rollups.py). `clave` identifica la combinación,
+    NULLs incluidos, para poder usar un índice único.
+    """
+    __tablename__ = "registro_resumen_diario"
+    __table_args__ = (
+        db.Index("ix_registro_resumen_fecha_consultor", "fecha_date", "consultor_id"),
+        db.Index("ix_registro_resumen_consultor_fecha", "consultor_id", "fecha_date"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    clave = db.Column(db.String(32), nullable=False, unique=True)
+
+    fecha_date = db.Column(db.Date, nullable=True)
+    consultor_id = db.Column(db.Integer, nullable=True)
+    usuario_consultor = db.Column(db.String(100), nullable=True)
+    equipo = db.Column(db.String(50), nullable=True)
+    cliente = db.Column(db.String(100), nullable=True)
+    ocupacion_id = db.Column(db.Integer, nullable=True)
+    tarea_id = db.Column(db.Integer, nullable=True)
+    proyecto_id = db.Column(db.Integer, nullable=True)
+
+    registros = db.Column(db.Integer, nullable=False, default=0)
+    # SUM(COALESCE(total_horas, 0)) y SUM(COALESCE(total_horas, tiempo_invertido, 0))
+    total_horas = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    horas = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+
+
+class RegistroProyectoMatch(db.Model):
+    """
+    Resolución materializada registro -> proyecto (proyecto_id directo, código
+    del proyecto y ProyectoMapeo activos). La mantiene backend/proyecto_matches.py.
+    """
+    __tablename__ = "registro_proyecto_match"
+    __table_args__ = (
+        db.Index("ix_registro_proyecto_match_proyecto", "proyecto_id", "registro_id"),
+    )
+
+    registro_id = db.Column(
+        db.Integer,
+        db.ForeignKey("registro.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    proyecto_id = db.Column(
+        db.Integer,
+        db.ForeignKey("proyecto.id", ondelete="CASCADE"),
+        primary_key=True
     )
 
 
@@ -230,6 +363,50 @@ class Login(db.Model):
 
     consultor = relationship('Consultor', backref=backref('logins', lazy=True))
 
+# Estados de oferta que no se muestran en oportunidades (coincidencia exacta
+# o contenida, sobre el valor normalizado).
+EXCLUDE_LIST = [
+    "OTP",
+    "OTE",
+    "OTL",
+    "PROSPECCION",
+    "REGISTRO",
+    "PENDIENTE APROBACION SAP",
+    "0TP",
+    "0TE",
+    "0TL",
+    "OT",
+    "EJECUCION CONTRACTUAL",
+    "N/A",
+]
+
+
+def norm_key_for_match(v):
+    """Mayúsculas, sin tildes, espacios colapsados y 0TP/0TE/0TL -> OTP/OTE/OTL."""
+    s = str(v or "").replace("\u00A0", " ").strip().upper()
+    s = unicodedata.normalize("NFD", s)
+    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    s = re.sub(r"\s+", " ", s)
+    s = re.sub(r"\b0TP\b", "OTP", s)
+    s = re.sub(r"\b0TE\b", "OTE", s)
+    s = re.sub(r"\b0TL\b", "OTL", s)
+    return s
+
+
+EXCLUDE_NORM_SET = {norm_key_for_match(x) for x in EXCLUDE_LIST if x}
+
+
+def estado_oferta_excluido(estado_oferta):
+    """
+    Misma regla que el filtro SQL histórico: igual a, o contiene, algún estado
+    excluido. NULL también quedaba fuera (NOT IN/NOT LIKE sobre NULL).
+    """
+    if estado_oferta is None:
+        return True
+    norm = norm_key_for_match(estado_oferta)
+    return norm in EXCLUDE_NORM_SET or any(x in norm for x in EXCLUDE_NORM_SET)
+
+
 class Oportunidad(db.Model):
     __tablename__ = 'oportunidades'
 
@@ -311,6 +488,12 @@ class Oportunidad(db.Model):
     consecutivo_sub = db.Column(db.Integer, nullable=True)
     cliente_grupo_key = db.Column(db.String(255), nullable=True)
 
+    # Copias normalizadas (norm_key_for_match) para filtrar por igualdad/IN;
+    # se recalculan en before_insert/before_update.
+    estado_oferta_norm = db.Column(db.String(100), nullable=True)
+    resultado_oferta_norm = db.Column(db.String(100), nullable=True)
+    estado_excluido = db.Column(db.Boolean, nullable=False, default=True)
+
     suboportunidades = relationship(
         "Oportunidad",
         backref=backref("oportunidad_principal", remote_side=[id]),
@@ -321,6 +504,8 @@ class Oportunidad(db.Model):
     __table_args__ = (
         db.Index("ix_oportunidades_padre", "oportunidad_padre_id"),
         db.Index("ix_oportunidades_cliente_tipo", "cliente_grupo_key", "tipo_oportunidad"),
+        db.Index("ix_oportunidades_excluido_estado", "estado_excluido", "estado_oferta_norm"),
+        db.Index("ix_oportunidades_resultado_norm", "resultado_oferta_norm"),
     )
     
     def to_dict(self):
@@ -395,6 +580,31 @@ class Oportunidad(db.Model):
             "cliente_grupo_key": self.cliente_grupo_key,
         }
 
+
+def _sync_estado_oferta_norm(target):
+    target.estado_oferta_norm = norm_key_for_match(target.estado_oferta)[:100] or None
+    target.estado_excluido = estado_oferta_excluido(target.estado_oferta)
+
+
+def _sync_resultado_oferta_norm(target):
+    target.resultado_oferta_norm = norm_key_for_match(target.resultado_oferta)[:100] or None
+
+
+@event.listens_for(Oportunidad, "before_insert")
+def _oportunidad_norm_insert(_mapper, _connection, target):
+    _sync_estado_oferta_norm(target)
+    _sync_resultado_oferta_norm(target)
+
+
+@event.listens_for(Oportunidad, "before_update")
+def _oportunidad_norm_update(_mapper, _connection, target):
+    attrs = inspect(target).attrs
+    if attrs.estado_oferta.history.has_changes():
+        _sync_estado_oferta_norm(target)
+    if attrs.resultado_oferta.history.has_changes():
+        _sync_resultado_oferta_norm(target)
+
+
 class Cliente(db.Model):
     __tablename__ = 'clientes'
 
@@ -585,6 +795,34 @@ class ConsultorPresupuesto(db.Model):
         db.UniqueConstraint("consultor_id", "anio", "mes", name="uq_consultor_presupuesto_periodo"),
     )
 
+
+class CalendarioLaboral(db.Model):
+    """
+    Dimensión de calendario generada con `flask calendario-generar`.
+    Los acumulados van desde el primer día de la tabla e incluyen el día,
+    así cualquier rango [a, b] se resuelve como acum(b) - acum(a - 1).
+    """
+    __tablename__ = "calendario_laboral"
+
+    fecha = db.Column(db.Date, primary_key=True)
+    es_laborable = db.Column(db.Boolean, nullable=False, default=False)
+    es_festivo = db.Column(db.Boolean, nullable=False, default=False)
+    es_no_laborable_empresa = db.Column(db.Boolean, nullable=False, default=False)
+    meta_horas = db.Column(db.Numeric(5, 2), nullable=False, default=0)
+
+    meta_horas_acum = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    dias_laborables_acum = db.Column(db.Integer, nullable=False, default=0)
+    dias_festivos_acum = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DiaNoLaborableEmpresa(db.Model):
+    """Días no laborables propios de la empresa, además de los festivos CO."""
+    __tablename__ = "dia_no_laborable_empresa"
+
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False, unique=True)
+    descripcion = db.Column(db.String(200))
+
 ##Proyectos
 class ProyectoFase(db.Model):
     __tablename__ = "proyecto_fase"
@@ -1625,3 +1863,11 @@ class CoeSapControlBolsaClienteDetalle(db.Model):
     __table_args__ = (
         UniqueConstraint("control_id", "mes_numero", name="uq_coe_bolsa_detalle_mes"),
     )
+
+
+class DataVersion(db.Model):
+    """Contador de versión por dominio de datos, compartido por todos los workers (ver backend.cache)."""
+    __tablename__ = "data_version"
+
+    nombre = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, server_default=text("0"))
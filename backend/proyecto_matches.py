@@ -0,0 +1,247 @@
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import delete, event, func, insert, inspect, or_, select, true
+from sqlalchemy.orm import Session, object_session
+
+from backend.cache import version_compartida, version_on_write
+from backend.matching import AhoCorasick
+from backend.models import Proyecto, ProyectoMapeo, Registro, RegistroProyectoMatch
+
+
+# Versión compartida (tabla data_version): un cambio de reglas en un worker
+# invalida el motor de todos antes de que escriban más matches.
+version_on_write("proyecto_mapeos", Proyecto, ProyectoMapeo, compartida=True)
+
+_PENDIENTES_KEY = "_proyecto_matches_pendientes"
+_CAMPOS_REGISTRO = ("proyecto_id", "proyecto", "nro_caso_cliente", "descripcion")
+
+
+class MotorProyectos:
+    """
+    Reglas de Proyecto.codigo + ProyectoMapeo compiladas una vez:
+    EXACT -> dict, CONTAINS (y el código del proyecto) -> Aho-Corasick,
+    REGEX -> patrones precompilados. Se compara contra UPPER(nro_caso_cliente)
+    y UPPER(descripcion), igual que el filtro SQL anterior.
+    """
+
+    def __init__(self, proyectos, mapeos):
+        exactos = defaultdict(set)
+        contiene = defaultdict(set)
+        self.regex = []
+
+        for pid, codigo in proyectos:
+            codigo = (codigo or "").strip().upper()
+            if codigo:
+                contiene[codigo].add(pid)
+
+        for pid, valor, tipo in mapeos:
+            valor = (valor or "").strip().upper()
+            tipo = (tipo or "EXACT").strip().upper()
+            if not valor:
+                continue
+            if tipo == "EXACT":
+                exactos[valor].add(pid)
+            elif tipo == "CONTAINS":
+                contiene[valor].add(pid)
+            elif tipo == "REGEX":
+                try:
+                    self.regex.append((re.compile(valor, re.IGNORECASE), pid))
+                except re.error:
+                    continue
+
+        self.exactos = dict(exactos)
+        self.automata = AhoCorasick(contiene) if contiene else None
+        self.literales = set(exactos) | set(contiene)
+
+    def proyectos_de(self, proyecto_id, nro_caso_cliente, descripcion):
+        encontrados = {int(proyecto_id)} if proyecto_id else set()
+        for texto in (nro_caso_cliente, descripcion):
+            texto = (texto or "").upper()
+            encontrados |= self.exactos.get(texto.strip(), set())
+            if self.automata is not None:
+                encontrados |= self.automata.buscar(texto)
+            for patron, pid in self.regex:
+                if pid not in encontrados and patron.search(texto):
+                    encontrados.add(pid)
+        return encontrados
+
+
+_MOTOR = {"version": None, "motor": None}
+_MOTOR_LOCK = threading.Lock()
+
+
+def _compilar_motor(connection, proyecto_ids=None):
+    qp = select(Proyecto.id, Proyecto.codigo)
+    qm = select(ProyectoMapeo.proyecto_id, ProyectoMapeo.valor_origen, ProyectoMapeo.tipo_match).where(
+        ProyectoMapeo.activo == true()
+    )
+    if proyecto_ids is not None:
+        qp = qp.where(Proyecto.id.in_(proyecto_ids))
+        qm = qm.where(ProyectoMapeo.proyecto_id.in_(proyecto_ids))
+    return MotorProyectos(connection.execute(qp).all(), connection.execute(qm).all())
+
+
+def motor_proyectos(connection):
+    """Motor con todas las reglas, recompilado solo cuando cambian proyectos/mapeos (en cualquier worker)."""
+    version = version_compartida(connection, "proyecto_mapeos")
+    with _MOTOR_LOCK:
+        if _MOTOR["version"] == version:
+            return _MOTOR["motor"]
+    motor = _compilar_motor(connection)
+    with _MOTOR_LOCK:
+        _MOTOR.update(version=version, motor=motor)
+    return motor
+
+
+# ------------------------------------------------------------
+# Mantenimiento incremental por Registro
+# ------------------------------------------------------------
+def _escribir_matches(connection, registro_id, proyectos):
+    tabla = RegistroProyectoMatch.__table__
+    if proyectos:
+        connection.execute(
+            insert(tabla),
+            [{"registro_id": registro_id, "proyecto_id": pid} for pid in sorted(proyectos)],
+        )
+
+
+@event.listens_for(Registro, "after_insert")
+def _matches_insert(_mapper, connection, target):
+    motor = motor_proyectos(connection)
+    _escribir_matches(
+        connection,
+        target.id,
+        motor.proyectos_de(target.proyecto_id, target.nro_caso_cliente, target.descripcion),
+    )
+
+
+@event.listens_for(Registro, "after_update")
+def _matches_update(_mapper, connection, target):
+    estado = inspect(target)
+    if not any(estado.attrs[c].history.has_changes() for c in _CAMPOS_REGISTRO):
+        return
+
+    fila = connection.execute(
+        select(Registro.proyecto_id, Registro.nro_caso_cliente, Registro.descripcion)
+        .where(Registro.id == target.id)
+    ).first()
+    tabla = RegistroProyectoMatch.__table__
+    connection.execute(delete(tabla).where(tabla.c.registro_id == target.id))
+    if fila is not None:
+        _escribir_matches(connection, target.id, motor_proyectos(connection).proyectos_de(*fila))
+
+
+@event.listens_for(Registro, "before_delete")
+def _matches_delete(_mapper, connection, target):
+    tabla = RegistroProyectoMatch.__table__
+    connection.execute(delete(tabla).where(tabla.c.registro_id == target.id))
+
+
+# ------------------------------------------------------------
+# Recalculo completo cuando cambian proyectos o mapeos
+# ------------------------------------------------------------
+def _filtro_candidatos(motor, proyecto_ids):
+    """
+    Registros que las reglas de `proyecto_ids` pueden asociar: proyecto_id
+    explícito o algún literal (código, EXACT, CONTAINS) como subcadena.
+    El LIKE es un superconjunto; el motor decide. None si hay REGEX, que
+    no se puede acotar en SQL.
+    """
+    if motor.regex:
+        return None
+
+    condiciones = [Registro.proyecto_id.in_(proyecto_ids)]
+    for valor in sorted(motor.literales):
+        for campo in (Registro.nro_caso_cliente, Registro.descripcion):
+            condiciones.append(func.upper(func.coalesce(campo, "")).contains(valor, autoescape=True))
+    return or_(*condiciones)
+
+
+def recalcular_matches(session, proyecto_ids=None, batch_size=5000):
+    """
+    Recalcula registro_proyecto_match para `proyecto_ids` (None = todos)
+    recorriendo registro por lotes de id; con `proyecto_ids` solo se leen los
+    registros que sus reglas pueden asociar. No hace commit.
+    """
+    tabla = RegistroProyectoMatch.__table__
+    connection = session.connection()
+    if proyecto_ids is not None:
+        proyecto_ids = sorted({int(p) for p in proyecto_ids})
+        if not proyecto_ids:
+            return 0
+    motor = _compilar_motor(connection, proyecto_ids)
+
+    borrar = delete(tabla)
+    if proyecto_ids is not None:
+        borrar = borrar.where(tabla.c.proyecto_id.in_(proyecto_ids))
+    session.execute(borrar)
+
+    objetivo = set(proyecto_ids) if proyecto_ids is not None else None
+    candidatos = _filtro_candidatos(motor, proyecto_ids) if proyecto_ids is not None else None
+    total = 0
+    last_id = 0
+    while True:
+        q = (
+            select(Registro.id, Registro.proyecto_id, Registro.nro_caso_cliente, Registro.descripcion)
+            .where(Registro.id > last_id)
+        )
+        if candidatos is not None:
+            q = q.where(candidatos)
+        rows = session.execute(q.order_by(Registro.id.asc()).limit(batch_size)).all()
+        if not rows:
+            break
+
+        nuevos = []
+        for rid, pid, nro, desc in rows:
+            proyectos = motor.proyectos_de(pid, nro, desc)
+            if objetivo is not None:
+                proyectos &= objetivo
+            nuevos.extend({"registro_id": rid, "proyecto_id": p} for p in proyectos)
+        if nuevos:
+            session.execute(insert(tabla), nuevos)
+            total += len(nuevos)
+
+        last_id = rows[-1].id
+    return total
+
+
+def _marcar_proyecto(_mapper, _connection, target):
+    pid = target.proyecto_id if isinstance(target, ProyectoMapeo) else target.id
+    if pid:
+        object_session(target).info.setdefault(_PENDIENTES_KEY, set()).add(int(pid))
+
+
+def _marcar_proyecto_codigo(mapper, connection, target):
+    if inspect(target).attrs.codigo.history.has_changes():
+        _marcar_proyecto(mapper, connection, target)
+
+
+def _borrar_matches_proyecto(_mapper, connection, target):
+    tabla = RegistroProyectoMatch.__table__
+    connection.execute(delete(tabla).where(tabla.c.proyecto_id == target.id))
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    event.listen(ProyectoMapeo, _evt, _marcar_proyecto)
+event.listen(Proyecto, "after_insert", _marcar_proyecto)
+event.listen(Proyecto, "after_update", _marcar_proyecto_codigo)
+event.listen(Proyecto, "before_delete", _borrar_matches_proyecto)
+
+
+@event.listens_for(Session, "before_commit")
+def _recalcular_pendientes(session):
+    session.flush()
+    pendientes = session.info.pop(_PENDIENTES_KEY, None)
+    if not pendientes:
+        return
+    existentes = {
+        pid for (pid,) in session.execute(select(Proyecto.id).where(Proyecto.id.in_(pendientes)))
+    }
+    recalcular_matches(session, existentes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendientes(session):
+    session.info.pop(_PENDIENTES_KEY, None)
@@ -0,0 +1,228 @@
+import hashlib
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import object_session
+
+from backend.models import Registro, RegistroResumenDiario
+
+
+# Dimensiones del rollup, en el orden con el que se arma la clave.
+DIMENSIONES = (
+    "fecha_date",
+    "consultor_id",
+    "usuario_consultor",
+    "equipo",
+    "cliente",
+    "ocupacion_id",
+    "tarea_id",
+    "proyecto_id",
+)
+
+_COLUMNAS_REGISTRO = (
+    Registro.id,
+    Registro.fecha_date,
+    Registro.consultor_id,
+    Registro.usuario_consultor,
+    Registro.equipo,
+    Registro.cliente,
+    Registro.ocupacion_id,
+    Registro.tarea_id,
+    Registro.proyecto_id,
+    Registro.total_horas,
+    Registro.tiempo_invertido,
+)
+
+_STATE_KEY = "_resumen_diario_previo"
+
+
+def _texto(valor):
+    s = str(valor).strip() if valor is not None else ""
+    return s or None
+
+
+def dimensiones_de(fila):
+    """Tupla normalizada de dimensiones de un Registro (objeto ORM o fila)."""
+    usuario = _texto(fila.usuario_consultor)
+    return (
+        fila.fecha_date,
+        int(fila.consultor_id) if fila.consultor_id is not None else None,
+        usuario.lower() if usuario else None,
+        _texto(fila.equipo),
+        _texto(fila.cliente),
+        fila.ocupacion_id,
+        fila.tarea_id,
+        fila.proyecto_id,
+    )
+
+
+def medidas_de(fila):
+    """(registros, total_horas, horas) que aporta un Registro."""
+    total = float(fila.total_horas) if fila.total_horas is not None else None
+    invertido = float(fila.tiempo_invertido) if fila.tiempo_invertido is not None else None
+    horas = total if total is not None else (invertido or 0.0)
+    return (1, total or 0.0, horas)
+
+
+def clave_de(dims):
+    """md5 de las dimensiones; NULL se marca distinto de cadena vacía."""
+    partes = []
+    for v in dims:
+        if v is None:
+            partes.append("\x00")
+        elif hasattr(v, "isoformat"):
+            partes.append(v.isoformat())
+        else:
+            partes.append(str(v))
+    return hashlib.md5("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+
+def _aplicar(connection, dims, registros, total_horas, horas):
+    tabla = RegistroResumenDiario.__table__
+    clave = clave_de(dims)
+    total_horas = round(total_horas, 4)
+    horas = round(horas, 4)
+
+    valores = dict(zip(DIMENSIONES, dims))
+    valores.update(clave=clave, registros=registros, total_horas=total_horas, horas=horas)
+
+    if connection.dialect.name == "mysql":
+        stmt = mysql_insert(tabla).values(**valores)
+        stmt = stmt.on_duplicate_key_update(
+            registros=tabla.c.registros + stmt.inserted.registros,
+            total_horas=tabla.c.total_horas + stmt.inserted.total_horas,
+            horas=tabla.c.horas + stmt.inserted.horas,
+        )
+        connection.execute(stmt)
+    else:
+        res = connection.execute(
+            update(tabla)
+            .where(tabla.c.clave == clave)
+            .values(
+                registros=tabla.c.registros + registros,
+                total_horas=tabla.c.total_horas + total_horas,
+                horas=tabla.c.horas + horas,
+            )
+        )
+        if not res.rowcount:
+            connection.execute(insert(tabla).values(**valores))
+
+    if registros < 0:
+        connection.execute(
+            delete(tabla).where(tabla.c.clave == clave, tabla.c.registros <= 0)
+        )
+
+
+def _fila_actual(connection, registro_id):
+    return connection.execute(
+        select(*_COLUMNAS_REGISTRO).where(Registro.id == registro_id)
+    ).first()
+
+
+@event.listens_for(Registro, "after_insert")
+def _resumen_insert(_mapper, connection, target):
+    _aplicar(connection, dimensiones_de(target), *medidas_de(target))
+
+
+@event.listens_for(Registro, "before_update")
+def _resumen_antes_update(_mapper, connection, target):
+    # Se lee la fila desde la BD: el historial ORM no trae el valor previo
+    # de atributos que estaban expirados al momento de asignarlos.
+    fila = _fila_actual(connection, target.id)
+    object_session(target).info.setdefault(_STATE_KEY, {})[target.id] = fila
+
+
+@event.listens_for(Registro, "after_update")
+def _resumen_update(_mapper, connection, target):
+    previas = object_session(target).info.get(_STATE_KEY) or {}
+    antes = previas.pop(target.id, None)
+    despues = _fila_actual(connection, target.id)
+    if despues is None:
+        return
+
+    dims_nuevas, med_nuevas = dimensiones_de(despues), medidas_de(despues)
+    if antes is not None:
+        dims_previas, med_previas = dimensiones_de(antes), medidas_de(antes)
+        if dims_previas == dims_nuevas and med_previas == med_nuevas:
+            return
+        _aplicar(connection, dims_previas, *(-m for m in med_previas))
+    _aplicar(connection, dims_nuevas, *med_nuevas)
+
+
+@event.listens_for(Registro, "before_delete")
+def _resumen_delete(_mapper, connection, target):
+    fila = _fila_actual(connection, target.id)
+    if fila is not None:
+        _aplicar(connection, dimensiones_de(fila), *(-m for m in medidas_de(fila)))
+
+
+def recalcular_resumen(session, batch_size=5000):
+    """Recalcula el rollup completo desde registro (keyset por id) -> {clave: fila}."""
+    acumulado = {}
+    last_id = 0
+    while True:
+        rows = (
+            session.query(*_COLUMNAS_REGISTRO)
+            .filter(Registro.id > last_id)
+            .order_by(Registro.id.asc())
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+
+        for r in rows:
+            dims = dimensiones_de(r)
+            clave = clave_de(dims)
+            item = acumulado.get(clave)
+            if item is None:
+                item = dict(zip(DIMENSIONES, dims))
+                item.update(clave=clave, registros=0, total_horas=0.0, horas=0.0)
+                acumulado[clave] = item
+            n, total, horas = medidas_de(r)
+            item["registros"] += n
+            item["total_horas"] += total
+            item["horas"] += horas
+
+        last_id = rows[-1].id
+
+    for item in acumulado.values():
+        item["total_horas"] = round(item["total_horas"], 4)
+        item["horas"] = round(item["horas"], 4)
+    return acumulado
+
+
+def reconstruir_resumen(session, batch_size=5000):
+    """Reemplaza el contenido de registro_resumen_diario. No hace commit."""
+    filas = list(recalcular_resumen(session, batch_size).values())
+    session.query(RegistroResumenDiario).delete(synchronize_session=False)
+    for i in range(0, len(filas), batch_size):
+        session.bulk_insert_mappings(RegistroResumenDiario, filas[i:i + batch_size])
+    return len(filas)
+
+
+def diferencias_resumen(session, batch_size=5000, tolerancia=0.01):
+    """Lista (clave, guardado, esperado) donde el rollup no cuadra con registro."""
+    esperado = recalcular_resumen(session, batch_size)
+    guardado = {
+        r.clave: r
+        for r in session.query(
+            RegistroResumenDiario.clave,
+            RegistroResumenDiario.registros,
+            RegistroResumenDiario.total_horas,
+            RegistroResumenDiario.horas,
+        )
+    }
+
+    diferencias = []
+    for clave in set(esperado) | set(guardado):
+        e, g = esperado.get(clave), guardado.get(clave)
+        e_med = (e["registros"], e["total_horas"], e["horas"]) if e else (0, 0.0, 0.0)
+        g_med = (int(g.registros), float(g.total_horas), float(g.horas)) if g else (0, 0.0, 0.0)
+        if (
+            e_med[0] != g_med[0]
+            or abs(e_med[1] - g_med[1]) > tolerancia
+            or abs(e_med[2] - g_med[2]) > tolerancia
+        ):
+            diferencias.append((clave, g_med, e_med))
+    return diferencias
@@ -1,4 +1,8 @@
-from flask import request, jsonify, Blueprint, current_app as app, g
+from flask import request, jsonify, Blueprint, current_app as app, g, Response, stream_with_context
+from backend.cache import (
+    TTLCache, bump_compartida, bump_on_commit, data_versions, version_compartida, version_on_write,
+)
+from backend.matching import AhoCorasick
 from backend.models import (
     db, Modulo, Consultor, Registro, BaseRegistro, BaseRegistroInfoCoeSapFuncional, Login,
     Rol, Equipo, Horario, Oportunidad, Cliente,
@@ -11,15 +15,21 @@ from backend.models import (
     ProyectoPerfilPlan, ProyectoCostoAdicional, ProyectoMapeo, ProyectoPerfilConsultor, CoeSapFuncionalCalificacion,
     CoeSapFuncionalCalificacionHora, CoeSapFuncionalImportacion, CoeSapFuncionalFuenteGestion, CoeSapFuncionalCatalogo, CoeSapFuncionalCategoriaCatalogo,
     CoeSapControlBolsaCliente, CoeSapControlBolsaClienteDetalle,
+    CalendarioLaboral, DiaNoLaborableEmpresa, RegistroResumenDiario, RegistroProyectoMatch,
+    parse_fecha_registro, norm_key_for_match, _sync_estado_oferta_norm, _sync_resultado_oferta_norm,
 )
+from backend import rollups  # noqa: F401  (listeners que mantienen registro_resumen_diario)
+from backend import proyecto_matches  # noqa: F401  (listeners de registro_proyecto_match)
 from datetime import datetime, timedelta, time, date
-from functools import wraps
-from sqlalchemy import or_, text, func, extract, and_, cast, Integer, literal, case
-from sqlalchemy.orm import relationship, backref, joinedload, aliased, selectinload
+from functools import wraps, lru_cache
+from sqlalchemy import or_, text, func, extract, and_, Integer, literal, case, select, inspect
+from sqlalchemy.orm import relationship, backref, joinedload, aliased, selectinload, Session as OrmSession
 import unicodedata, re
 from collections import defaultdict
+from bisect import bisect_left, bisect_right
 import pandas as pd
-from io import BytesIO
+import numpy as np
+from io import BytesIO, StringIO
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 import logging
 import traceback
@@ -31,6 +41,11 @@ import bcrypt
 import holidays
 import secrets
 import json
+import base64
+import csv
+import os
+import tempfile
+import itertools
 
 
 bp = Blueprint('routes', __name__, url_prefix="/api")
@@ -232,35 +247,137 @@ def normalizar_ocupaciones(registros):
     return registros
 
 
+_PERMISOS_CACHE = TTLCache(maxsize=4096, ttl=300)
+
+# Cualquier escritura ORM sobre estas tablas avanza la versión global "permisos",
+# también en la tabla data_version para que una revocación llegue a todos los workers.
+version_on_write("permisos", Permiso, RolPermiso, EquipoPermiso, ConsultorPermiso, compartida=True)
+
+
+def _calcular_permisos_efectivos(consultor_id, rol_id, equipo_id):
+    """Códigos efectivos (rol ∪ equipo ∪ especiales) en una sola consulta UNION."""
+    q_rol = (
+        db.session.query(Permiso.codigo)
+        .join(RolPermiso, RolPermiso.permiso_id == Permiso.id)
+        .filter(RolPermiso.rol_id == rol_id)
+    )
+    q_equipo = (
+        db.session.query(Permiso.codigo)
+        .join(EquipoPermiso, EquipoPermiso.permiso_id == Permiso.id)
+        .filter(EquipoPermiso.equipo_id == equipo_id)
+    )
+    q_consultor = (
+        db.session.query(Permiso.codigo)
+        .join(ConsultorPermiso, ConsultorPermiso.permiso_id == Permiso.id)
+        .filter(ConsultorPermiso.consultor_id == consultor_id)
+    )
+    rows = q_rol.union(q_equipo, q_consultor).all()
+    return frozenset(r[0] for r in rows if r[0])
+
+
 def obtener_permisos_finales(consultor):
-    permisos = set()
+    """
+    Conjunto materializado de permisos efectivos del consultor.
+    Se cachea por (consultor, rol, equipo) y se sella con la versión global
+    de permisos (compartida entre workers, releída cada pocos segundos): un
+    cambio en roles/equipos/permisos invalida todo. rol_id/equipo_id vienen de
+    la sesión cacheada, que a su vez se invalida con la versión "sesiones".
+    """
+    consultor_id = int(getattr(consultor, "id", 0) or 0)
+    rol_id = int(getattr(consultor, "rol_id", 0) or 0)
+    equipo_id = int(getattr(consultor, "equipo_id", 0) or 0)
 
-    # -----------------------------
-    # Permisos del Rol
-    # -----------------------------
-    if consultor.rol_obj:
-        for rp in consultor.rol_obj.permisos_asignados:
-            permisos.add(rp.permiso.codigo)
+    key = (consultor_id, rol_id, equipo_id)
+    version = version_compartida(db.session, "permisos", ttl=5)
 
-   
-    if consultor.equipo_obj:
-        for ep in consultor.equipo_obj.permisos_asignados:
-            permisos.add(ep.permiso.codigo)
+    cached = _PERMISOS_CACHE.get(key)
+    if cached is not None and cached[0] == version:
+        permisos = cached[1]
+    else:
+        permisos = _calcular_permisos_efectivos(consultor_id, rol_id, equipo_id)
+        _PERMISOS_CACHE.set(key, (version, permisos))
 
-    
-    for cp in consultor.permisos_especiales:
-        permisos.add(cp.permiso.codigo)
+    extras = getattr(consultor, "permisos", None) or []
+    if not extras:
+        return permisos
 
-    
-    
-    for p in getattr(consultor, "permisos", []) or []:
-        if hasattr(p, "codigo"):       
+    permisos = set(permisos)
+    for p in extras:
+        if hasattr(p, "codigo"):
             permisos.add(p.codigo)
-        else:                          
+        else:
             permisos.add(str(p).strip().upper())
 
     return permisos
 
+
+_CATALOGOS_CACHE = TTLCache(maxsize=1, ttl=300)
+
+# Catálogos pequeños que se leen en cada registro de horas: cualquier CRUD ORM
+# sobre ellos avanza la versión "catalogos" (también en data_version, para los
+# demás workers) y el siguiente acceso recarga.
+version_on_write(
+    "catalogos", Tarea, TareaAlias, Ocupacion, Proyecto, ProyectoFase, Equipo, Horario, Modulo,
+    compartida=True,
+)
+
+
+def _cargar_catalogos():
+    tareas = (
+        Tarea.query
+        .options(selectinload(Tarea.ocupaciones), selectinload(Tarea.aliases))
+        .order_by(Tarea.codigo)
+        .all()
+    )
+    ocupaciones = (
+        Ocupacion.query
+        .options(selectinload(Ocupacion.tareas))
+        .order_by(Ocupacion.codigo)
+        .all()
+    )
+    proyectos = db.session.query(
+        Proyecto.id, Proyecto.codigo, Proyecto.nombre, Proyecto.fase_id, Proyecto.activo,
+    ).all()
+    fases = db.session.query(ProyectoFase.id, ProyectoFase.nombre).all()
+    equipos = db.session.query(Equipo.id, Equipo.nombre).order_by(Equipo.nombre).all()
+    horarios = db.session.query(Horario.id, Horario.rango).order_by(Horario.rango).all()
+    modulos = db.session.query(Modulo.id, Modulo.nombre).order_by(Modulo.nombre.asc()).all()
+
+    return {
+        "tareas": {t.id: t.to_dict() for t in tareas},
+        "tareas_por_codigo": {t.codigo: t.id for t in tareas},
+        "ocupaciones": {o.id: o.to_dict() for o in ocupaciones},
+        "proyectos": {
+            p.id: {
+                "id": p.id,
+                "codigo": p.codigo,
+                "nombre": p.nombre,
+                "fase_id": p.fase_id,
+                "activo": bool(p.activo),
+            }
+            for p in proyectos
+        },
+        "fases": {f.id: {"id": f.id, "nombre": f.nombre} for f in fases},
+        "equipos": {e.id: e.nombre for e in equipos},
+        "horarios": {h.id: h.rango for h in horarios},
+        "modulos": {m.id: m.nombre for m in modulos},
+    }
+
+
+def catalogos():
+    """
+    Snapshot en memoria de tareas, ocupaciones, proyectos, fases, equipos,
+    horarios y módulos. Sólo lectura: los dicts se comparten entre requests.
+    """
+    version = version_compartida(db.session, "catalogos", ttl=5)
+    cached = _CATALOGOS_CACHE.get("snapshot")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    snapshot = _cargar_catalogos()
+    _CATALOGOS_CACHE.set("snapshot", (version, snapshot))
+    return snapshot
+
 def _get_perfiles_permitidos_proyecto(proyecto_id):
     modulo_ids = [
         int(x.modulo_id)
@@ -342,37 +459,113 @@ def _extract_bearer_token():
     return auth.replace("Bearer ", "", 1).strip() or None
 
 
-def _get_session_from_token():
-    token = _extract_bearer_token()
-    if not token:
-        return None
+_SESSION_CACHE = TTLCache(maxsize=2048, ttl=60)
+
+
+@bp.record_once
+def _configurar_cache_sesiones(state):
+    _SESSION_CACHE.maxsize = int(state.app.config.get("SESSION_CACHE_MAXSIZE", 2048) or 0)
+
+
+def _consultor_sesion_options():
+    return (
+        joinedload(Consultor.rol_obj)
+            .joinedload(Rol.permisos_asignados)
+            .joinedload(RolPermiso.permiso),
+        joinedload(Consultor.equipo_obj)
+            .joinedload(Equipo.permisos_asignados)
+            .joinedload(EquipoPermiso.permiso),
+        joinedload(Consultor.permisos_especiales)
+            .joinedload(ConsultorPermiso.permiso),
+        joinedload(Consultor.modulos),
+        joinedload(Consultor.horario_obj),
+    )
+
+
+def _cargar_sesion_cacheable(token):
+    """
+    Carga Login + Consultor en una sesión propia (sin expire_on_commit) para
+    que el grafo quede desacoplado y completamente cargado dentro de la caché.
+    """
+    with OrmSession(db.engine, expire_on_commit=False) as s:
+        sesion = s.query(Login).filter_by(token=token, activo=True).first()
+        if not sesion:
+            return None
+
+        consultor = (
+            s.query(Consultor)
+            .options(*_consultor_sesion_options())
+            .filter(Consultor.id == sesion.consultor_id)
+            .first()
+        )
+        if not consultor:
+            return None
+
+        return sesion, consultor
 
-    sesion = Login.query.filter_by(token=token, activo=True).first()
+
+def _invalidar_cache_sesiones(token=None, consultor_id=None):
+    """
+    token         -> invalida solo esa sesión
+    consultor_id  -> invalida todas las sesiones del consultor
+    sin argumentos -> vacía la caché (cambios de rol/equipo/permisos)
+
+    En los demás workers no se puede borrar selectivamente: se avanza la
+    versión compartida "sesiones" y descartan todas sus entradas.
+    """
+    if token:
+        _SESSION_CACHE.pop(token)
+    if consultor_id is not None:
+        cid = int(consultor_id)
+        _SESSION_CACHE.discard_where(lambda v: int(v[1].consultor_id or 0) == cid)
+    if not token and consultor_id is None:
+        _SESSION_CACHE.clear()
+
+    bump_compartida(db.engine, "sesiones")
+    g.pop("_sesion_consultor", None)
+
+
+def _get_session_from_token():
+    sesion, _consultor = _get_consultor_from_token()
     return sesion
 
 
 def _get_consultor_from_token():
-    sesion = _get_session_from_token()
-    if not sesion:
+    """
+    Resuelve (Login, Consultor) del token Bearer.
+    - Memoizado por request en flask.g (auth_required, _get_usuario_from_request
+      y _get_rol_from_request comparten la misma resolución).
+    - Entre requests usa _SESSION_CACHE (TTL), sellada con la versión
+      compartida "sesiones" (releída cada pocos segundos); el grafo cacheado
+      se reasocia a db.session con merge(load=False), sin emitir SQL.
+    """
+    token = _extract_bearer_token()
+    if not token:
         return None, None
 
-    consultor = (
-        Consultor.query.options(
-            joinedload(Consultor.rol_obj)
-                .joinedload(Rol.permisos_asignados)
-                .joinedload(RolPermiso.permiso),
-            joinedload(Consultor.equipo_obj)
-                .joinedload(Equipo.permisos_asignados)
-                .joinedload(EquipoPermiso.permiso),
-            joinedload(Consultor.permisos_especiales)
-                .joinedload(ConsultorPermiso.permiso),
-            joinedload(Consultor.modulos),
-            joinedload(Consultor.horario_obj),
-        )
-        .filter(Consultor.id == sesion.consultor_id)
-        .first()
-    )
+    memo = g.get("_sesion_consultor")
+    if memo is not None and memo[0] == token:
+        return memo[1], memo[2]
+
+    ttl = int(app.config.get("SESSION_CACHE_TTL", 60) or 0)
+
+    version = version_compartida(db.session, "sesiones", ttl=2) if ttl > 0 else None
+    cached = _SESSION_CACHE.get(token) if ttl > 0 else None
+    if cached is not None and cached[0] != version:
+        cached = None
 
+    if cached is None:
+        cargada = _cargar_sesion_cacheable(token)
+        if cargada is None:
+            return None, None
+        cached = (version,) + cargada
+        if ttl > 0:
+            _SESSION_CACHE.set(token, cached, ttl=ttl)
+
+    sesion = db.session.merge(cached[1], load=False)
+    consultor = db.session.merge(cached[2], load=False)
+
+    g._sesion_consultor = (token, sesion, consultor)
     return sesion, consultor
 
 
@@ -390,6 +583,7 @@ def auth_required(fn):
             sesion.activo = False
             sesion.fecha_logout = datetime.utcnow()
             db.session.commit()
+            _invalidar_cache_sesiones(consultor_id=consultor.id)
             return jsonify({"mensaje": "Usuario inactivo. Contacte al administrador."}), 403
 
         g.current_session = sesion
@@ -670,6 +864,7 @@ def logout():
         sesion.activo = False
         sesion.fecha_logout = datetime.utcnow()
         db.session.commit()
+        _invalidar_cache_sesiones(token=sesion.token)
 
         return jsonify({"mensaje": "Sesión cerrada correctamente"}), 200
     except Exception as e:
@@ -685,13 +880,13 @@ def listar_roles():
 
 @bp.route('/equipos', methods=['GET'])
 def listar_equipos():
-    equipos = Equipo.query.order_by(Equipo.nombre).all()
-    return jsonify([{"id": e.id, "nombre": e.nombre} for e in equipos]), 200
+    equipos = catalogos()["equipos"]
+    return jsonify([{"id": eid, "nombre": nombre} for eid, nombre in equipos.items()]), 200
 
 @bp.route('/horarios', methods=['GET'])
 def listar_horarios():
-    horarios = Horario.query.order_by(Horario.rango).all()
-    return jsonify([{"id": h.id, "rango": h.rango} for h in horarios]), 200
+    horarios = catalogos()["horarios"]
+    return jsonify([{"id": hid, "rango": rango} for hid, rango in horarios.items()]), 200
 
 # ===============================
 # LOGIN
@@ -776,6 +971,7 @@ def login():
 
     db.session.add(login_log)
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=consultor.id)
 
     permisos_list = sorted(list(obtener_permisos_finales(consultor)))
 
@@ -847,6 +1043,7 @@ def set_activo_consultor(consultor_id):
     c = Consultor.query.get_or_404(consultor_id)
     c.activo = _to_bool(data.get("activo"), default=True)
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=c.id)
     return jsonify({"mensaje": "Estado actualizado", "activo": bool(c.activo)}), 200
 
 
@@ -904,6 +1101,7 @@ def editar_consultor(id):
         _apply_catalog_fields_to_consultor(c, data)
 
         db.session.commit()
+        _invalidar_cache_sesiones(consultor_id=c.id)
         return jsonify({"mensaje": "Consultor actualizado correctamente"}), 200
 
     except SQLAlchemyError as e:
@@ -926,6 +1124,7 @@ def eliminar_consultor(id):
     try:
         db.session.delete(c)
         db.session.commit()
+        _invalidar_cache_sesiones(consultor_id=id)
         return jsonify({"mensaje": "Consultor eliminado correctamente"}), 200
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -962,13 +1161,7 @@ def registro_to_dict(r: Registro):
         'oncall': r.oncall,
         'desborde': r.desborde,
         'tiempoFacturable': r.tiempo_facturable,
-        'horasAdicionales': _calcular_horas_adicionales_por_horario(
-            r.hora_inicio,
-            r.hora_fin,
-            getattr(r, "horario_trabajo", None),
-            equipo_name,
-            r.horas_adicionales,
-        ),
+        'horasAdicionales': _horas_adicionales_de(r, equipo_name),
         'horarioTrabajo': _normalizar_horario_trabajo_por_equipo(
             getattr(r, "horario_trabajo", None),
             equipo_name,
@@ -1042,35 +1235,83 @@ def _calcular_tiempo_horas(hora_inicio, hora_fin):
     return round(mins / 60.0, 2)
 
 
-def _buscar_registro_traslapado(fecha, usuario_consultor, hora_inicio, hora_fin, exclude_id=None):
-    nuevo_ini = _parse_hhmm_to_minutes(hora_inicio)
-    nuevo_fin = _parse_hhmm_to_minutes(hora_fin)
-
-    if nuevo_ini is None or nuevo_fin is None or nuevo_fin <= nuevo_ini:
-        return None
+def _indice_intervalos_consultor(consultor_id, usuario_consultor, fechas, exclude_id=None):
+    """
+    Índice de traslapes: un solo SELECT con todos los intervalos del consultor
+    en el rango [min(fechas), max(fechas)], agrupados por día y ordenados por
+    inicio. Cada día guarda el máximo acumulado de fin para responder en O(log n).
+    """
+    dias = sorted({d for d in (parse_fecha_registro(f) for f in fechas) if d})
+    if not dias:
+        return {}
 
-    q = Registro.query.filter(
-        Registro.fecha == fecha,
-        func.lower(Registro.usuario_consultor) == func.lower(str(usuario_consultor).strip())
+    q = db.session.query(
+        Registro.id, Registro.fecha_date, Registro.hora_inicio, Registro.hora_fin
+    ).filter(
+        Registro.fecha_date >= dias[0],
+        Registro.fecha_date <= dias[-1],
     )
 
+    if consultor_id:
+        q = q.filter(Registro.consultor_id == int(consultor_id))
+    else:
+        q = q.filter(Registro.usuario_consultor == str(usuario_consultor or "").strip())
+
     if exclude_id:
         q = q.filter(Registro.id != int(exclude_id))
 
-    existentes = q.all()
+    por_dia = defaultdict(list)
+    for rid, fecha_d, h_ini, h_fin in q.all():
+        ini = _parse_hhmm_to_minutes(h_ini)
+        fin = _parse_hhmm_to_minutes(h_fin)
+        if ini is None or fin is None or fin <= ini:
+            continue
+        por_dia[fecha_d].append((ini, fin, {"id": rid, "hora_inicio": h_ini, "hora_fin": h_fin}))
+
+    indice = {}
+    for dia, intervalos in por_dia.items():
+        intervalos.sort(key=lambda x: x[0])
+        inicios, max_fin = [], []
+        mejor = None
+        for iv in intervalos:
+            if mejor is None or iv[1] > mejor[1]:
+                mejor = iv
+            inicios.append(iv[0])
+            max_fin.append(mejor)
+        indice[dia] = (inicios, max_fin)
 
-    for r in existentes:
-        old_ini = _parse_hhmm_to_minutes(r.hora_inicio)
-        old_fin = _parse_hhmm_to_minutes(r.hora_fin)
+    return indice
 
-        if old_ini is None or old_fin is None or old_fin <= old_ini:
-            continue
 
-        if max(nuevo_ini, old_ini) < min(nuevo_fin, old_fin):
-            return r
+def _buscar_traslape_en_indice(indice, fecha, hora_inicio, hora_fin):
+    """Devuelve {"id", "hora_inicio", "hora_fin"} del registro que se cruza, o None."""
+    nuevo_ini = _parse_hhmm_to_minutes(hora_inicio)
+    nuevo_fin = _parse_hhmm_to_minutes(hora_fin)
+
+    if nuevo_ini is None or nuevo_fin is None or nuevo_fin <= nuevo_ini:
+        return None
+
+    dia = indice.get(parse_fecha_registro(fecha))
+    if not dia:
+        return None
+
+    inicios, max_fin = dia
+    k = bisect_left(inicios, nuevo_fin)  # intervalos que empiezan antes del nuevo fin
+    if k and max_fin[k - 1][1] > nuevo_ini:
+        return max_fin[k - 1][2]
 
     return None
 
+
+def _validar_traslapes(indice, fechas, rangos):
+    """Valida todas las combinaciones fecha x rango en una pasada: (fecha, conflicto) o None."""
+    for fecha in fechas:
+        for hora_inicio, hora_fin in rangos:
+            conflicto = _buscar_traslape_en_indice(indice, fecha, hora_inicio, hora_fin)
+            if conflicto:
+                return fecha, conflicto
+    return None
+
 def _minutes_to_hhmm(value: int) -> str:
     h = value // 60
     m = value % 60
@@ -1185,6 +1426,35 @@ def _calcular_horas_adicionales_por_horario(hora_inicio, hora_fin, horario_traba
 
     return fallback or "N/D"
 
+
+def _persistir_horas_adicionales(registro, equipo):
+    """Guarda en el registro la clasificación que antes se recalculaba en cada lectura."""
+    valor = _calcular_horas_adicionales_por_horario(
+        registro.hora_inicio,
+        registro.hora_fin,
+        registro.horario_trabajo,
+        equipo,
+        registro.horas_adicionales,
+    )
+    registro.horas_adicionales_calc = valor
+    registro.es_hora_adicional = str(valor or "").strip().upper() in ("SÍ", "SI")
+    return valor
+
+
+def _horas_adicionales_de(r, equipo=None):
+    """Valor persistido; las filas sin backfill se calculan al vuelo como antes."""
+    valor = getattr(r, "horas_adicionales_calc", None)
+    if valor:
+        return valor
+
+    return _calcular_horas_adicionales_por_horario(
+        r.hora_inicio,
+        r.hora_fin,
+        getattr(r, "horario_trabajo", None),
+        equipo,
+        r.horas_adicionales,
+    )
+
 def _norm_text_basic(value):
     s = str(value or "").strip().upper()
     s = unicodedata.normalize("NFD", s)
@@ -1309,45 +1579,41 @@ def registrar_hora():
 
     # ------------------------------------------------------------------
     # 3) VALIDAR TRASLAPE EN BACKEND
+    #    Una sola consulta para todo el rango de fechas; los fragmentos
+    #    (paso 7.1) se validan contra el mismo índice en memoria.
     # ------------------------------------------------------------------
-    for fecha_item in fechas_a_crear:
-        conflicto = _buscar_registro_traslapado(
-            fecha=fecha_item,
-            usuario_consultor=consultor.usuario,
-            hora_inicio=hora_inicio,
-            hora_fin=hora_fin,
-            exclude_id=None
-        )
+    indice_traslapes = _indice_intervalos_consultor(
+        consultor.id, consultor.usuario, fechas_a_crear
+    )
 
-        if conflicto:
-            return jsonify({
-                'mensaje': (
-                    f'Ya existe un registro que se cruza con este rango el día {fecha_item}: '
-                    f'{conflicto.hora_inicio} - {conflicto.hora_fin} (ID: {conflicto.id})'
-                )
-            }), 409
+    traslape = _validar_traslapes(indice_traslapes, fechas_a_crear, [(hora_inicio, hora_fin)])
+    if traslape:
+        fecha_item, conflicto = traslape
+        return jsonify({
+            'mensaje': (
+                f'Ya existe un registro que se cruza con este rango el día {fecha_item}: '
+                f'{conflicto["hora_inicio"]} - {conflicto["hora_fin"]} (ID: {conflicto["id"]})'
+            )
+        }), 409
 
     # ------------------------------------------------------------------
     # 4) DETERMINAR TAREA
     # ------------------------------------------------------------------
+    cat = catalogos()
     tarea_id = pick(data, "tarea_id")
-    tarea_obj = None
 
     if tarea_id:
         try:
             tarea_id = int(tarea_id)
-            tarea_obj = Tarea.query.get(tarea_id)
-            if not tarea_obj:
-                return jsonify({'mensaje': 'Tarea inválida'}), 400
         except Exception:
             return jsonify({'mensaje': 'Tarea inválida'}), 400
+        if tarea_id not in cat["tareas"]:
+            return jsonify({'mensaje': 'Tarea inválida'}), 400
     else:
         tipoTareaRaw = pick(data, "tipoTarea", "tipo_tarea")
         if tipoTareaRaw:
             codigo = str(tipoTareaRaw).split("-", 1)[0].strip()
-            tarea_obj = Tarea.query.filter(Tarea.codigo == codigo).first()
-            if tarea_obj:
-                tarea_id = tarea_obj.id
+            tarea_id = cat["tareas_por_codigo"].get(codigo)
 
     # ------------------------------------------------------------------
     # 5) VALORES NUMÉRICOS
@@ -1378,13 +1644,12 @@ def registrar_hora():
     # ------------------------------------------------------------------
     horario_trabajo_raw = (
         pick(data, 'horario_trabajo', 'horarioTrabajo')
-        or (Horario.query.get(consultor.horario_id).rango if consultor.horario_id else None)
+        or (cat["horarios"].get(consultor.horario_id) if consultor.horario_id else None)
     )
 
     equipo_para_horario = pick(data, 'equipo')
     if not equipo_para_horario and consultor.equipo_id:
-        eq_horario = Equipo.query.get(consultor.equipo_id)
-        equipo_para_horario = eq_horario.nombre if eq_horario else None
+        equipo_para_horario = cat["equipos"].get(consultor.equipo_id)
 
     horario_trabajo = _normalizar_horario_trabajo_por_equipo(
         horario_trabajo_raw,
@@ -1416,31 +1681,26 @@ def registrar_hora():
             return jsonify({'mensaje': 'No se pudo dividir el rango horario'}), 400
 
     # validar traslape por cada fragmento
-    for fecha_item in fechas_a_crear:
-        for frag in fragmentos:
-            conflicto = _buscar_registro_traslapado(
-                fecha=fecha_item,
-                usuario_consultor=consultor.usuario,
-                hora_inicio=frag["hora_inicio"],
-                hora_fin=frag["hora_fin"],
-                exclude_id=None
+    traslape = _validar_traslapes(
+        indice_traslapes,
+        fechas_a_crear,
+        [(frag["hora_inicio"], frag["hora_fin"]) for frag in fragmentos],
+    )
+    if traslape:
+        fecha_item, conflicto = traslape
+        return jsonify({
+            'mensaje': (
+                f'Ya existe un registro que se cruza con este rango el día {fecha_item}: '
+                f'{conflicto["hora_inicio"]} - {conflicto["hora_fin"]} (ID: {conflicto["id"]})'
             )
-
-            if conflicto:
-                return jsonify({
-                    'mensaje': (
-                        f'Ya existe un registro que se cruza con este rango el día {fecha_item}: '
-                        f'{conflicto.hora_inicio} - {conflicto.hora_fin} (ID: {conflicto.id})'
-                    )
-                }), 409
+        }), 409
 
     # ------------------------------------------------------------------
     # 8) EQUIPO
     # ------------------------------------------------------------------
     equipo_final = pick(data, 'equipo')
     if not equipo_final and consultor.equipo_id:
-        eq = Equipo.query.get(consultor.equipo_id)
-        equipo_final = eq.nombre if eq else None
+        equipo_final = cat["equipos"].get(consultor.equipo_id)
 
     if isinstance(equipo_final, str):
         equipo_final = equipo_final.strip().upper()
@@ -1468,16 +1728,14 @@ def registrar_hora():
         except Exception:
             return jsonify({'mensaje': 'Ocupación inválida'}), 400
 
-        occ = Ocupacion.query.get(ocupacion_id)
-        if not occ:
+        if ocupacion_id not in cat["ocupaciones"]:
             return jsonify({'mensaje': 'Ocupación inválida'}), 400
     else:
+        ocupacion_id = None
         if tarea_id:
-            t = Tarea.query.options(db.joinedload(Tarea.ocupaciones)).get(tarea_id)
-            if t and t.ocupaciones:
-                ocupacion_id = t.ocupaciones[0].id
-            else:
-                ocupacion_id = None
+            ocupaciones_tarea = cat["tareas"][tarea_id]["ocupaciones"]
+            if ocupaciones_tarea:
+                ocupacion_id = ocupaciones_tarea[0]
 
     # --------------------------------------------------
     # 10.1) Validación cliente restringido por ocupación
@@ -1486,8 +1744,7 @@ def registrar_hora():
     occ_codigo = ""
 
     if ocupacion_id:
-        occ_obj = Ocupacion.query.get(ocupacion_id)
-        occ_codigo = str(getattr(occ_obj, "codigo", "") or "").strip()
+        occ_codigo = str(cat["ocupaciones"][ocupacion_id]["codigo"] or "").strip()
 
         # Ocupaciones que NO pueden usar HITSS/CLARO
         if occ_codigo in {"01", "02"} and cliente_upper == "HITSS/CLARO":
@@ -1518,16 +1775,15 @@ def registrar_hora():
         return jsonify({'mensaje': 'fase_proyecto_id inválido'}), 400
 
     if proyecto_id:
-        if not Proyecto.query.get(proyecto_id):
+        if proyecto_id not in cat["proyectos"]:
             return jsonify({'mensaje': 'Proyecto no existe'}), 400
 
     if fase_proyecto_id:
-        if not ProyectoFase.query.get(fase_proyecto_id):
+        if fase_proyecto_id not in cat["fases"]:
             return jsonify({'mensaje': 'Fase de proyecto no existe'}), 400
 
     if proyecto_id and not fase_proyecto_id:
-        p = Proyecto.query.get(proyecto_id)
-        fase_proyecto_id = getattr(p, "fase_id", None) if p else None
+        fase_proyecto_id = cat["proyectos"][proyecto_id]["fase_id"]
 
     # ------------------------------------------------------------------
     # 12) CREAR UNO O VARIOS REGISTROS
@@ -1535,6 +1791,9 @@ def registrar_hora():
     try:
         nuevos = []
 
+        # Mismo equipo que usan las lecturas (equipo del consultor, luego el del registro).
+        equipo_clasificacion = cat["equipos"].get(consultor.equipo_id) or equipo_final
+
         for fecha_item in fechas_a_crear:
             for frag in fragmentos:
                 frag_hora_inicio = frag["hora_inicio"]
@@ -1574,6 +1833,7 @@ def registrar_hora():
                     usuario_consultor=consultor.usuario,
                     equipo=equipo_final,
                 )
+                _persistir_horas_adicionales(nuevo, equipo_clasificacion)
 
                 db.session.add(nuevo)
                 nuevos.append(nuevo)
@@ -1721,102 +1981,68 @@ def _safe_fecha_iso(v):
     s = str(v).strip()
     return s[:10] if s else None
 
-def _apply_project_filter_graficos(q, proyecto_id: int):
-    proyecto = (
-        Proyecto.query.options(joinedload(Proyecto.mapeos))
-        .filter(Proyecto.id == proyecto_id)
-        .first()
-    )
-
-    if not proyecto:
-        return q.filter(text("1=0"))
-
-    clauses = [Registro.proyecto_id == proyecto.id]
-
-    codigo = (proyecto.codigo or "").strip().upper()
-
-    campo_nro = func.upper(func.coalesce(Registro.nro_caso_cliente, ""))
-    campo_desc = func.upper(func.coalesce(Registro.descripcion, ""))
+def _filtro_rango_fecha_registro(q, desde=None, hasta=None, columna=None):
+    """
+    Rango sargable sobre Registro.fecha_date (índices (fecha_date, usuario) y
+    (fecha_date, cliente)), o sobre `columna` si se pasa (p.ej. el rollup
+    diario). Un valor no parseable lanza ValueError (400 en los endpoints).
+    """
+    columna = Registro.fecha_date if columna is None else columna
+    desde_d = parse_fecha_registro(desde) if desde else None
+    hasta_d = parse_fecha_registro(hasta) if hasta else None
 
-    if codigo:
-        clauses.append(campo_nro == codigo)
-        clauses.append(campo_desc == codigo)
-        clauses.append(campo_nro.like(f"%{codigo}%"))
-        clauses.append(campo_desc.like(f"%{codigo}%"))
+    if desde and not desde_d:
+        raise ValueError(f"Fecha 'desde' inválida: {desde}")
+    if hasta and not hasta_d:
+        raise ValueError(f"Fecha 'hasta' inválida: {hasta}")
 
-    for mp in (proyecto.mapeos or []):
-        if not bool(mp.activo):
-            continue
+    if desde_d:
+        q = q.filter(columna >= desde_d)
+    if hasta_d:
+        q = q.filter(columna < hasta_d + timedelta(days=1))
+    return q
 
-        valor = (mp.valor_origen or "").strip().upper()
-        tipo = (mp.tipo_match or "EXACT").strip().upper()
 
-        if not valor:
-            continue
+def _filtro_mes_anio_registro(q, mes=None, anio=None):
+    """mes/año -> rango [inicio, fin) sobre fecha_date; solo mes -> MONTH(fecha_date)."""
+    try:
+        mes_i = int(mes) if mes else None
+        anio_i = int(anio) if anio else None
+    except (TypeError, ValueError):
+        return q
 
-        if tipo == "EXACT":
-            clauses.append(campo_nro == valor)
-            clauses.append(campo_desc == valor)
+    if mes_i is not None and not 1 <= mes_i <= 12:
+        return q
 
-        elif tipo == "CONTAINS":
-            clauses.append(campo_nro.like(f"%{valor}%"))
-            clauses.append(campo_desc.like(f"%{valor}%"))
+    if anio_i:
+        if mes_i:
+            inicio = date(anio_i, mes_i, 1)
+            fin = date(anio_i + 1, 1, 1) if mes_i == 12 else date(anio_i, mes_i + 1, 1)
+        else:
+            inicio, fin = date(anio_i, 1, 1), date(anio_i + 1, 1, 1)
+        return q.filter(Registro.fecha_date >= inicio, Registro.fecha_date < fin)
 
-        elif tipo == "REGEX":
-            try:
-                clauses.append(campo_nro.op("REGEXP")(valor))
-                clauses.append(campo_desc.op("REGEXP")(valor))
-            except Exception:
-                pass
+    if mes_i:
+        q = q.filter(extract("month", Registro.fecha_date) == mes_i)
+    return q
 
-    return q.filter(or_(*clauses))
 
 def _apply_project_filter_shared(q, proyecto_id: int):
-    proyecto = (
-        Proyecto.query.options(joinedload(Proyecto.mapeos))
-        .filter(Proyecto.id == proyecto_id)
-        .first()
-    )
-
-    if not proyecto:
+    """
+    Registros asociados al proyecto (proyecto_id directo, código o mapeos)
+    vía registro_proyecto_match: semi-join por índice en lugar de LIKE/REGEXP
+    sobre nro_caso_cliente y descripcion.
+    """
+    try:
+        pid = int(proyecto_id)
+    except (TypeError, ValueError):
         return q.filter(text("1=0"))
 
-    clauses = [Registro.proyecto_id == proyecto.id]
-
-    codigo = (proyecto.codigo or "").strip().upper()
-    campo_nro = func.upper(func.coalesce(Registro.nro_caso_cliente, ""))
-    campo_desc = func.upper(func.coalesce(Registro.descripcion, ""))
-
-    if codigo:
-        clauses.append(campo_nro == codigo)
-        clauses.append(campo_desc == codigo)
-        clauses.append(campo_nro.like(f"%{codigo}%"))
-        clauses.append(campo_desc.like(f"%{codigo}%"))
-
-    for mp in (proyecto.mapeos or []):
-        if not bool(mp.activo):
-            continue
-
-        valor = (mp.valor_origen or "").strip().upper()
-        tipo = (mp.tipo_match or "EXACT").strip().upper()
+    sub = select(RegistroProyectoMatch.registro_id).where(RegistroProyectoMatch.proyecto_id == pid)
+    return q.filter(Registro.id.in_(sub))
 
-        if not valor:
-            continue
-
-        if tipo == "EXACT":
-            clauses.append(campo_nro == valor)
-            clauses.append(campo_desc == valor)
-        elif tipo == "CONTAINS":
-            clauses.append(campo_nro.like(f"%{valor}%"))
-            clauses.append(campo_desc.like(f"%{valor}%"))
-        elif tipo == "REGEX":
-            try:
-                clauses.append(campo_nro.op("REGEXP")(valor))
-                clauses.append(campo_desc.op("REGEXP")(valor))
-            except Exception:
-                pass
 
-    return q.filter(or_(*clauses))
+_apply_project_filter_graficos = _apply_project_filter_shared
 
 def _graficos_list_arg(key: str):
     """Lee parámetros repetidos: ?cliente=A&cliente=B o cliente[]."""
@@ -1864,6 +2090,136 @@ def _graficos_month_bounds(value: str):
     return start, end
 
 
+GRAFICOS_AGG_DIMENSIONES = (
+    "dia", "consultor", "cliente", "ocupacion", "tarea", "modulo", "equipo", "proyecto",
+)
+GRAFICOS_AGG_TOP_DEFAULT = 15
+GRAFICOS_AGG_OTROS = "OTROS"
+
+
+def _graficos_agg_dimensiones(valor: str):
+    """agg=1|all → todas las series; agg=dia,cliente → sólo esas."""
+    valor = str(valor or "").strip().lower()
+    if valor in ("1", "true", "si", "all", "todas"):
+        return list(GRAFICOS_AGG_DIMENSIONES)
+
+    dims = []
+    for parte in valor.split(","):
+        parte = parte.strip()
+        if not parte or parte in dims:
+            continue
+        if parte not in GRAFICOS_AGG_DIMENSIONES:
+            raise ValueError(
+                f"agg inválido: {parte}. Usa {', '.join(GRAFICOS_AGG_DIMENSIONES)}"
+            )
+        dims.append(parte)
+
+    if not dims:
+        raise ValueError("agg no puede ir vacío")
+    return dims
+
+
+def _graficos_agg_columnas(dim, C, E, T, O, P):
+    """Columnas GROUP BY por dimensión; la etiqueta final se arma en Python."""
+    return {
+        "dia": (Registro.fecha_date,),
+        "consultor": (C.nombre,),
+        "cliente": (Registro.cliente,),
+        "ocupacion": (O.codigo, O.nombre),
+        "tarea": (T.codigo, T.nombre, Registro.tipo_tarea),
+        "modulo": (Registro.modulo,),
+        "equipo": (E.nombre, Registro.equipo),
+        "proyecto": (P.codigo, P.nombre),
+    }[dim]
+
+
+def _graficos_agg_etiqueta(dim, valores):
+    """Misma etiqueta que el modo crudo usa para cada fila."""
+    if dim == "dia":
+        fecha = valores[0]
+        return fecha.isoformat() if fecha else None
+
+    if dim == "tarea":
+        codigo, nombre, legacy = valores
+        if codigo and nombre:
+            return f"{codigo} - {nombre}"
+        return str(legacy or "").strip() or None
+
+    if dim == "equipo":
+        relacion, registro = valores
+        return str(relacion or registro or "SIN EQUIPO").strip().upper()
+
+    if dim in ("ocupacion", "proyecto"):
+        codigo, nombre = valores
+        if codigo and nombre:
+            return f"{codigo} - {nombre}"
+        return str(nombre or codigo or "").strip() or None
+
+    return str(valores[0] or "").strip() or None
+
+
+def _graficos_series_agregadas(q, dims, top, C, E, T, O, P):
+    """
+    Agrupa en SQL el query ya filtrado (scope + filtros) por cada dimensión.
+    Cada serie queda ordenada por horas; fuera del top-N se suma en OTROS.
+    La serie por día nunca se recorta.
+    """
+    horas_expr = func.coalesce(func.sum(Registro.tiempo_invertido), 0)
+    registros_expr = func.count(Registro.id)
+
+    total_registros, total_horas = q.with_entities(registros_expr, horas_expr).one()
+
+    series = {}
+    for dim in dims:
+        cols = _graficos_agg_columnas(dim, C, E, T, O, P)
+        filas = (
+            q.with_entities(*cols, horas_expr, registros_expr)
+            .group_by(*cols)
+            .all()
+        )
+
+        # Varias combinaciones de columnas pueden compartir etiqueta (p. ej. equipo).
+        acumulado = {}
+        for fila in filas:
+            etiqueta = _graficos_agg_etiqueta(dim, fila[:len(cols)])
+            horas, registros = acumulado.get(etiqueta, (0.0, 0))
+            acumulado[etiqueta] = (
+                horas + float(fila[len(cols)] or 0),
+                registros + int(fila[len(cols) + 1] or 0),
+            )
+
+        if dim == "dia":
+            items = sorted(acumulado.items(), key=lambda kv: kv[0] or "")
+        else:
+            items = sorted(acumulado.items(), key=lambda kv: (-kv[1][0], kv[0] or ""))
+
+        resto = []
+        if dim != "dia" and top and len(items) > top:
+            items, resto = items[:top], items[top:]
+
+        serie = [
+            {"clave": etiqueta, "horas": round(horas, 2), "registros": registros}
+            for etiqueta, (horas, registros) in items
+        ]
+        if resto:
+            serie.append({
+                "clave": GRAFICOS_AGG_OTROS,
+                "horas": round(sum(h for _k, (h, _n) in resto), 2),
+                "registros": sum(n for _k, (_h, n) in resto),
+                "agrupados": len(resto),
+            })
+
+        series[dim] = serie
+
+    return {
+        "agg": True,
+        "top": top,
+        "total_horas": round(float(total_horas or 0), 2),
+        "total_registros": int(total_registros or 0),
+        "series": series,
+    }
+
+
 @bp.route('/registros/graficos', methods=['GET'])
 @permission_required("GRAFICOS_VER")
 def obtener_registros_graficos():
@@ -1872,9 +2228,11 @@ def obtener_registros_graficos():
 
     Mejoras principales:
     - aplica todos los filtros en SQL;
-    - usa rangos sobre Registro.fecha en lugar de CAST/SUBSTR;
+    - usa rangos sobre Registro.fecha_date en lugar de CAST/SUBSTR;
     - evita joinedload y la carga de modelos completos;
     - retorna únicamente las columnas utilizadas por las gráficas y el modal.
+    - con ?agg=1 (o agg=dia,cliente,...) y ?top=N devuelve series agregadas
+      en SQL con top-N + OTROS en lugar de filas.
     """
     try:
         usuario = _get_usuario_from_request()
@@ -1930,6 +2288,7 @@ def obtener_registros_graficos():
                 Registro.hora_fin.label("hora_fin"),
                 Registro.tiempo_invertido.label("tiempo_invertido"),
                 Registro.horas_adicionales.label("horas_adicionales"),
+                Registro.horas_adicionales_calc.label("horas_adicionales_calc"),
                 Registro.horario_trabajo.label("horario_trabajo"),
                 Registro.descripcion.label("descripcion"),
                 Registro.proyecto_id.label("proyecto_id"),
@@ -1937,9 +2296,8 @@ def obtener_registros_graficos():
                 P.nombre.label("proyecto_nombre"),
             )
             .select_from(Registro)
-            # En MySQL la collation usual es case-insensitive. Al quitar LOWER()
-            # el motor puede utilizar los índices de usuario_consultor/usuario.
-            .outerjoin(C, Registro.usuario_consultor == C.usuario)
+            # Igualdad sobre la FK resuelta: usa el índice (consultor_id, fecha_date).
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
             .outerjoin(T, Registro.tarea_id == T.id)
             .outerjoin(O, Registro.ocupacion_id == O.id)
@@ -1970,8 +2328,8 @@ def obtener_registros_graficos():
         if filtro_mes:
             start_date, end_date = _graficos_month_bounds(filtro_mes)
             q = q.filter(
-                Registro.fecha >= start_date.isoformat(),
-                Registro.fecha < end_date.isoformat(),
+                Registro.fecha_date >= start_date,
+                Registro.fecha_date < end_date,
             )
         else:
             if not filtro_desde and not filtro_hasta:
@@ -1996,9 +2354,9 @@ def obtener_registros_graficos():
                 }), 400
 
             q = q.filter(
-                Registro.fecha >= desde_date.isoformat(),
+                Registro.fecha_date >= desde_date,
                 # Menor que el día siguiente evita CAST/DATE y conserva uso de índice.
-                Registro.fecha < (hasta_date + timedelta(days=1)).isoformat(),
+                Registro.fecha_date < hasta_date + timedelta(days=1),
             )
 
         # ----------------------------------------------------------
@@ -2075,6 +2433,23 @@ def obtener_registros_graficos():
             except Exception:
                 return jsonify({'error': 'proyecto_id inválido'}), 400
 
+        # Modo agregado: series ya sumadas en SQL, sin filas individuales.
+        filtro_agg = str(request.args.get("agg") or "").strip()
+        if filtro_agg:
+            dims = _graficos_agg_dimensiones(filtro_agg)
+            try:
+                top = int(request.args.get("top", GRAFICOS_AGG_TOP_DEFAULT))
+            except Exception:
+                return jsonify({'error': 'top inválido'}), 400
+            if top < 0:
+                return jsonify({'error': 'top inválido'}), 400
+
+            payload = _graficos_series_agregadas(q, dims, top, C, E, T, O, P)
+            response = jsonify(payload)
+            response.headers["Cache-Control"] = "private, max-age=30"
+            response.headers["X-Total-Registros"] = str(payload["total_registros"])
+            return response, 200
+
         # No se ordena: las gráficas agregan los datos y el modal los ordena en JS.
         # Eliminar ORDER BY reduce el uso de archivos temporales para rangos grandes.
         rows = q.yield_per(2000)
@@ -2108,13 +2483,7 @@ def obtener_registros_graficos():
                 "horaInicio": row.hora_inicio,
                 "horaFin": row.hora_fin,
                 "tiempoInvertido": row.tiempo_invertido,
-                "horasAdicionales": _calcular_horas_adicionales_por_horario(
-                    row.hora_inicio,
-                    row.hora_fin,
-                    row.horario_trabajo,
-                    equipo_nombre,
-                    row.horas_adicionales,
-                ),
+                "horasAdicionales": _horas_adicionales_de(row, equipo_nombre),
                 "descripcion": row.descripcion,
                 "proyecto_id": row.proyecto_id,
                 "proyecto_codigo": row.proyecto_codigo,
@@ -2139,6 +2508,69 @@ def obtener_registros_graficos():
 USUARIOS_PUEDE_SEMANAS_ANTERIORES = {
 }
 
+_REGISTROS_COUNT_CACHE = TTLCache(maxsize=1024, ttl=30)
+
+# El total cacheado se invalida con cualquier escritura ORM sobre Registro;
+# los UPDATE masivos sin ORM quedan cubiertos por el TTL corto.
+version_on_write("registros", Registro)
+
+
+def _registros_total_cacheado(q, firma):
+    """COUNT del listado, memorizado por firma de filtros + scope y versión de datos."""
+    key = (firma, data_versions.get("registros"))
+    total = _REGISTROS_COUNT_CACHE.get(key)
+    if total is None:
+        total = (
+            q.enable_eagerloads(False)
+            .with_entities(func.count(Registro.id))
+            .order_by(None)
+            .scalar()
+        ) or 0
+        _REGISTROS_COUNT_CACHE.set(key, total)
+    return total
+
+
+def _registros_cursor_encode(fecha_date, registro_id):
+    # fecha_date NULL (fecha sin formato reconocido) se codifica vacía
+    raw = f"{fecha_date.isoformat() if fecha_date else ''}|{int(registro_id)}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _registros_cursor_decode(cursor):
+    """Devuelve (fecha_date o None, id) o None para la primera página."""
+    cursor = str(cursor or "").strip()
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        fecha_text, id_text = raw.split("|", 1)
+        fecha = datetime.strptime(fecha_text, "%Y-%m-%d").date() if fecha_text else None
+        return fecha, int(id_text)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+# Orden único de /registros (offset y cursor): la misma página de un modo
+# contiene las mismas filas que la del otro.
+_REGISTROS_ORDEN = (Registro.fecha_date.desc(), Registro.id.desc())
+
+
+def _registros_filtro_cursor(q, fecha_pos, id_pos):
+    """
+    Filas posteriores a (fecha_pos, id_pos) en el orden fecha_date DESC, id DESC.
+    En ese orden MySQL deja las fechas NULL al final: se recorren después de
+    todas las fechadas, por id descendente.
+    """
+    if fecha_pos is None:
+        return q.filter(Registro.fecha_date.is_(None), Registro.id < id_pos)
+
+    return q.filter(or_(
+        Registro.fecha_date < fecha_pos,
+        and_(Registro.fecha_date == fecha_pos, Registro.id < id_pos),
+        Registro.fecha_date.is_(None),
+    ))
+
+
 @bp.route('/registros', methods=['GET'])
 def obtener_registros():
     try:
@@ -2175,7 +2607,7 @@ def obtener_registros():
                 joinedload(Registro.proyecto),
                 joinedload(Registro.fase_proyecto),
             )
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
         )
 
@@ -2183,7 +2615,7 @@ def obtener_registros():
         # Scope
         # -----------------------------
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -2248,23 +2680,17 @@ def obtener_registros():
                     return jsonify({'error': 'No autorizado para consultar otro equipo'}), 403
             q = q.filter(func.upper(E.nombre) == filtro_equipo)
 
-        if filtro_mes:
-            try:
-                q = q.filter(extract("month", cast(Registro.fecha, db.Date)) == int(filtro_mes))
-            except Exception:
-                pass
-
-        if filtro_anio:
-            try:
-                q = q.filter(extract("year", cast(Registro.fecha, db.Date)) == int(filtro_anio))
-            except Exception:
-                pass
+        q = _filtro_mes_anio_registro(q, filtro_mes, filtro_anio)
 
         if filtro_nro_caso:
             q = q.filter(Registro.nro_caso_cliente.ilike(f"%{filtro_nro_caso}%"))
 
         if filtro_horas_adic:
-            q = q.filter(func.upper(Registro.horas_adicionales).in_(filtro_horas_adic))
+            q = q.filter(
+                func.upper(
+                    func.coalesce(Registro.horas_adicionales_calc, Registro.horas_adicionales)
+                ).in_(filtro_horas_adic)
+            )
 
         if filtro_tarea_ids:
             q = q.filter(Registro.tarea_id.in_(filtro_tarea_ids))
@@ -2275,17 +2701,46 @@ def obtener_registros():
         # -----------------------------
         # Paginación
         # -----------------------------
-        page = max(int(request.args.get("page", 1)), 1)
         per_page = min(max(int(request.args.get("per_page", 50)), 1), 200)
 
-        total = q.count()
-
-        registros = (
-            q.order_by(Registro.fecha.desc(), Registro.id.desc())
-             .offset((page - 1) * per_page)
-             .limit(per_page)
-             .all()
+        firma = (
+            scope, val,
+            filtro_id, filtro_fecha, filtro_equipo, filtro_mes, filtro_anio, filtro_nro_caso,
+            tuple(sorted(filtro_clientes)),
+            tuple(sorted(filtro_consultores)),
+            tuple(sorted(filtro_horas_adic)),
+            tuple(sorted(filtro_tarea_ids)),
+            tuple(sorted(filtro_ocupacion_ids)),
         )
+        total = _registros_total_cacheado(q, firma)
+
+        # ?cursor= (vacío para la primera página) activa la paginación keyset
+        # sobre (fecha_date, id): cada página cuesta lo mismo sin importar la profundidad.
+        modo_cursor = "cursor" in request.args
+        next_cursor = None
+
+        if modo_cursor:
+            posicion = _registros_cursor_decode(request.args.get("cursor"))
+            if posicion:
+                q = _registros_filtro_cursor(q, *posicion)
+
+            registros = (
+                q.order_by(*_REGISTROS_ORDEN)
+                 .limit(per_page + 1)
+                 .all()
+            )
+            if len(registros) > per_page:
+                registros = registros[:per_page]
+                ultimo = registros[-1]
+                next_cursor = _registros_cursor_encode(ultimo.fecha_date, ultimo.id)
+        else:
+            page = max(int(request.args.get("page", 1)), 1)
+            registros = (
+                q.order_by(*_REGISTROS_ORDEN)
+                 .offset((page - 1) * per_page)
+                 .limit(per_page)
+                 .all()
+            )
 
         data = []
         for r in registros:
@@ -2333,13 +2788,7 @@ def obtener_registros():
                 "horaFin": r.hora_fin,
                 "tiempoInvertido": r.tiempo_invertido,
                 "tiempoFacturable": r.tiempo_facturable,
-                "horasAdicionales": _calcular_horas_adicionales_por_horario(
-                    r.hora_inicio,
-                    r.hora_fin,
-                    getattr(r, "horario_trabajo", None),
-                    equipo_nombre or getattr(r, "equipo", None),
-                    r.horas_adicionales,
-                ),
+                "horasAdicionales": _horas_adicionales_de(r, equipo_nombre or getattr(r, "equipo", None)),
                 "horarioTrabajo": _normalizar_horario_trabajo_por_equipo(
                     getattr(r, "horario_trabajo", None),
                     equipo_nombre or getattr(r, "equipo", None),
@@ -2376,6 +2825,14 @@ def obtener_registros():
                 "proyecto_fase": fase_proyecto.nombre if fase_proyecto else None,
             })
 
+        if modo_cursor:
+            return jsonify({
+                "data": data,
+                "total": total,
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+            }), 200
+
         return jsonify({
             "data": data,
             "total": total,
@@ -2384,6 +2841,9 @@ def obtener_registros():
             "total_pages": math.ceil(total / per_page) if per_page else 1
         }), 200
 
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         app.logger.exception("❌ Error en obtener_registros (/registros)")
         return jsonify({'error': str(e)}), 500
@@ -2427,17 +2887,18 @@ def resumen_horas():
         hasta = (request.args.get("hasta") or "").strip()
 
         # ----------------------------------------------------------
-        # 5) Query base (contadores por equipo)
+        # 5) Query base (contadores por equipo) sobre el rollup diario
         #    OJO: tu Registro NO tiene equipo_id, por eso usamos Consultor->Equipo
         # ----------------------------------------------------------
+        R = RegistroResumenDiario
         q = (
             db.session.query(
                 Equipo.nombre.label("equipo_nombre"),
-                func.count(Registro.id).label("total_registros"),
-                func.coalesce(func.sum(Registro.total_horas), 0).label("total_horas"),
+                func.coalesce(func.sum(R.registros), 0).label("total_registros"),
+                func.coalesce(func.sum(R.total_horas), 0).label("total_horas"),
             )
-            .select_from(Registro)
-            .join(Consultor, func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario))
+            .select_from(R)
+            .join(Consultor, R.consultor_id == Consultor.id)
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
         )
 
@@ -2445,7 +2906,7 @@ def resumen_horas():
         # 6) Aplicar scope
         # ----------------------------------------------------------
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(R.consultor_id == consultor_login.id)
         elif scope == "TEAM":
             q = q.filter(Consultor.equipo_id == int(val))
         elif scope == "ROLE_POOL":
@@ -2453,14 +2914,8 @@ def resumen_horas():
 
         # ----------------------------------------------------------
         # 7) Filtro por fecha (si viene)
-        #    (si tu fecha es ISO YYYY-MM-DD, BETWEEN funciona perfecto)
         # ----------------------------------------------------------
-        if desde and hasta:
-            q = q.filter(Registro.fecha.between(desde, hasta))
-        elif desde:
-            q = q.filter(Registro.fecha >= desde)
-        elif hasta:
-            q = q.filter(Registro.fecha <= hasta)
+        q = _filtro_rango_fecha_registro(q, desde, hasta, R.fecha_date)
 
         # ----------------------------------------------------------
         # 8) Agrupar
@@ -2474,26 +2929,21 @@ def resumen_horas():
         # ----------------------------------------------------------
         qt = (
             db.session.query(
-                func.count(Registro.id).label("total_registros"),
-                func.coalesce(func.sum(Registro.total_horas), 0).label("total_horas"),
+                func.coalesce(func.sum(R.registros), 0).label("total_registros"),
+                func.coalesce(func.sum(R.total_horas), 0).label("total_horas"),
             )
-            .select_from(Registro)
-            .join(Consultor, func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario))
+            .select_from(R)
+            .join(Consultor, R.consultor_id == Consultor.id)
         )
 
         if scope == "SELF":
-            qt = qt.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            qt = qt.filter(R.consultor_id == consultor_login.id)
         elif scope == "TEAM":
             qt = qt.filter(Consultor.equipo_id == int(val))
         elif scope == "ROLE_POOL":
             qt = qt.filter(Consultor.rol_id == int(val))
 
-        if desde and hasta:
-            qt = qt.filter(Registro.fecha.between(desde, hasta))
-        elif desde:
-            qt = qt.filter(Registro.fecha >= desde)
-        elif hasta:
-            qt = qt.filter(Registro.fecha <= hasta)
+        qt = _filtro_rango_fecha_registro(qt, desde, hasta, R.fecha_date)
 
         total_row = qt.first()
 
@@ -2521,6 +2971,9 @@ def resumen_horas():
             "equipos": equipos,
         }), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         app.logger.exception("❌ Error en /resumen-horas")
         return jsonify({"error": str(e)}), 500
@@ -2663,16 +3116,18 @@ def editar_registro(id):
         # ----------------------------------------------------------
         # 4) Validar traslape en backend
         # ----------------------------------------------------------
-        conflicto = _buscar_registro_traslapado(
-            fecha=nueva_fecha,
-            usuario_consultor=registro.usuario_consultor,
-            hora_inicio=nuevo_hora_inicio,
-            hora_fin=nuevo_hora_fin,
-            exclude_id=registro.id
+        indice_traslapes = _indice_intervalos_consultor(
+            registro.consultor_id,
+            registro.usuario_consultor,
+            [nueva_fecha],
+            exclude_id=registro.id,
+        )
+        conflicto = _buscar_traslape_en_indice(
+            indice_traslapes, nueva_fecha, nuevo_hora_inicio, nuevo_hora_fin
         )
         if conflicto:
             return jsonify({
-                'mensaje': f'Ya existe un registro que se cruza con este rango: {conflicto.hora_inicio} - {conflicto.hora_fin} (ID: {conflicto.id})'
+                'mensaje': f'Ya existe un registro que se cruza con este rango: {conflicto["hora_inicio"]} - {conflicto["hora_fin"]} (ID: {conflicto["id"]})'
             }), 409
 
         # ----------------------------------------------------------
@@ -2701,6 +3156,7 @@ def editar_registro(id):
         # ----------------------------------------------------------
         # 6) Tarea
         # ----------------------------------------------------------
+        cat = catalogos()
         tarea_id = pick(data, "tarea_id")
         tipoTareaTexto = pick(data, "tipoTarea", "tipo_tarea")
 
@@ -2710,14 +3166,14 @@ def editar_registro(id):
             except Exception:
                 return jsonify({'mensaje': 'Tarea inválida'}), 400
 
-            tarea_obj = Tarea.query.get(tarea_id_int)
-            if not tarea_obj:
+            tarea_cat = cat["tareas"].get(tarea_id_int)
+            if not tarea_cat:
                 return jsonify({'mensaje': 'Tarea inválida'}), 400
 
-            registro.tarea_id = tarea_obj.id
+            registro.tarea_id = tarea_cat["id"]
 
             if not tipoTareaTexto:
-                registro.tipo_tarea = f"{tarea_obj.codigo} - {tarea_obj.nombre}"
+                registro.tipo_tarea = f"{tarea_cat['codigo']} - {tarea_cat['nombre']}"
 
         if tipoTareaTexto:
             registro.tipo_tarea = str(tipoTareaTexto).strip()
@@ -2732,16 +3188,15 @@ def editar_registro(id):
             except Exception:
                 return jsonify({'mensaje': 'Ocupación inválida'}), 400
 
-            ocup_obj = Ocupacion.query.get(ocupacion_id_int)
-            if not ocup_obj:
+            if ocupacion_id_int not in cat["ocupaciones"]:
                 return jsonify({'mensaje': 'Ocupación inválida'}), 400
 
             registro.ocupacion_id = ocupacion_id_int
 
         if (ocupacion_id in (None, "", "null", "None")) and registro.tarea_id:
-            tarea_db = Tarea.query.options(db.joinedload(Tarea.ocupaciones)).get(registro.tarea_id)
-            if tarea_db and getattr(tarea_db, "ocupaciones", None) and tarea_db.ocupaciones:
-                registro.ocupacion_id = tarea_db.ocupaciones[0].id
+            tarea_cat = cat["tareas"].get(registro.tarea_id)
+            if tarea_cat and tarea_cat["ocupaciones"]:
+                registro.ocupacion_id = tarea_cat["ocupaciones"][0]
 
         # ----------------------------------------------------------
         # 7.1) Validación cliente restringido por ocupación
@@ -2749,8 +3204,8 @@ def editar_registro(id):
         cliente_validar = pick(data, 'cliente', default=registro.cliente)
         cliente_upper = str(cliente_validar or "").strip().upper()
 
-        occ_obj = Ocupacion.query.get(registro.ocupacion_id) if registro.ocupacion_id else None
-        occ_codigo = str(getattr(occ_obj, "codigo", "") or "").strip()
+        occ_cat = cat["ocupaciones"].get(registro.ocupacion_id) if registro.ocupacion_id else None
+        occ_codigo = str((occ_cat or {}).get("codigo") or "").strip()
 
         # Ocupaciones que NO pueden usar HITSS/CLARO
         if occ_codigo in {"01", "02"} and cliente_upper == "HITSS/CLARO":
@@ -2820,7 +3275,7 @@ def editar_registro(id):
             except Exception:
                 return jsonify({'mensaje': 'proyecto_id inválido'}), 400
 
-            if proyecto_id and not Proyecto.query.get(proyecto_id):
+            if proyecto_id and proyecto_id not in cat["proyectos"]:
                 return jsonify({'mensaje': 'Proyecto no existe'}), 400
 
             registro.proyecto_id = proyecto_id
@@ -2831,15 +3286,15 @@ def editar_registro(id):
             except Exception:
                 return jsonify({'mensaje': 'fase_proyecto_id inválido'}), 400
 
-            if fase_proyecto_id and not ProyectoFase.query.get(fase_proyecto_id):
+            if fase_proyecto_id and fase_proyecto_id not in cat["fases"]:
                 return jsonify({'mensaje': 'Fase de proyecto no existe'}), 400
 
             registro.fase_proyecto_id = fase_proyecto_id
 
         if registro.proyecto_id and not registro.fase_proyecto_id:
-            p = Proyecto.query.get(registro.proyecto_id)
-            if p and getattr(p, "fase_id", None):
-                registro.fase_proyecto_id = p.fase_id
+            proyecto_cat = cat["proyectos"].get(registro.proyecto_id)
+            if proyecto_cat and proyecto_cat["fase_id"]:
+                registro.fase_proyecto_id = proyecto_cat["fase_id"]
 
         # ----------------------------------------------------------
         # 11) Campos BASIS
@@ -2860,6 +3315,15 @@ def editar_registro(id):
         if not registro.desborde:
             registro.desborde = "N/A"
 
+        consultor_registro = registro.consultor
+        _persistir_horas_adicionales(
+            registro,
+            (
+                consultor_registro.equipo_obj.nombre
+                if consultor_registro and consultor_registro.equipo_obj else None
+            ) or registro.equipo,
+        )
+
         db.session.commit()
         return jsonify({
             'mensaje': 'Registro actualizado',
@@ -3237,8 +3701,8 @@ def listar_consultores():
 @permission_required("ADMIN_MODULOS_GESTION")
 def listar_modulos():
     try:
-        modulos = Modulo.query.order_by(Modulo.nombre.asc()).all()
-        data = [{'id': m.id, 'nombre': m.nombre} for m in modulos]
+        modulos = catalogos()["modulos"]
+        data = [{'id': mid, 'nombre': nombre} for mid, nombre in modulos.items()]
         return jsonify(data), 200
     except Exception as e:
         app.logger.exception("Error al listar módulos")
@@ -3287,34 +3751,7 @@ def get_datos_consultor():
 # ===============================
 # Oportunidades   
 
-EXCLUDE_LIST = [
-    "OTP",
-    "OTE",
-    "OTL",
-    "PROSPECCION",
-    "REGISTRO",
-    "PENDIENTE APROBACION SAP",
-    "0TP",
-    "0TE",
-    "0TL",
-    "OT",
-    "EJECUCION CONTRACTUAL",
-    "N/A",
-]
-
-
-def _norm_key_for_match(v):
-    s = str(v or "").replace("\u00A0", " ").strip().upper()
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    s = re.sub(r"\s+", " ", s)
-    s = re.sub(r"\b0TP\b", "OTP", s)
-    s = re.sub(r"\b0TE\b", "OTE", s)
-    s = re.sub(r"\b0TL\b", "OTL", s)
-    return s
-
-
-EXCLUDE_NORM_SET = {_norm_key_for_match(x) for x in EXCLUDE_LIST if x}
+_norm_key_for_match = norm_key_for_match
 
 
 def _get_list_arg(key: str):
@@ -3370,12 +3807,8 @@ def _response_principal_duplicada(duplicada):
     }), 409
 
 def _apply_excluded_states(query):
-    col = _sql_norm_estado(Oportunidad.estado_oferta)
-    query = query.filter(~col.in_(list(EXCLUDE_NORM_SET)))
-    for x in EXCLUDE_NORM_SET:
-        safe = x.replace("%", "").replace("_", "")
-        query = query.filter(~col.like(f"%{safe}%"))
-    return query
+    # Oportunidad.estado_excluido se calcula al escribir (estado_oferta_excluido)
+    return query.filter(Oportunidad.estado_excluido.is_(False))
 
 
 def _request_bool_arg(*keys):
@@ -3472,11 +3905,11 @@ def _apply_oportunidades_filters(query, apply_exclusion: bool = True):
 
     if estado_oferta:
         estado_norm = [_norm_key_for_match(x) for x in estado_oferta]
-        query = query.filter(_sql_norm_estado(Oportunidad.estado_oferta).in_(estado_norm))
+        query = query.filter(Oportunidad.estado_oferta_norm.in_(estado_norm))
 
     if resultado:
         resultado_norm = [_norm_key_for_match(x) for x in resultado]
-        query = query.filter(_sql_norm_estado(Oportunidad.resultado_oferta).in_(resultado_norm))
+        query = query.filter(Oportunidad.resultado_oferta_norm.in_(resultado_norm))
 
     if estado_ot:
         query = query.filter(Oportunidad.estado_ot.in_(estado_ot))
@@ -3516,7 +3949,7 @@ def _apply_oportunidades_filters(query, apply_exclusion: bool = True):
 
         tipos_up = {t.upper().strip() for t in tipos}
         conds = []
-        colN = _sql_norm_estado(Oportunidad.estado_oferta)
+        colN = Oportunidad.estado_oferta_norm
 
         if "GANADA" in tipos_up:
             conds.append(colN == "GANADA")
@@ -4055,11 +4488,18 @@ def importar_oportunidades():
 
         obj = clean_payload(obj)
 
-        data_list.append(Oportunidad(**obj))
+        # bulk_save_objects no dispara before_insert: las columnas *_norm y
+        # estado_excluido se calculan aquí.
+        oportunidad = Oportunidad(**obj)
+        _sync_estado_oferta_norm(oportunidad)
+        _sync_resultado_oferta_norm(oportunidad)
+        data_list.append(oportunidad)
 
     try:
         db.session.bulk_save_objects(data_list)
         db.session.commit()
+        # bulk_save_objects tampoco pasa por version_on_write
+        bump_compartida(db.engine, "oportunidades")
         return jsonify({"mensaje": f"Carga inicial exitosa ({len(data_list)} registros)"}), 200
     except Exception as e:
         db.session.rollback()
@@ -4091,98 +4531,110 @@ def distinct_clientes_model():
     return [r[0] for r in rows]
 
 
-@bp.route("/oportunidades/filters", methods=["GET"])
-@permission_required("OPORTUNIDADES_VER")
-def oportunidades_filters():
-    try:
-        # TABLA PRINCIPAL: sin exclusión
-        base = Oportunidad.query
+_OPORTUNIDADES_FACETAS_CACHE = TTLCache(maxsize=2, ttl=600)
 
-        if _request_bool_arg("detalle_ots", "solo_ots"):
-            base = _apply_detalle_ots_scope(base)
+# Altas, ediciones y jerarquía principal/sub pasan por el ORM: cualquiera de
+# ellas avanza "oportunidades" (también en data_version, para el resto de
+# workers) y descarta las facetas. La importación masiva avanza a mano.
+version_on_write("oportunidades", Oportunidad, Cliente, compartida=True)
 
-        anios = (
-            base.with_entities(extract("year", Oportunidad.fecha_creacion).label("y"))
-            .filter(Oportunidad.fecha_creacion.isnot(None))
-            .distinct()
-            .order_by("y")
-            .all()
-        )
+OPORTUNIDADES_FACETAS_TEXTO = (
+    "direccion_comercial",
+    "gerencia_comercial",
+    "nombre_cliente",
+    "servicio",
+    "estado_oferta",
+    "resultado_oferta",
+    "estado_ot",
+    "ultimo_mes",
+    "calificacion_oportunidad",
+)
+OPORTUNIDADES_FACETAS_FECHA = ("fecha_acta_cierre_ot", "fecha_cierre_oportunidad")
 
-        meses = (
-            base.with_entities(extract("month", Oportunidad.fecha_creacion).label("m"))
-            .filter(Oportunidad.fecha_creacion.isnot(None))
-            .distinct()
-            .order_by("m")
-            .all()
-        )
 
-        def distinct_col(col):
-            rows = (
-                base.with_entities(col)
-                .filter(col.isnot(None))
-                .filter(func.trim(col) != "")
-                .distinct()
-                .order_by(col.asc())
-                .all()
-            )
-            return [r[0] for r in rows]
+def _calcular_facetas_oportunidades(detalle_ots):
+    """Todas las listas de filtros en un solo recorrido de oportunidades."""
+    base = Oportunidad.query
+    if detalle_ots:
+        base = _apply_detalle_ots_scope(base)
 
-        def distinct_date(col):
-            rows = (
-                base.with_entities(func.date(col))
-                .filter(col.isnot(None))
-                .distinct()
-                .order_by(func.date(col).asc())
-                .all()
-            )
-            out = []
-            for r in rows:
-                v = r[0]
-                if v is None:
-                    continue
-                if hasattr(v, "strftime"):
-                    out.append(v.strftime("%Y-%m-%d"))
-                else:
-                    out.append(str(v))
-            return out
+    columnas = [Oportunidad.fecha_creacion]
+    columnas += [getattr(Oportunidad, c) for c in OPORTUNIDADES_FACETAS_TEXTO]
+    columnas += [getattr(Oportunidad, c) for c in OPORTUNIDADES_FACETAS_FECHA]
 
-        return jsonify(
-            {
-                "anios": [int(r.y) for r in anios if r.y is not None],
-                "meses": [int(r.m) for r in meses if r.m is not None],
-                "direccion_comercial": distinct_col(Oportunidad.direccion_comercial),
-                "gerencia_comercial": distinct_col(Oportunidad.gerencia_comercial),
-                "nombre_cliente": _merge_unique_sorted(
-                    distinct_clientes_model(),
-                    distinct_col(Oportunidad.nombre_cliente)
-                ),
-                "servicio": distinct_col(Oportunidad.servicio),
-
-                "estado_oferta": _merge_unique_sorted(
-                    distinct_col(Oportunidad.estado_oferta),
-                    [
-                        "EN ESPERA DEL RFI / RFP",
-                        "RFI PRESENTADO",
-                        "SUSPENDIDA",
-                    ],
-                ),
+    anios, meses = set(), set()
+    # clave sin mayúsculas/espacios finales -> primer valor visto (como DISTINCT en MySQL _ci)
+    textos = {c: {} for c in OPORTUNIDADES_FACETAS_TEXTO}
+    fechas = {c: set() for c in OPORTUNIDADES_FACETAS_FECHA}
 
-                "resultado_oferta": _merge_unique_sorted(
-                    distinct_col(Oportunidad.resultado_oferta),
-                    [
-                        "EN ESPERA DEL CLIENTE",
-                    ],
-                ),
+    for row in base.with_entities(*columnas).yield_per(2000):
+        fecha_creacion = row[0]
+        if fecha_creacion is not None:
+            anios.add(fecha_creacion.year)
+            meses.add(fecha_creacion.month)
 
-                "estado_ot": distinct_col(Oportunidad.estado_ot),
-                "ultimo_mes": distinct_col(Oportunidad.ultimo_mes),
-                "calificacion_oportunidad": distinct_col(Oportunidad.calificacion_oportunidad),
-                "fecha_acta_cierre_ot": distinct_date(Oportunidad.fecha_acta_cierre_ot),
-                "fecha_cierre_oportunidad": distinct_date(Oportunidad.fecha_cierre_oportunidad),
-                "tipos": ["GANADA", "ACTIVA", "CERRADA"],
-            }
-        ), 200
+        for i, c in enumerate(OPORTUNIDADES_FACETAS_TEXTO, start=1):
+            v = row[i]
+            if v is None or not str(v).strip():
+                continue
+            textos[c].setdefault(str(v).rstrip().upper(), v)
+
+        for i, c in enumerate(OPORTUNIDADES_FACETAS_FECHA, start=1 + len(OPORTUNIDADES_FACETAS_TEXTO)):
+            v = row[i]
+            if v is not None:
+                fechas[c].add(v.strftime("%Y-%m-%d") if hasattr(v, "strftime") else str(v)[:10])
+
+    def lista(c):
+        return [v for _k, v in sorted(textos[c].items())]
+
+    return {
+        "anios": sorted(anios),
+        "meses": sorted(meses),
+        "direccion_comercial": lista("direccion_comercial"),
+        "gerencia_comercial": lista("gerencia_comercial"),
+        "nombre_cliente": _merge_unique_sorted(distinct_clientes_model(), lista("nombre_cliente")),
+        "servicio": lista("servicio"),
+        "estado_oferta": _merge_unique_sorted(
+            lista("estado_oferta"),
+            [
+                "EN ESPERA DEL RFI / RFP",
+                "RFI PRESENTADO",
+                "SUSPENDIDA",
+            ],
+        ),
+        "resultado_oferta": _merge_unique_sorted(
+            lista("resultado_oferta"),
+            [
+                "EN ESPERA DEL CLIENTE",
+            ],
+        ),
+        "estado_ot": lista("estado_ot"),
+        "ultimo_mes": lista("ultimo_mes"),
+        "calificacion_oportunidad": lista("calificacion_oportunidad"),
+        "fecha_acta_cierre_ot": sorted(fechas["fecha_acta_cierre_ot"]),
+        "fecha_cierre_oportunidad": sorted(fechas["fecha_cierre_oportunidad"]),
+        "tipos": ["GANADA", "ACTIVA", "CERRADA"],
+    }
+
+
+def _facetas_oportunidades(detalle_ots):
+    version = version_compartida(db.session, "oportunidades", ttl=5)
+    cached = _OPORTUNIDADES_FACETAS_CACHE.get(detalle_ots)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    facetas = _calcular_facetas_oportunidades(detalle_ots)
+    _OPORTUNIDADES_FACETAS_CACHE.set(detalle_ots, (version, facetas))
+    return facetas
+
+
+@bp.route("/oportunidades/filters", methods=["GET"])
+@permission_required("OPORTUNIDADES_VER")
+def oportunidades_filters():
+    try:
+        # TABLA PRINCIPAL: sin exclusión
+        detalle_ots = _request_bool_arg("detalle_ots", "solo_ots")
+        return jsonify(_facetas_oportunidades(detalle_ots)), 200
 
     except Exception:
         return jsonify({
@@ -4191,10 +4643,84 @@ def oportunidades_filters():
         }), 500
 
 
+OPORTUNIDADES_LISTA_LIMITE = 5000
+OPORTUNIDADES_PER_PAGE_MAX = 1000
+
+# Columnas sombra de filtrado: no forman parte de la API
+_OPORTUNIDAD_COLUMNAS_INTERNAS = {"estado_oferta_norm", "resultado_oferta_norm", "estado_excluido"}
+OPORTUNIDAD_CAMPOS_API = tuple(
+    c.name for c in Oportunidad.__table__.columns if c.name not in _OPORTUNIDAD_COLUMNAS_INTERNAS
+)
+
+
+def _oportunidades_campos(valor):
+    """?fields=a,b -> campos validados (id siempre incluido); vacío = todos."""
+    pedidos = [f.strip() for f in str(valor or "").split(",") if f.strip()]
+    if not pedidos:
+        return list(OPORTUNIDAD_CAMPOS_API)
+
+    desconocidos = [f for f in pedidos if f not in OPORTUNIDAD_CAMPOS_API]
+    if desconocidos:
+        raise ValueError(f"fields inválidos: {', '.join(desconocidos)}")
+
+    campos = ["id"]
+    for f in pedidos:
+        if f not in campos:
+            campos.append(f)
+    return campos
+
+
+def _oportunidades_filas(query, campos, yield_per=None):
+    """
+    Dicts como normalize_oportunidad_dict(o.to_dict()) pero leyendo sólo
+    `campos` en SQL. resultado_oferta depende de estado_oferta, así que se
+    lee aunque no se pida.
+    """
+    seleccion = list(campos)
+    if "resultado_oferta" in campos and "estado_oferta" not in campos:
+        seleccion.append("estado_oferta")
+
+    q = query.with_entities(*[getattr(Oportunidad, c) for c in seleccion])
+    rows = q.yield_per(yield_per) if yield_per else q.all()
+    for row in rows:
+        d = normalize_oportunidad_dict(dict(zip(seleccion, row)))
+        yield {c: d.get(c) for c in campos}
+
+
+def _oportunidades_cursor_encode(oportunidad_id):
+    return base64.urlsafe_b64encode(str(int(oportunidad_id)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _oportunidades_cursor_decode(cursor):
+    """Devuelve el último id visto o None para la primera página."""
+    cursor = str(cursor or "").strip()
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8"))
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
 @bp.route("/oportunidades", methods=["GET"])
 @permission_required("OPORTUNIDADES_VER")
 def listar_oportunidades():
+    """
+    Sin parámetros extra   -> lista (máx. 5000, X-Truncado: 1 si hay más)
+    ?cursor=&per_page=     -> {"data", "per_page", "next_cursor"} keyset por id DESC
+    ?format=ndjson         -> todas las filas en streaming
+    ?fields=a,b,c          -> sólo esas columnas (en cualquier modo)
+    """
     try:
+        formato = (request.args.get("format") or "json").strip().lower()
+        if formato not in ("json", "ndjson"):
+            return jsonify({"mensaje": "format inválido (json|ndjson)"}), 400
+
+        try:
+            campos = _oportunidades_campos(request.args.get("fields"))
+        except ValueError as e:
+            return jsonify({"mensaje": str(e)}), 400
+
         query = Oportunidad.query
         query = _apply_oportunidades_filters(query, apply_exclusion=False)
 
@@ -4202,8 +4728,43 @@ def listar_oportunidades():
             query = _apply_detalle_ots_scope(query)
 
         query = query.order_by(Oportunidad.id.desc())
-        data = [normalize_oportunidad_dict(o.to_dict()) for o in query.limit(5000).all()]
-        return jsonify(data), 200
+
+        if formato == "ndjson":
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            return _stream_ndjson_response(
+                _oportunidades_filas(query, campos, yield_per=2000),
+                f"oportunidades_{stamp}.ndjson",
+            )
+
+        # ?cursor= (vacío para la primera página) activa la paginación keyset sobre id
+        if "cursor" in request.args:
+            try:
+                ultimo_id = _oportunidades_cursor_decode(request.args.get("cursor"))
+                per_page = int(request.args.get("per_page", 100))
+            except ValueError as e:
+                return jsonify({"mensaje": str(e)}), 400
+            per_page = min(max(per_page, 1), OPORTUNIDADES_PER_PAGE_MAX)
+
+            if ultimo_id is not None:
+                query = query.filter(Oportunidad.id < ultimo_id)
+
+            data = list(_oportunidades_filas(query.limit(per_page + 1), campos))
+            next_cursor = None
+            if len(data) > per_page:
+                data = data[:per_page]
+                next_cursor = _oportunidades_cursor_encode(data[-1]["id"])
+
+            return jsonify({
+                "data": data,
+                "per_page": per_page,
+                "next_cursor": next_cursor,
+            }), 200
+
+        data = list(_oportunidades_filas(query.limit(OPORTUNIDADES_LISTA_LIMITE + 1), campos))
+        resp = jsonify(data[:OPORTUNIDADES_LISTA_LIMITE])
+        if len(data) > OPORTUNIDADES_LISTA_LIMITE:
+            resp.headers["X-Truncado"] = "1"
+        return resp, 200
 
     except Exception:
         return jsonify({"mensaje": "Error interno en /oportunidades", "trace": traceback.format_exc()}), 500
@@ -4771,6 +5332,7 @@ def crear_permiso():
     p = Permiso(codigo=codigo, descripcion=data.get("descripcion"))
     db.session.add(p)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Permiso creado", "permiso": p.to_dict()}), 201
 
@@ -4780,6 +5342,7 @@ def eliminar_permiso(id):
     p = Permiso.query.get_or_404(id)
     db.session.delete(p)
     db.session.commit()
+    _invalidar_cache_sesiones()
     return jsonify({"mensaje": "Permiso eliminado"}), 200
 
 @bp.route('/roles/<int:rol_id>/permisos', methods=['GET'])
@@ -4809,6 +5372,7 @@ def asignar_permiso_rol(rol_id):
     rp = RolPermiso(rol_id=rol_id, permiso_id=permiso_id)
     db.session.add(rp)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Permiso asignado al rol"}), 201
 
@@ -4822,6 +5386,7 @@ def quitar_permiso_rol(rol_id, permiso_id):
 
     db.session.delete(rp)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Permiso removido del rol"}), 200
 
@@ -4851,6 +5416,7 @@ def asignar_permiso_equipo(equipo_id):
     ep = EquipoPermiso(equipo_id=equipo_id, permiso_id=permiso_id)
     db.session.add(ep)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Permiso asignado al equipo"}), 201
 
@@ -4863,6 +5429,7 @@ def quitar_permiso_equipo(equipo_id, permiso_id):
 
     db.session.delete(ep)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Permiso removido del equipo"}), 200
 
@@ -4897,6 +5464,7 @@ def asignar_permiso_consultor(consultor_id):
     cp = ConsultorPermiso(consultor_id=consultor_id, permiso_id=permiso_id)
     db.session.add(cp)
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=consultor_id)
 
     return jsonify({"mensaje": "Permiso asignado al consultor"}), 201
 
@@ -4909,6 +5477,7 @@ def quitar_permiso_consultor(consultor_id, permiso_id):
 
     db.session.delete(cp)
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=consultor_id)
 
     return jsonify({"mensaje": "Permiso removido del consultor"}), 200
 
@@ -4919,8 +5488,7 @@ def quitar_permiso_consultor(consultor_id, permiso_id):
 
 @bp.route("/ocupaciones", methods=["GET"])
 def listar_ocupaciones():
-    ocupaciones = Ocupacion.query.order_by(Ocupacion.codigo).all()
-    return jsonify([o.to_dict() for o in ocupaciones]), 200
+    return jsonify(list(catalogos()["ocupaciones"].values())), 200
 
 
 @bp.route("/ocupaciones", methods=["POST"])
@@ -4968,8 +5536,7 @@ def eliminar_ocupacion(id):
 
 @bp.route("/tareas", methods=["GET"])
 def listar_tareas():
-    tareas = Tarea.query.order_by(Tarea.codigo).all()
-    return jsonify([t.to_dict() for t in tareas]), 200
+    return jsonify(list(catalogos()["tareas"].values())), 200
 
 
 @bp.route("/tareas", methods=["POST"])
@@ -5227,23 +5794,24 @@ def horas_ocupacion():
 
         C = aliased(Consultor)
         E = aliased(Equipo)
+        R = RegistroResumenDiario
 
-        # horas: usa total_horas si lo llenas, si no, usa tiempo_invertido
-        horas_col = func.coalesce(Registro.total_horas, Registro.tiempo_invertido, 0)
+        # horas: en el rollup ya es COALESCE(total_horas, tiempo_invertido, 0)
+        horas_col = R.horas
 
         q = (
             db.session.query(
                 func.coalesce(Ocupacion.nombre, "SIN OCUPACIÓN").label("ocupacion"),
                 func.coalesce(func.sum(horas_col), 0).label("horas"),
             )
-            .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .select_from(R)
+            .outerjoin(C, R.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
-            .outerjoin(Ocupacion, Registro.ocupacion_id == Ocupacion.id)
+            .outerjoin(Ocupacion, R.ocupacion_id == Ocupacion.id)
         )
 
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(R.consultor_id == consultor_login.id)
         elif scope == "TEAM":
             if not int(val or 0):
                 return jsonify({"error": "Consultor sin equipo asignado"}), 403
@@ -5253,12 +5821,7 @@ def horas_ocupacion():
         # (opcional) filtros por fecha
         desde = (request.args.get("desde") or "").strip()
         hasta = (request.args.get("hasta") or "").strip()
-        if desde and hasta:
-            q = q.filter(Registro.fecha.between(desde, hasta))
-        elif desde:
-            q = q.filter(Registro.fecha >= desde)
-        elif hasta:
-            q = q.filter(Registro.fecha <= hasta)
+        q = _filtro_rango_fecha_registro(q, desde, hasta, R.fecha_date)
 
         q = q.group_by(func.coalesce(Ocupacion.nombre, "SIN OCUPACIÓN"))
         rows = q.order_by(func.sum(horas_col).desc()).all()
@@ -5266,6 +5829,9 @@ def horas_ocupacion():
         out = [{"ocupacion": r.ocupacion, "horas": float(r.horas or 0)} for r in rows]
         return jsonify(out), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         current_app.logger.exception("❌ Error en /horas-ocupacion")
         return jsonify({"error": str(e)}), 500
@@ -5282,6 +5848,7 @@ def quitar_permiso_equipo_por_codigo(equipo_id, codigo):
 
     db.session.delete(ep)
     db.session.commit()
+    _invalidar_cache_sesiones()
     return jsonify({"mensaje": "Permiso removido"}), 200
 
 @bp.route('/consultores/<int:consultor_id>/permisos/codigo/<string:codigo>', methods=['DELETE'])
@@ -5296,6 +5863,7 @@ def quitar_permiso_consultor_por_codigo(consultor_id, codigo):
 
     db.session.delete(cp)
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=consultor_id)
     return jsonify({"mensaje": "Permiso removido"}), 200
 
 # ========== ROLES ==========
@@ -5315,6 +5883,7 @@ def crear_rol():
     rol = Rol(nombre=nombre)
     db.session.add(rol)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Rol creado", "rol": rol.to_dict()}), 201
 
@@ -5331,6 +5900,7 @@ def editar_rol(id):
 
     rol.nombre = nuevo_nombre
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Rol actualizado", "rol": rol.to_dict()}), 200
 
@@ -5345,6 +5915,7 @@ def eliminar_rol(id):
 
     db.session.delete(rol)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Rol eliminado"}), 200
 
@@ -5363,6 +5934,7 @@ def asignar_rol_consultor(id):
 
     consultor.rol_id = rol_id
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=consultor.id)
 
     return jsonify({"mensaje": "Rol asignado correctamente"}), 200
 
@@ -5383,6 +5955,7 @@ def crear_equipo():
     eq = Equipo(nombre=nombre)
     db.session.add(eq)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify(eq.to_dict()), 201
 
@@ -5399,6 +5972,7 @@ def editar_equipo(id):
 
     equipo.nombre = nuevo
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify(equipo.to_dict()), 200
 
@@ -5413,6 +5987,7 @@ def eliminar_equipo(id):
 
     db.session.delete(equipo)
     db.session.commit()
+    _invalidar_cache_sesiones()
 
     return jsonify({"mensaje": "Equipo eliminado"}), 200
 
@@ -5468,6 +6043,7 @@ def asignar_equipo_consultor(id):
 
     cons.equipo_id = equipo_id
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=cons.id)
 
     return jsonify({"mensaje": "Equipo asignado correctamente"}), 200
 
@@ -5477,6 +6053,7 @@ def remover_consultor_equipo(id):
     cons = Consultor.query.get_or_404(id)
     cons.equipo_id = None
     db.session.commit()
+    _invalidar_cache_sesiones(consultor_id=cons.id)
     return jsonify({"mensaje": "Consultor removido del equipo"}), 200
 
 # ========== IMPORTAR REGISTROS DESDE EXCEL ==========
@@ -5676,9 +6253,301 @@ def commit_import_excel():
         "total": len(objs)
     })
 
+# ============================================================
+# STREAMING DE EXPORTACIONES (NDJSON / CSV / XLSX)
+# ============================================================
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _export_cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _stream_ndjson_response(rows, filename=None):
+    def generate():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=_export_cell) + "\n"
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'} if filename else None
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson", headers=headers)
+
+
+def _stream_csv_response(filename, headers, rows, chunk_rows=500):
+    """headers: [(etiqueta, clave)]; rows: iterable de dicts."""
+    def generate():
+        buf = StringIO()
+        writer = csv.writer(buf)
+        yield "\ufeff"  # BOM para que Excel respete UTF-8
+        writer.writerow([h[0] for h in headers])
+
+        pending = 0
+        for row in rows:
+            writer.writerow([_export_cell(row.get(h[1])) for h in headers])
+            pending += 1
+            if pending >= chunk_rows:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+                pending = 0
+
+        yield buf.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _write_only_xlsx_file(sheets, cell=_export_cell, muestra_anchos=0, bordes=False):
+    """
+    Escribe un workbook openpyxl write_only (memoria constante) en un archivo
+    temporal y retorna su ruta. sheets: [{"title", "headers": [(etiqueta, clave)],
+    "rows": iterable de dicts, "widths": {clave: ancho} opcional}].
+
+    cell: conversión de cada valor. muestra_anchos: si > 0, el ancho de las
+    columnas sin "widths" se calcula con las primeras N filas (solo esas se
+    retienen en memoria). bordes: borde fino en todas las celdas y cuerpo
+    alineado arriba con ajuste de texto (un NamedStyle compartido).
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    header_fill = PatternFill("solid", fgColor="DA291C")
+    header_font = Font(color="FFFFFF", bold=True)
+    header_align = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    border = None
+    estilo_cuerpo = None
+
+    if bordes:
+        thin = Side(style="thin", color="E5E7EB")
+        border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        # write_only no aplica estilos de columna a las celdas escritas: cada
+        # celda del cuerpo referencia este estilo con nombre.
+        estilo_cuerpo = NamedStyle(
+            name="export_cuerpo",
+            alignment=Alignment(vertical="top", wrap_text=True),
+            border=border,
+        )
+        wb.add_named_style(estilo_cuerpo)
+
+    def _fila(ws, valores):
+        if estilo_cuerpo is None:
+            return valores
+        celdas = []
+        for valor in valores:
+            celda = WriteOnlyCell(ws, value=valor)
+            celda.style = estilo_cuerpo.name
+            celdas.append(celda)
+        return celdas
+
+    for sheet in sheets:
+        headers = sheet.get("headers") or []
+        widths = dict(sheet.get("widths") or {})
+        rows = iter(sheet.get("rows") or [])
+
+        muestra = []
+        if muestra_anchos > 0:
+            muestra = [
+                [cell(row.get(key)) for _label, key in headers]
+                for row in itertools.islice(rows, muestra_anchos)
+            ]
+            for col_idx, (label, key) in enumerate(headers):
+                if key in widths:
+                    continue
+                max_len = len(str(label))
+                for valores in muestra:
+                    val = valores[col_idx]
+                    if val is not None:
+                        max_len = max(max_len, min(len(str(val)), 70))
+                widths[key] = min(max(max_len + 2, 12), 55)
+
+        ws = wb.create_sheet(title=str(sheet.get("title") or "Hoja")[:31])
+        ws.freeze_panes = "A2"
+
+        for col_idx, (label, key) in enumerate(headers, start=1):
+            width = widths.get(key) or min(max(len(str(label)) + 2, 12), 55)
+            ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+        if headers:
+            ws.auto_filter.ref = f"A1:{get_column_letter(len(headers))}1"
+
+        header_cells = []
+        for label, _key in headers:
+            header_cell = WriteOnlyCell(ws, value=str(label))
+            header_cell.fill = header_fill
+            header_cell.font = header_font
+            header_cell.alignment = header_align
+            if border is not None:
+                header_cell.border = border
+            header_cells.append(header_cell)
+        ws.append(header_cells)
+
+        for valores in muestra:
+            ws.append(_fila(ws, valores))
+        del muestra
+
+        for row in rows:
+            ws.append(_fila(ws, [cell(row.get(key)) for _label, key in headers]))
+
+    tmp = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    tmp.close()
+    try:
+        wb.save(tmp.name)
+    except Exception:
+        os.remove(tmp.name)
+        raise
+    return tmp.name
+
+
+def _stream_xlsx_response(filename, sheets, chunk_size=64 * 1024, cell=_export_cell, muestra_anchos=0, bordes=False):
+    path = _write_only_xlsx_file(sheets, cell=cell, muestra_anchos=muestra_anchos, bordes=bordes)
+
+    def borrar():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def generate():
+        try:
+            with open(path, "rb") as fh:
+                while True:
+                    chunk = fh.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            borrar()
+
+    # call_on_close cubre el caso en que el generador nunca arranca
+    # (cliente que corta antes del cuerpo, HEAD, error previo al envío).
+    try:
+        response = Response(
+            generate(),
+            mimetype=XLSX_MIMETYPE,
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Content-Length": str(os.path.getsize(path)),
+            },
+        )
+    except Exception:
+        borrar()
+        raise
+    response.call_on_close(borrar)
+    return response
+
+
+REGISTROS_EXPORT_COLUMNS = [
+    ("ID", "id"),
+    ("Fecha", "fecha"),
+    ("Módulo", "modulo"),
+    ("Cliente", "cliente"),
+    ("Equipo", "equipo"),
+    ("Nro Caso Cliente", "nroCasoCliente"),
+    ("Nro Caso Interno", "nroCasoInterno"),
+    ("Nro Caso Escalado SAP", "nroCasoEscaladoSap"),
+    ("Ocupación Código", "ocupacion_codigo"),
+    ("Ocupación", "ocupacion_nombre"),
+    ("Tipo Tarea", "tipoTarea"),
+    ("Consultor", "consultor"),
+    ("Usuario", "usuario_consultor"),
+    ("Hora Inicio", "horaInicio"),
+    ("Hora Fin", "horaFin"),
+    ("Tiempo Invertido", "tiempoInvertido"),
+    ("Tiempo Facturable", "tiempoFacturable"),
+    ("Horas Adicionales", "horasAdicionales"),
+    ("Horario Trabajo", "horarioTrabajo"),
+    ("Descripción", "descripcion"),
+    ("Total Horas", "totalHoras"),
+    ("Bloqueado", "bloqueado"),
+    ("OnCall", "oncall"),
+    ("Desborde", "desborde"),
+    ("Actividad Malla", "actividadMalla"),
+    ("Proyecto Código", "proyecto_codigo"),
+    ("Proyecto", "proyecto_nombre"),
+    ("Fase Proyecto", "proyecto_fase"),
+]
+
+
+def _registro_export_row(r):
+    """Fila de proyección de /registros/export -> dict (mismo contrato que el JSON histórico)."""
+    if r.tarea_codigo and r.tarea_nombre:
+        tipo_tarea_str = f"{r.tarea_codigo} - {r.tarea_nombre}"
+    else:
+        tipo_tarea_str = (r.tipo_tarea or "").strip() or None
+
+    equipo_nombre = (r.equipo_relacion or "").strip().upper() or None
+    equipo_horario = equipo_nombre or r.equipo
+    horario_norm = _normalizar_horario_trabajo_por_equipo(r.horario_trabajo, equipo_horario)
+
+    return {
+        "id": r.id,
+        "fecha": r.fecha,
+        "modulo": r.modulo,
+        "cliente": r.cliente,
+        "equipo": equipo_nombre or (r.equipo or "").strip().upper() or "SIN EQUIPO",
+        "nroCasoCliente": r.nro_caso_cliente,
+        "nroCasoInterno": r.nro_caso_interno,
+        "nroCasoEscaladoSap": r.nro_caso_escalado,
+
+        "ocupacion_id": r.ocupacion_id,
+        "ocupacion_codigo": r.ocupacion_codigo,
+        "ocupacion_nombre": r.ocupacion_nombre,
+
+        "tarea_id": r.tarea_id,
+        "tipoTarea": tipo_tarea_str,
+        "tarea": {
+            "id": r.tarea_id,
+            "codigo": r.tarea_codigo,
+            "nombre": r.tarea_nombre,
+        } if r.tarea_pk else None,
+
+        "consultor": r.consultor_nombre,
+        "usuario_consultor": (r.usuario_consultor or "").strip().lower(),
+
+        "horaInicio": r.hora_inicio,
+        "horaFin": r.hora_fin,
+        "tiempoInvertido": r.tiempo_invertido,
+        "tiempoFacturable": r.tiempo_facturable,
+        "horasAdicionales": _horas_adicionales_de(r, equipo_horario),
+        "horarioTrabajo": horario_norm,
+        "horario_trabajo": horario_norm,
+        "descripcion": r.descripcion,
+        "totalHoras": r.total_horas,
+
+        "bloqueado": bool(r.bloqueado),
+        "oncall": r.oncall,
+        "desborde": r.desborde,
+        "actividadMalla": r.actividad_malla,
+
+        "proyecto_id": r.proyecto_id,
+        "fase_proyecto_id": r.fase_proyecto_id,
+
+        "proyecto_codigo": r.proyecto_codigo,
+        "proyecto_nombre": r.proyecto_nombre,
+        "proyecto_fase": r.proyecto_fase,
+    }
+
+
 @bp.route('/registros/export', methods=['GET'])
 def export_registros():
+    """
+    format=json (por defecto) -> {"data": [...], "total": n}
+    format=ndjson|csv|xlsx    -> respuesta en streaming (yield_per), memoria plana
+    """
     try:
+        formato = (request.args.get("format") or "json").strip().lower()
+        if formato not in ("json", "ndjson", "csv", "xlsx"):
+            return jsonify({'error': 'format inválido (json|ndjson|csv|xlsx)'}), 400
+
         usuario = _get_usuario_from_request()
         rol_req = _get_rol_from_request()
 
@@ -5702,23 +6571,45 @@ def export_registros():
 
         C = aliased(Consultor)
         E = aliased(Equipo)
+        T = aliased(Tarea)
+        O = aliased(Ocupacion)
+        P = aliased(Proyecto)
+        F = aliased(ProyectoFase)
 
+        # Proyección: sin objetos ORM ni eager loads, apta para yield_per.
         q = (
-            Registro.query
-            .options(
-                joinedload(Registro.consultor).joinedload(Consultor.equipo_obj),
-                joinedload(Registro.tarea),
-                joinedload(Registro.ocupacion),
-                joinedload(Registro.proyecto),
-                joinedload(Registro.fase_proyecto),
+            db.session.query(
+                Registro.id, Registro.fecha, Registro.modulo, Registro.cliente, Registro.equipo,
+                Registro.nro_caso_cliente, Registro.nro_caso_interno, Registro.nro_caso_escalado,
+                Registro.ocupacion_id, Registro.tarea_id, Registro.tipo_tarea, Registro.usuario_consultor,
+                Registro.hora_inicio, Registro.hora_fin, Registro.tiempo_invertido, Registro.tiempo_facturable,
+                Registro.horas_adicionales, Registro.horas_adicionales_calc,
+                Registro.horario_trabajo, Registro.descripcion, Registro.total_horas,
+                Registro.bloqueado, Registro.oncall, Registro.desborde, Registro.actividad_malla,
+                Registro.proyecto_id, Registro.fase_proyecto_id,
+                C.nombre.label("consultor_nombre"),
+                E.nombre.label("equipo_relacion"),
+                T.id.label("tarea_pk"),
+                T.codigo.label("tarea_codigo"),
+                T.nombre.label("tarea_nombre"),
+                O.codigo.label("ocupacion_codigo"),
+                O.nombre.label("ocupacion_nombre"),
+                P.codigo.label("proyecto_codigo"),
+                P.nombre.label("proyecto_nombre"),
+                F.nombre.label("proyecto_fase"),
             )
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .select_from(Registro)
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
+            .outerjoin(T, Registro.tarea_id == T.id)
+            .outerjoin(O, Registro.ocupacion_id == O.id)
+            .outerjoin(P, Registro.proyecto_id == P.id)
+            .outerjoin(F, Registro.fase_proyecto_id == F.id)
         )
 
         # Scope
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -5781,23 +6672,17 @@ def export_registros():
                     return jsonify({'error': 'No autorizado para consultar otro equipo'}), 403
             q = q.filter(func.upper(E.nombre) == filtro_equipo)
 
-        if filtro_mes:
-            try:
-                q = q.filter(extract("month", cast(Registro.fecha, db.Date)) == int(filtro_mes))
-            except Exception:
-                pass
-
-        if filtro_anio:
-            try:
-                q = q.filter(extract("year", cast(Registro.fecha, db.Date)) == int(filtro_anio))
-            except Exception:
-                pass
+        q = _filtro_mes_anio_registro(q, filtro_mes, filtro_anio)
 
         if filtro_nro_caso:
             q = q.filter(Registro.nro_caso_cliente.ilike(f"%{filtro_nro_caso}%"))
 
         if filtro_horas_adic:
-            q = q.filter(func.upper(Registro.horas_adicionales).in_(filtro_horas_adic))
+            q = q.filter(
+                func.upper(
+                    func.coalesce(Registro.horas_adicionales_calc, Registro.horas_adicionales)
+                ).in_(filtro_horas_adic)
+            )
 
         if filtro_tarea_ids:
             q = q.filter(Registro.tarea_id.in_(filtro_tarea_ids))
@@ -5805,89 +6690,28 @@ def export_registros():
         if filtro_ocupacion_ids:
             q = q.filter(Registro.ocupacion_id.in_(filtro_ocupacion_ids))
 
-        registros = q.order_by(Registro.fecha.desc(), Registro.id.desc()).all()
-
-        data = []
-        for r in registros:
-            tarea = getattr(r, "tarea", None)
-            ocup = getattr(r, "ocupacion", None)
-
-            if tarea and getattr(tarea, "codigo", None) and getattr(tarea, "nombre", None):
-                tipo_tarea_str = f"{tarea.codigo} - {tarea.nombre}"
-            else:
-                tipo_tarea_str = (r.tipo_tarea or "").strip() or None
-
-            equipo_nombre = None
-            if r.consultor and getattr(r.consultor, "equipo_obj", None):
-                equipo_nombre = (r.consultor.equipo_obj.nombre or "").strip().upper()
-
-            proyecto = getattr(r, "proyecto", None)
-            fase_proyecto = getattr(r, "fase_proyecto", None)
-
-            data.append({
-                "id": r.id,
-                "fecha": r.fecha,
-                "modulo": r.modulo,
-                "cliente": r.cliente,
-                "equipo": equipo_nombre or (r.equipo or "").strip().upper() or "SIN EQUIPO",
-                "nroCasoCliente": r.nro_caso_cliente,
-                "nroCasoInterno": r.nro_caso_interno,
-                "nroCasoEscaladoSap": r.nro_caso_escalado,
-
-                "ocupacion_id": r.ocupacion_id,
-                "ocupacion_codigo": ocup.codigo if ocup else None,
-                "ocupacion_nombre": ocup.nombre if ocup else None,
-
-                "tarea_id": r.tarea_id,
-                "tipoTarea": tipo_tarea_str,
-                "tarea": {
-                    "id": tarea.id,
-                    "codigo": getattr(tarea, "codigo", None),
-                    "nombre": getattr(tarea, "nombre", None),
-                } if tarea else None,
-
-                "consultor": r.consultor.nombre if r.consultor else None,
-                "usuario_consultor": (r.usuario_consultor or "").strip().lower(),
+        q = q.order_by(Registro.fecha.desc(), Registro.id.desc())
 
-                "horaInicio": r.hora_inicio,
-                "horaFin": r.hora_fin,
-                "tiempoInvertido": r.tiempo_invertido,
-                "tiempoFacturable": r.tiempo_facturable,
-                "horasAdicionales": _calcular_horas_adicionales_por_horario(
-                    r.hora_inicio,
-                    r.hora_fin,
-                    getattr(r, "horario_trabajo", None),
-                    equipo_nombre or getattr(r, "equipo", None),
-                    r.horas_adicionales,
-                ),
-                "horarioTrabajo": _normalizar_horario_trabajo_por_equipo(
-                    getattr(r, "horario_trabajo", None),
-                    equipo_nombre or getattr(r, "equipo", None),
-                ),
-                "horario_trabajo": _normalizar_horario_trabajo_por_equipo(
-                    getattr(r, "horario_trabajo", None),
-                    equipo_nombre or getattr(r, "equipo", None),
-                ),
-                "descripcion": r.descripcion,
-                "totalHoras": r.total_horas,
+        if formato == "json":
+            data = [_registro_export_row(r) for r in q.all()]
+            return jsonify({
+                "data": data,
+                "total": len(data)
+            }), 200
 
-                "bloqueado": bool(r.bloqueado),
-                "oncall": r.oncall,
-                "desborde": r.desborde,
-                "actividadMalla": r.actividad_malla,
+        rows = (_registro_export_row(r) for r in q.yield_per(2000))
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-                "proyecto_id": r.proyecto_id,
-                "fase_proyecto_id": r.fase_proyecto_id,
+        if formato == "ndjson":
+            return _stream_ndjson_response(rows, f"registros_{stamp}.ndjson")
 
-                "proyecto_codigo": proyecto.codigo if proyecto else None,
-                "proyecto_nombre": proyecto.nombre if proyecto else None,
-                "proyecto_fase": fase_proyecto.nombre if fase_proyecto else None,
-            })
+        if formato == "csv":
+            return _stream_csv_response(f"registros_{stamp}.csv", REGISTROS_EXPORT_COLUMNS, rows)
 
-        return jsonify({
-            "data": data,
-            "total": len(data)
-        }), 200
+        return _stream_xlsx_response(
+            f"registros_{stamp}.xlsx",
+            [{"title": "Registros", "headers": REGISTROS_EXPORT_COLUMNS, "rows": rows}],
+        )
 
     except Exception as e:
         app.logger.exception("❌ Error en /registros/export")
@@ -5971,12 +6795,12 @@ def registros_filtros():
                 E.nombre.label("equipo")
             )
             .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
         )
 
         if scope == "SELF":
-            base = base.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            base = base.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -6031,19 +6855,20 @@ def registros_conteos():
 
         C = aliased(Consultor)
         E = aliased(Equipo)
+        R = RegistroResumenDiario
 
         q = (
             db.session.query(
                 E.nombre.label("equipo"),
-                func.count(Registro.id).label("count")
+                func.coalesce(func.sum(R.registros), 0).label("count")
             )
-            .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .select_from(R)
+            .outerjoin(C, R.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
         )
 
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(R.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -6058,13 +6883,13 @@ def registros_conteos():
         rows = q.group_by(E.nombre).all()
 
         total_q = (
-            db.session.query(func.count(Registro.id))
-            .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            db.session.query(func.coalesce(func.sum(R.registros), 0))
+            .select_from(R)
+            .outerjoin(C, R.consultor_id == C.id)
         )
 
         if scope == "SELF":
-            total_q = total_q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            total_q = total_q.filter(R.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             total_q = total_q.filter(C.equipo_id == int(val))
@@ -6127,22 +6952,23 @@ def resumen_calendario():
             if equipo_filter != eq_login:
                 return jsonify({'error': 'No autorizado para consultar otro equipo'}), 403
 
-        # base: traer usuario_consultor, nombre consultor, fecha, suma horas
+        # base: traer usuario_consultor, nombre consultor, fecha, suma horas (rollup diario)
+        R = RegistroResumenDiario
         q = (
             db.session.query(
-                func.lower(Registro.usuario_consultor).label("usuario_consultor"),
+                R.usuario_consultor.label("usuario_consultor"),
                 Consultor.nombre.label("consultor"),
-                Registro.fecha.label("fecha"),
-                func.coalesce(func.sum(Registro.total_horas), 0).label("total_horas"),
+                R.fecha_date.label("fecha"),
+                func.coalesce(func.sum(R.total_horas), 0).label("total_horas"),
             )
-            .select_from(Registro)
-            .join(Consultor, func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario))
+            .select_from(R)
+            .join(Consultor, R.consultor_id == Consultor.id)
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
         )
 
         # aplicar scope
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(R.consultor_id == consultor_login.id)
         elif scope == "TEAM":
             q = q.filter(Consultor.equipo_id == int(val))
         elif scope == "ROLE_POOL":
@@ -6153,36 +6979,66 @@ def resumen_calendario():
             q = q.filter(func.upper(Equipo.nombre) == equipo_filter)
 
         # fecha filter
-        if desde and hasta:
-            q = q.filter(Registro.fecha.between(desde, hasta))
-        elif desde:
-            q = q.filter(Registro.fecha >= desde)
-        elif hasta:
-            q = q.filter(Registro.fecha <= hasta)
+        q = _filtro_rango_fecha_registro(q, desde, hasta, R.fecha_date)
 
         # agrupar por consultor+fecha
-        q = q.group_by(func.lower(Registro.usuario_consultor), Consultor.nombre, Registro.fecha)
-        q = q.order_by(Consultor.nombre.asc(), Registro.fecha.asc())
+        q = q.group_by(R.usuario_consultor, Consultor.nombre, R.fecha_date)
+        q = q.order_by(Consultor.nombre.asc(), R.fecha_date.asc())
 
-        rows = q.all()
+        # "fecha" sale como texto YYYY-MM-DD, igual que Registro.fecha
+        rows = [
+            (r.usuario_consultor, r.consultor, r.fecha.strftime("%Y-%m-%d"), r.total_horas)
+            for r in q.all() if r.fecha
+        ]
+
+        # Registros sin fecha_date (texto no parseable) no tienen día en el
+        # rollup: sin rango de fechas se devuelven con su texto original.
+        if not desde and not hasta:
+            qn = (
+                db.session.query(
+                    func.lower(Registro.usuario_consultor).label("usuario_consultor"),
+                    Consultor.nombre.label("consultor"),
+                    Registro.fecha.label("fecha"),
+                    func.coalesce(func.sum(Registro.total_horas), 0).label("total_horas"),
+                )
+                .select_from(Registro)
+                .join(Consultor, Registro.consultor_id == Consultor.id)
+                .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
+                .filter(Registro.fecha_date.is_(None))
+            )
+            if scope == "SELF":
+                qn = qn.filter(Registro.consultor_id == consultor_login.id)
+            elif scope == "TEAM":
+                qn = qn.filter(Consultor.equipo_id == int(val))
+            elif scope == "ROLE_POOL":
+                qn = qn.filter(Consultor.rol_id == int(val))
+            if equipo_filter:
+                qn = qn.filter(func.upper(Equipo.nombre) == equipo_filter)
+
+            qn = qn.group_by(func.lower(Registro.usuario_consultor), Consultor.nombre, Registro.fecha)
+            rows += [(r.usuario_consultor, r.consultor, r.fecha, r.total_horas) for r in qn.all()]
+            rows.sort(key=lambda r: (r[1] or "", r[2] or ""))
 
         # armar respuesta agrupada por consultor
         out = {}
-        for r in rows:
-            key = r.usuario_consultor or "na"
+        for usuario_consultor, consultor, fecha, total_horas in rows:
+            key = usuario_consultor or "na"
             if key not in out:
                 out[key] = {
-                    "consultor": r.consultor or r.usuario_consultor or "—",
-                    "usuario_consultor": r.usuario_consultor,
+                    "consultor": consultor or usuario_consultor or "—",
+                    "usuario_consultor": usuario_consultor,
                     "registros": []
                 }
             out[key]["registros"].append({
-                "fecha": r.fecha,
-                "total_horas": float(r.total_horas or 0),
+                "fecha": fecha,
+                "total_horas": float(total_horas or 0),
             })
 
         return jsonify(list(out.values())), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         app.logger.exception("❌ Error en /resumen-calendario")
         return jsonify({"error": str(e)}), 500
@@ -6237,19 +7093,14 @@ def reporte_costos_cliente_dia():
                 ).label("horas"),
             )
             .select_from(Registro)
-            .join(Consultor, func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario))
+            .join(Consultor, Registro.consultor_id == Consultor.id)
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
         )
 
         # ----------------------------------------------------------
         # 2) Filtros
         # ----------------------------------------------------------
-        if desde and hasta:
-            q = q.filter(Registro.fecha.between(desde, hasta))
-        elif desde:
-            q = q.filter(Registro.fecha >= desde)
-        elif hasta:
-            q = q.filter(Registro.fecha <= hasta)
+        q = _filtro_rango_fecha_registro(q, desde, hasta)
 
         if equipo_filter:
             q = q.filter(func.upper(Equipo.nombre) == equipo_filter)
@@ -6415,6 +7266,9 @@ def reporte_costos_cliente_dia():
             "totalGeneralCosto": total_general_costo,
         }), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         current_app.logger.exception("❌ Error en /reporte/costos-cliente-dia")
         return jsonify({"error": str(e)}), 500
@@ -6539,11 +7393,12 @@ def get_presupuestos_consultor():
             return jsonify({"error": "Scope no permitido"}), 403
 
         consultores = q_cons.order_by(Consultor.nombre.asc()).all()
+        presupuesto_de = _resolver_presupuestos([c.id for c in consultores])
 
         out = []
 
         for c in consultores:
-            presupuesto = _presupuesto_consultor_mes(c.id, anio, mes)
+            presupuesto = presupuesto_de(c.id, anio, mes)
 
             vr_perfil = Decimal("0.00")
             horas_base_mes = Decimal("0.00")
@@ -6556,7 +7411,7 @@ def get_presupuestos_consultor():
                 valor_hora = presupuesto["valor_hora"]
                 dias_habiles_mes = presupuesto["dias_habiles_mes"]
             else:
-                meta_mes = _meta_horas_en_rango(*_month_bounds_local(anio, mes))
+                meta_mes = _meta_horas_mes(anio, mes)
                 horas_base_mes = meta_mes["horas"]
                 dias_habiles_mes = meta_mes["dias_laborables"]
 
@@ -6585,21 +7440,13 @@ def _month_bounds_local(anio: int, mes: int):
     return start, end
 
 
-def _cap_is_standard_workday(d: date, co_holidays=None):
-    co_holidays = co_holidays or set()
-
-    # Lunes=0 ... Domingo=6
-    if d.weekday() >= 5:
-        return False
-
-    if d in co_holidays:
-        return False
-
-    return True
-
-
 def _meta_horas_en_rango(start_date: date, end_date: date):
-    years = {start_date.year, end_date.year}
+    resumen = _calendario_resumen(start_date, end_date)
+    if resumen is not None:
+        return resumen
+
+    # Rango fuera de calendario_laboral: recorrido día a día.
+    years = range(start_date.year, end_date.year + 1)
     co_holidays = _cap_colombia_holidays_for_years(years)
 
     total = Decimal("0.00")
@@ -8381,10 +9228,8 @@ def get_proyecto_costos(proyecto_id):
         key=lambda m: str(m.nombre or "").upper()
     )
 
-    consultor_join_cond = db.or_(
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.usuario)),
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.nombre)),
-    )
+    # consultor_id ya resuelve LOWER(TRIM(usuario)) o nombre al escribir
+    consultor_join_cond = Registro.consultor_id == Consultor.id
 
     rows_filtros = (
         _apply_project_filter_shared(
@@ -9136,10 +9981,8 @@ def get_proyecto_costos_resumen(proyecto_id):
     #    Equipo real tomado desde Consultor.equipo_id -> Equipo.nombre
     #    con fallback a Registro.equipo.
     # ---------------------------------------------------------
-    consultor_join_cond = db.or_(
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.usuario)),
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.nombre)),
-    )
+    # consultor_id ya resuelve LOWER(TRIM(usuario)) o nombre al escribir
+    consultor_join_cond = Registro.consultor_id == Consultor.id
 
     rows_reg_query = _apply_project_filter_shared(
         db.session.query(
@@ -9193,6 +10036,7 @@ def get_proyecto_costos_resumen(proyecto_id):
     )
 
     rows_reg = rows_reg_query.all()
+    presupuesto_de = _resolver_presupuestos({r.consultor_id for r in rows_reg})
 
     detalle_consultores_mes = {}
     periodos_reales_filtrados = set()
@@ -9224,7 +10068,7 @@ def get_proyecto_costos_resumen(proyecto_id):
             presupuesto = None
 
             try:
-                presupuesto = _presupuesto_consultor_mes(consultor_id, anio, mes)
+                presupuesto = presupuesto_de(consultor_id, anio, mes)
             except Exception:
                 presupuesto = None
 
@@ -9732,10 +10576,8 @@ def get_proyecto_costos_graficas(proyecto_id):
     # ---------------------------------------------------------
     # REAL por perfil desde registros del proyecto
     # ---------------------------------------------------------
-    consultor_join_cond = db.or_(
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.usuario)),
-        func.lower(func.trim(Registro.usuario_consultor)) == func.lower(func.trim(Consultor.nombre)),
-    )
+    # consultor_id ya resuelve LOWER(TRIM(usuario)) o nombre al escribir
+    consultor_join_cond = Registro.consultor_id == Consultor.id
 
     rows_reg = (
         _apply_project_filter_shared(
@@ -9747,6 +10589,9 @@ def get_proyecto_costos_graficas(proyecto_id):
         )
         .all()
     )
+    presupuesto_de = _resolver_presupuestos(
+        {consultor.id for _reg, consultor, _eq in rows_reg if consultor}
+    )
 
     for reg, consultor, equipo in rows_reg:
         ry, rm, fecha_ref = _fecha_to_parts(reg.fecha)
@@ -9787,7 +10632,7 @@ def get_proyecto_costos_graficas(proyecto_id):
 
         if consultor and getattr(consultor, "id", None):
             try:
-                presupuesto = _presupuesto_consultor_mes(
+                presupuesto = presupuesto_de(
                     consultor.id,
                     int(ry),
                     int(rm)
@@ -9950,12 +10795,9 @@ def eliminar_modulo(id):
 ##Ruta para graficos de proyectos 
 
 def _registro_fecha_expr():
-    fecha_txt = func.left(func.cast(Registro.fecha, db.String), 10)
-    return func.coalesce(
-        func.str_to_date(fecha_txt, "%Y-%m-%d"),
-        func.str_to_date(fecha_txt, "%d/%m/%Y"),
-        func.str_to_date(fecha_txt, "%d-%m-%Y"),
-    )
+    # Columna DATE nativa: ya contiene el COALESCE(STR_TO_DATE(...)) histórico
+    # (ver parse_fecha_registro) y permite predicados de rango indexables.
+    return Registro.fecha_date
 
 def _safe_float_report(v):
     try:
@@ -10247,7 +11089,7 @@ def reporte_horas_consultor_cliente_detalle():
                 joinedload(Registro.proyecto),
                 joinedload(Registro.fase_proyecto),
             )
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
         )
 
@@ -10255,7 +11097,7 @@ def reporte_horas_consultor_cliente_detalle():
         # Scope
         # -------------------------
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -10671,39 +11513,14 @@ def _cap_weeks_for_month(anio, mes):
         })
 
         idx += 1
-        cursor = week_end + timedelta(days=1)
-
-    return out
-
-
-
-def _cap_is_holiday(fecha_obj, co_holidays):
-    return fecha_obj in co_holidays
-
-
-def _cap_is_standard_workday(fecha_obj, co_holidays):
-    """
-    Regla única para todos:
-    - lunes a viernes
-    - sin festivos de Colombia
-    """
-    if fecha_obj.weekday() > 4:
-        return False
-
-    if _cap_is_holiday(fecha_obj, co_holidays):
-        return False
-
-    return True
-
+        cursor = week_end + timedelta(days=1)
 
-def _cap_meta_hours_for_day(d: date, co_holidays=None):
-    co_holidays = co_holidays or set()
+    return out
 
-    if not _cap_is_standard_workday(d, co_holidays):
-        return Decimal("0.00")
 
-    return Decimal("8.00") if d.weekday() == 0 else Decimal("9.00")
 
+def _cap_is_holiday(fecha_obj, co_holidays):
+    return fecha_obj in co_holidays
 
 
 def _cap_work_days_text():
@@ -10790,20 +11607,18 @@ def resumen_capacidad_semanal():
 
             equipo_filter = eq_login
 
+        R = RegistroResumenDiario
         q = (
             db.session.query(
-                func.lower(Registro.usuario_consultor).label("usuario_consultor"),
+                R.usuario_consultor.label("usuario_consultor"),
                 Consultor.id.label("consultor_id"),
                 Consultor.nombre.label("consultor"),
                 Equipo.nombre.label("equipo"),
-                Registro.fecha.label("fecha"),
-                func.coalesce(func.sum(Registro.total_horas), 0).label("total_horas"),
-            )
-            .select_from(Registro)
-            .join(
-                Consultor,
-                func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario)
+                R.fecha_date.label("fecha"),
+                func.coalesce(func.sum(R.total_horas), 0).label("total_horas"),
             )
+            .select_from(R)
+            .join(Consultor, R.consultor_id == Consultor.id)
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
         )
 
@@ -10814,9 +11629,7 @@ def resumen_capacidad_semanal():
         else:
             return jsonify({"error": "Scope no permitido"}), 403
 
-        q = q.filter(
-            Registro.fecha.between(month_start.isoformat(), month_end.isoformat())
-        )
+        q = q.filter(R.fecha_date.between(month_start, month_end))
 
         if equipo_filter:
             q = q.filter(func.upper(Equipo.nombre) == equipo_filter)
@@ -10825,14 +11638,14 @@ def resumen_capacidad_semanal():
             q = q.filter(func.lower(Consultor.nombre).like(f"%{consultor_filter}%"))
 
         q = q.group_by(
-            func.lower(Registro.usuario_consultor),
+            R.usuario_consultor,
             Consultor.id,
             Consultor.nombre,
             Equipo.nombre,
-            Registro.fecha,
+            R.fecha_date,
         ).order_by(
             Consultor.nombre.asc(),
-            Registro.fecha.asc(),
+            R.fecha_date.asc(),
         )
 
         raw = q.all()
@@ -10843,7 +11656,7 @@ def resumen_capacidad_semanal():
             consultor_id = int(r.consultor_id) if r.consultor_id else None
             key = consultor_id or (r.usuario_consultor or "na")
 
-            fecha_obj = _cap_parse_iso_date(r.fecha)
+            fecha_obj = r.fecha
             if not fecha_obj:
                 continue
 
@@ -10858,28 +11671,21 @@ def resumen_capacidad_semanal():
             horas = float(r.total_horas or 0)
             grouped[key]["diasHoras"][fecha_obj.isoformat()] += horas
 
+        # La meta del mes y por día es la misma para todos los consultores.
+        meta_info_mes = _meta_horas_en_rango(month_start, month_end)
+        meta_por_dia = {
+            d: round(_cap_meta_hours_for_day(d, co_holidays), 2)
+            for d in _daterange(month_start, month_end)
+        }
+
         rows_out = []
 
         for _, item in grouped.items():
             equipo_kind = _cap_team_kind(item["equipo"])
 
-            meta_mes = 0.0
-            dias_laborables_mes = 0
-            dias_festivos_mes = 0
-
-            cursor = month_start
-            while cursor <= month_end:
-                if cursor.weekday() <= 4 and _cap_is_holiday(cursor, co_holidays):
-                    dias_festivos_mes += 1
-
-                meta_dia = _cap_meta_hours_for_day(cursor, co_holidays)
-                if meta_dia > 0:
-                    meta_mes += meta_dia
-                    dias_laborables_mes += 1
-
-                cursor += timedelta(days=1)
-
-            meta_mes = round(meta_mes, 2)
+            meta_mes = round(float(meta_info_mes["horas"]), 2)
+            dias_laborables_mes = meta_info_mes["dias_laborables"]
+            dias_festivos_mes = meta_info_mes["dias_festivos"]
 
             horas_mes = round(
                 sum(float(v or 0) for v in item["diasHoras"].values()),
@@ -10897,7 +11703,7 @@ def resumen_capacidad_semanal():
                 while cursor <= wk["end"]:
                     fecha_key = cursor.isoformat()
                     horas_dia = round(float(item["diasHoras"].get(fecha_key, 0)), 2)
-                    meta_dia = round(_cap_meta_hours_for_day(cursor, co_holidays), 2)
+                    meta_dia = meta_por_dia[cursor]
 
                     es_laborable = meta_dia > 0
 
@@ -11043,12 +11849,12 @@ def capacidad_semanal_ocupaciones():
             .select_from(Registro)
             .join(
                 Consultor,
-                func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario)
+                Registro.consultor_id == Consultor.id
             )
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
             .outerjoin(Ocupacion, Registro.ocupacion_id == Ocupacion.id)
-            .filter(Registro.fecha >= month_start.isoformat())
-            .filter(Registro.fecha <= month_end.isoformat())
+            .filter(Registro.fecha_date >= month_start)
+            .filter(Registro.fecha_date <= month_end)
         )
 
         if scope == "TEAM":
@@ -11344,89 +12150,225 @@ def _cap_meta_hours_for_day(d: date, co_holidays=None):
 
     return 8.0 if d.weekday() == 0 else 9.0
 
+@lru_cache(maxsize=64)
+def _festivos_co_anio(anio: int):
+    return frozenset(holidays.CO(years=[int(anio)]).keys())
+
+
 def _cap_colombia_holidays_for_years(years):
-    import holidays
-    out = set()
+    """Festivos CO de los años pedidos + días no laborables de la empresa."""
+    out = set(_calendario_snapshot()["no_laborables_empresa"])
     for y in set(int(x) for x in years):
-        for h in holidays.CO(years=[y]).keys():
-            out.add(h)
+        out |= _festivos_co_anio(y)
     return out
 
-def _presupuesto_consultor_mes(consultor_id: int, anio: int, mes: int):
+
+_CALENDARIO_CACHE = TTLCache(maxsize=1, ttl=300)
+
+# El CLI regenera la tabla desde otro proceso: el TTL acota ese caso.
+version_on_write("calendario", CalendarioLaboral, DiaNoLaborableEmpresa)
+
+
+def _calendario_snapshot():
+    """Acumulados de calendario_laboral en memoria, indexados por días desde `inicio`."""
+    version = data_versions.get("calendario")
+    cached = _CALENDARIO_CACHE.get("snapshot")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    filas = (
+        db.session.query(
+            CalendarioLaboral.fecha,
+            CalendarioLaboral.meta_horas_acum,
+            CalendarioLaboral.dias_laborables_acum,
+            CalendarioLaboral.dias_festivos_acum,
+        )
+        .order_by(CalendarioLaboral.fecha.asc())
+        .all()
+    )
+    empresa = frozenset(f for (f,) in db.session.query(DiaNoLaborableEmpresa.fecha).all())
+
+    inicio = filas[0].fecha if filas else None
+    acum = []
+    for i, f in enumerate(filas):
+        if (f.fecha - inicio).days != i:
+            # Huecos en la tabla: se ignora y se calcula día a día.
+            app.logger.warning("calendario_laboral no es contiguo en %s; se ignora", f.fecha)
+            inicio, acum = None, []
+            break
+        acum.append((Decimal(str(f.meta_horas_acum or 0)), int(f.dias_laborables_acum or 0), int(f.dias_festivos_acum or 0)))
+
+    snapshot = {"inicio": inicio, "acum": acum, "no_laborables_empresa": empresa}
+    _CALENDARIO_CACHE.set("snapshot", (version, snapshot))
+    return snapshot
+
+
+def _calendario_resumen(desde: date, hasta: date):
+    """Meta/días de [desde, hasta] en O(1); None si el rango no está en calendario_laboral."""
+    snap = _calendario_snapshot()
+    inicio, acum = snap["inicio"], snap["acum"]
+
+    if hasta < desde:
+        return {"horas": Decimal("0.00"), "dias_laborables": 0, "dias_festivos": 0}
+
+    if not inicio or desde < inicio or (hasta - inicio).days >= len(acum):
+        return None
+
+    fin = acum[(hasta - inicio).days]
+    previo = acum[(desde - inicio).days - 1] if desde > inicio else (Decimal("0.00"), 0, 0)
+
+    return {
+        "horas": (fin[0] - previo[0]).quantize(Decimal("0.01")),
+        "dias_laborables": fin[1] - previo[1],
+        "dias_festivos": fin[2] - previo[2],
+    }
+
+
+def _filas_calendario_laboral(desde: date, hasta: date):
+    """Filas para CalendarioLaboral en [desde, hasta], acumulando desde `desde`."""
+    empresa = {
+        f for (f,) in db.session.query(DiaNoLaborableEmpresa.fecha)
+        .filter(DiaNoLaborableEmpresa.fecha.between(desde, hasta))
+        .all()
+    }
+    festivos = set()
+    for y in range(desde.year, hasta.year + 1):
+        festivos |= _festivos_co_anio(y)
+
+    no_laborables = festivos | empresa
+    meta_acum = Decimal("0.00")
+    laborables_acum = 0
+    festivos_acum = 0
+    filas = []
+
+    for d in _daterange(desde, hasta):
+        meta = Decimal(str(_cap_meta_hours_for_day(d, no_laborables))).quantize(Decimal("0.01"))
+        if meta > 0:
+            laborables_acum += 1
+            meta_acum += meta
+        elif d.weekday() < 5 and d in no_laborables:
+            festivos_acum += 1
+
+        filas.append({
+            "fecha": d,
+            "es_laborable": meta > 0,
+            "es_festivo": d in festivos,
+            "es_no_laborable_empresa": d in empresa,
+            "meta_horas": meta,
+            "meta_horas_acum": meta_acum,
+            "dias_laborables_acum": laborables_acum,
+            "dias_festivos_acum": festivos_acum,
+        })
+
+    return filas
+
+
+def _meta_horas_mes(anio: int, mes: int):
+    return _meta_horas_en_rango(*_month_bounds_local(anio, mes))
+
+
+def _elegir_presupuesto(filas, anio: int, mes: int):
     """
-    Regla:
-    1. Busca presupuesto exacto del periodo.
-    2. Si no existe, busca el último presupuesto anterior o igual al periodo.
-    3. Si tampoco existe, usa el último presupuesto disponible del consultor.
-    4. horas_base_mes SIEMPRE se recalcula con el mes solicitado.
+    Regla (filas = presupuestos de un consultor ordenados por anio, mes, id):
+    1. Presupuesto exacto del periodo (vigente primero).
+    2. Si no existe, el último presupuesto anterior o igual al periodo.
+    3. Si tampoco existe, el último disponible del consultor (vigente primero).
     """
+    exactos = [f for f in filas if f.anio == anio and f.mes == mes]
+    if exactos:
+        return max(exactos, key=lambda f: (bool(f.vigente), f.id))
 
-    row = (
-        ConsultorPresupuesto.query
-        .filter(ConsultorPresupuesto.consultor_id == consultor_id)
-        .filter(ConsultorPresupuesto.anio == anio)
-        .filter(ConsultorPresupuesto.mes == mes)
-        .order_by(ConsultorPresupuesto.vigente.desc(), ConsultorPresupuesto.id.desc())
-        .first()
-    )
+    k = bisect_left([(f.anio, f.mes) for f in filas], (anio, mes + 1))
+    if k:
+        return filas[k - 1]
 
-    if not row:
-        row = (
-            ConsultorPresupuesto.query
-            .filter(ConsultorPresupuesto.consultor_id == consultor_id)
-            .filter(
-                or_(
-                    ConsultorPresupuesto.anio < anio,
-                    and_(
-                        ConsultorPresupuesto.anio == anio,
-                        ConsultorPresupuesto.mes <= mes
-                    )
-                )
+    if filas:
+        return max(filas, key=lambda f: (bool(f.vigente), f.anio, f.mes, f.id))
+
+    return None
+
+
+def _resolver_presupuestos(consultor_ids):
+    """
+    Carga en una sola consulta todos los ConsultorPresupuesto de `consultor_ids`
+    y devuelve resolver(consultor_id, anio, mes) -> presupuesto | None,
+    memorizado por (consultor_id, anio, mes).
+    horas_base_mes SIEMPRE se recalcula con el mes solicitado.
+    """
+    por_consultor = defaultdict(list)
+
+    def _cargar(ids):
+        ids = {int(x) for x in ids if x}
+        if not ids:
+            return
+        filas = (
+            db.session.query(
+                ConsultorPresupuesto.id,
+                ConsultorPresupuesto.consultor_id,
+                ConsultorPresupuesto.anio,
+                ConsultorPresupuesto.mes,
+                ConsultorPresupuesto.vr_perfil,
+                ConsultorPresupuesto.vigente,
             )
+            .filter(ConsultorPresupuesto.consultor_id.in_(ids))
             .order_by(
-                ConsultorPresupuesto.anio.desc(),
-                ConsultorPresupuesto.mes.desc(),
-                ConsultorPresupuesto.id.desc()
+                ConsultorPresupuesto.consultor_id,
+                ConsultorPresupuesto.anio,
+                ConsultorPresupuesto.mes,
+                ConsultorPresupuesto.id,
             )
-            .first()
+            .all()
         )
+        for f in filas:
+            por_consultor[f.consultor_id].append(f)
+        cargados.update(ids)
 
-    if not row:
-        row = (
-            ConsultorPresupuesto.query
-            .filter(ConsultorPresupuesto.consultor_id == consultor_id)
-            .order_by(
-                ConsultorPresupuesto.vigente.desc(),
-                ConsultorPresupuesto.anio.desc(),
-                ConsultorPresupuesto.mes.desc(),
-                ConsultorPresupuesto.id.desc()
-            )
-            .first()
-        )
+    cargados = set()
+    resueltos = {}
+    _cargar(consultor_ids)
 
-    if not row:
-        return None
+    def resolver(consultor_id, anio, mes):
+        consultor_id, anio, mes = int(consultor_id), int(anio), int(mes)
+        key = (consultor_id, anio, mes)
+        if key in resueltos:
+            return resueltos[key]
 
-    meta_mes = _meta_horas_en_rango(*_month_bounds_local(anio, mes))
-    horas_base_mes = meta_mes["horas"]
-    dias_habiles_mes = meta_mes["dias_laborables"]
+        if consultor_id not in cargados:
+            _cargar([consultor_id])
 
-    vr = Decimal(str(row.vr_perfil or 0)).quantize(Decimal("0.01"))
-    valor_hora = Decimal("0.00")
+        row = _elegir_presupuesto(por_consultor.get(consultor_id, []), anio, mes)
+        presupuesto = None
 
-    if horas_base_mes > 0:
-        valor_hora = (vr / horas_base_mes).quantize(
-            Decimal("0.01"),
-            rounding=ROUND_HALF_UP
-        )
+        if row:
+            meta_mes = _meta_horas_mes(anio, mes)
+            horas_base_mes = meta_mes["horas"]
 
-    return {
-        "row": row,
-        "vr_perfil": vr,
-        "horas_base_mes": horas_base_mes,
-        "valor_hora": valor_hora,
-        "dias_habiles_mes": dias_habiles_mes,
-    }
+            vr = Decimal(str(row.vr_perfil or 0)).quantize(Decimal("0.01"))
+            valor_hora = Decimal("0.00")
+
+            if horas_base_mes > 0:
+                valor_hora = (vr / horas_base_mes).quantize(
+                    Decimal("0.01"),
+                    rounding=ROUND_HALF_UP
+                )
+
+            presupuesto = {
+                "row": row,
+                "vr_perfil": vr,
+                "horas_base_mes": horas_base_mes,
+                "valor_hora": valor_hora,
+                "dias_habiles_mes": meta_mes["dias_laborables"],
+            }
+
+        resueltos[key] = presupuesto
+        return presupuesto
+
+    return resolver
+
+
+def _presupuesto_consultor_mes(consultor_id: int, anio: int, mes: int):
+    """Consulta puntual; para varios consultores/periodos usar _resolver_presupuestos."""
+    return _resolver_presupuestos([consultor_id])(consultor_id, anio, mes)
 
 def _cost_parse_periodo_request():
     """
@@ -11791,7 +12733,7 @@ def resumen_costo_consultor():
                 Consultor.nombre.label("consultor"),
                 Consultor.usuario.label("usuario_consultor"),
                 Equipo.nombre.label("equipo"),
-                func.substr(func.cast(Registro.fecha, db.String), 1, 7).label("periodo"),
+                func.date_format(Registro.fecha_date, "%Y-%m").label("periodo"),
                 func.coalesce(
                     func.sum(
                         func.coalesce(Registro.tiempo_invertido, Registro.total_horas, 0)
@@ -11802,11 +12744,11 @@ def resumen_costo_consultor():
             .select_from(Registro)
             .join(
                 Consultor,
-                func.lower(Registro.usuario_consultor) == func.lower(Consultor.usuario)
+                Registro.consultor_id == Consultor.id
             )
             .outerjoin(Equipo, Consultor.equipo_id == Equipo.id)
-            .filter(Registro.fecha >= desde.isoformat())
-            .filter(Registro.fecha <= hasta.isoformat())
+            .filter(Registro.fecha_date >= desde)
+            .filter(Registro.fecha_date <= hasta)
         )
 
         if ocupacion_ids:
@@ -11853,10 +12795,11 @@ def resumen_costo_consultor():
             Consultor.nombre,
             Consultor.usuario,
             Equipo.nombre,
-            func.substr(func.cast(Registro.fecha, db.String), 1, 7),
+            func.date_format(Registro.fecha_date, "%Y-%m"),
         ).order_by(Consultor.nombre.asc())
 
         raw = q.all()
+        presupuesto_de = _resolver_presupuestos({item.consultor_id for item in raw})
 
         rows_map = {}
         total_horas_general = Decimal("0.00")
@@ -11885,12 +12828,12 @@ def resumen_costo_consultor():
             meta_tramo_info = _meta_horas_en_rango(tramo_inicio, tramo_fin)
             meta_tramo = meta_tramo_info["horas"]
 
-            presupuesto = _presupuesto_consultor_mes(cid, anio, mes)
+            presupuesto = presupuesto_de(cid, anio, mes)
 
             vr_perfil = Decimal("0.00")
             horas_base_mes = Decimal("0.00")
             valor_hora_mes = Decimal("0.00")
-            dias_habiles_mes = _meta_horas_en_rango(*_month_bounds_local(anio, mes))["dias_laborables"]
+            dias_habiles_mes = _meta_horas_mes(anio, mes)["dias_laborables"]
 
             if presupuesto:
                 vr_perfil = presupuesto["vr_perfil"]
@@ -12131,7 +13074,7 @@ def dashboard_costos_resumen():
                 O.nombre.label("ocupacion_nombre"),
             )
             .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
             .outerjoin(O, Registro.ocupacion_id == O.id)
             .filter(fecha_expr >= desde)
@@ -12139,7 +13082,7 @@ def dashboard_costos_resumen():
         )
 
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -12165,6 +13108,7 @@ def dashboard_costos_resumen():
             q = _apply_project_filter_shared(q, int(filtro_proyecto_id))
 
         registros = q.all()
+        presupuesto_de = _resolver_presupuestos({r.consultor_id for r in registros})
 
         resumen_map = {}
         graf_cliente_operativo = defaultdict(lambda: Decimal("0.00"))
@@ -12209,7 +13153,7 @@ def dashboard_costos_resumen():
 
             valor_hora = Decimal("0.00")
             if consultor_id:
-                presupuesto = _presupuesto_consultor_mes(
+                presupuesto = presupuesto_de(
                     consultor_id,
                     int(fecha_reg.year),
                     int(fecha_reg.month),
@@ -12344,9 +13288,8 @@ def dashboard_costos_resumen():
             Oportunidad.mrc.label("mrc"),
         ).filter(
             or_(
-                _sql_norm_estado(Oportunidad.estado_oferta) == _norm_key_for_match("GANADA"),
-                _sql_norm_estado(Oportunidad.estado_oferta) == _norm_key_for_match("OT"),
-                _sql_norm_estado(Oportunidad.resultado_oferta) == _norm_key_for_match("OT"),
+                Oportunidad.estado_oferta_norm.in_([_norm_key_for_match("GANADA"), _norm_key_for_match("OT")]),
+                Oportunidad.resultado_oferta_norm == _norm_key_for_match("OT"),
             )
         )
 
@@ -12727,14 +13670,14 @@ def dashboard_costos_filtros():
                 E.nombre.label("equipo"),
             )
             .select_from(Registro)
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
             .filter(fecha_expr >= desde, fecha_expr <= hasta)
         )
 
         # alcance
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -12923,12 +13866,12 @@ def obtener_proyectos_horas_dashboard():
                 joinedload(Registro.proyecto),
                 joinedload(Registro.fase_proyecto),
             )
-            .outerjoin(C, func.lower(Registro.usuario_consultor) == func.lower(C.usuario))
+            .outerjoin(C, Registro.consultor_id == C.id)
             .outerjoin(E, C.equipo_id == E.id)
         )
 
         if scope == "SELF":
-            q = q.filter(func.lower(Registro.usuario_consultor) == usuario_norm)
+            q = q.filter(Registro.consultor_id == consultor_login.id)
 
         elif scope == "TEAM":
             if not int(val or 0):
@@ -13026,16 +13969,9 @@ def obtener_proyectos_horas_dashboard():
             if m < 1 or m > 12:
                 return jsonify({"error": "mes inválido, usa YYYY-MM"}), 400
 
-            prefijo_mes = f"{y:04d}-{m:02d}"
-
-            q = q.filter(
-                func.substr(func.cast(Registro.fecha, db.String), 1, 7) == prefijo_mes
-            )
+            q = _filtro_mes_anio_registro(q, m, y)
         else:
-            if filtro_desde:
-                q = q.filter(func.cast(Registro.fecha, db.String) >= filtro_desde)
-            if filtro_hasta:
-                q = q.filter(func.cast(Registro.fecha, db.String) <= filtro_hasta)
+            q = _filtro_rango_fecha_registro(q, filtro_desde, filtro_hasta)
 
         if filtro_modulo:
             q = q.filter(func.upper(Registro.modulo) == filtro_modulo.upper())
@@ -13054,16 +13990,15 @@ def obtener_proyectos_horas_dashboard():
 
         if filtro_proyecto_ids:
             try:
-                filtros_proyecto = []
-                for pid in filtro_proyecto_ids:
-                    subq = Registro.query.with_entities(Registro.id)
-                    subq = _apply_project_filter_shared(subq, int(pid))
-                    filtros_proyecto.append(Registro.id.in_(subq))
-
-                q = q.filter(or_(*filtros_proyecto))
+                pids = [int(pid) for pid in filtro_proyecto_ids]
             except Exception:
                 return jsonify({"error": "proyecto_id inválido"}), 400
 
+            q = q.filter(Registro.id.in_(
+                select(RegistroProyectoMatch.registro_id)
+                .where(RegistroProyectoMatch.proyecto_id.in_(pids))
+            ))
+
         q = q.order_by(Registro.fecha.desc(), Registro.id.desc())
 
         tiene_filtro_temporal = bool(
@@ -13137,13 +14072,7 @@ def obtener_proyectos_horas_dashboard():
                 "horaFin": r.hora_fin,
                 "tiempoInvertido": round(horas, 2),
                 "tiempoFacturable": _safe_float_report(r.tiempo_facturable),
-                "horasAdicionales": _calcular_horas_adicionales_por_horario(
-                    r.hora_inicio,
-                    r.hora_fin,
-                    getattr(r, "horario_trabajo", None),
-                    equipo_nombre or getattr(r, "equipo", None),
-                    r.horas_adicionales,
-                ),
+                "horasAdicionales": _horas_adicionales_de(r, equipo_nombre or getattr(r, "equipo", None)),
                 "horarioTrabajo": _normalizar_horario_trabajo_por_equipo(
                     getattr(r, "horario_trabajo", None),
                     equipo_nombre or getattr(r, "equipo", None),
@@ -13183,6 +14112,9 @@ def obtener_proyectos_horas_dashboard():
             "max_rows": max_rows,
         }), 200
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         err = traceback.format_exc()
         app.logger.error(f"❌ Error en /dashboard/proyectos-horas: {e}\n{err}")
@@ -13221,11 +14153,7 @@ def dashboard_proyectos():
         # =========================
         # FILTRO FECHA 🔥
         # =========================
-        if desde:
-            query = query.filter(Registro.fecha >= desde)
-
-        if hasta:
-            query = query.filter(Registro.fecha <= hasta)
+        query = _filtro_rango_fecha_registro(query, desde, hasta)
 
         # =========================
         # FILTROS DINÁMICOS
@@ -13265,6 +14193,9 @@ def dashboard_proyectos():
             "page_size": page_size
         }), 200
 
+    except ValueError as e:
+        return jsonify({"mensaje": str(e)}), 400
+
     except Exception as e:
         return jsonify({"mensaje": str(e)}), 500
 
@@ -13330,6 +14261,7 @@ def cambiar_password():
 
     try:
         db.session.commit()
+        _invalidar_cache_sesiones(consultor_id=consultor.id)
         return jsonify({
             "mensaje": "Contraseña actualizada correctamente"
         }), 200
@@ -16431,12 +17363,17 @@ def _coe_ext_upsert_categoria(modulo, categoria, subcategoria=None, articulo=Non
     return row
 
 
-def _coe_ext_estado_catalogo(estado):
+def _coe_ext_estado_catalogo(estado, memo=None):
+    """(responsable, consolidado) del catálogo; `memo` (dict) evita repetir la consulta por estado."""
     estado_norm = _coe_ext_norm(estado)
 
     if not estado_norm:
         return None, None
 
+    clave = ("estado", estado_norm)
+    if memo is not None and clave in memo:
+        return memo[clave]
+
     row = CoeSapFuncionalCatalogo.query.filter_by(
         tipo="ESTADO_GESTION",
         valor_normalizado=estado_norm
@@ -16448,13 +17385,12 @@ def _coe_ext_estado_catalogo(estado):
             valor_normalizado=estado_norm
         ).first()
 
-    if not row:
-        return None, None
+    resultado = (row.extra_1, row.extra_2) if row else (None, None)
 
-    responsable = row.extra_1
-    consolidado = row.extra_2
+    if memo is not None:
+        memo[clave] = resultado
 
-    return responsable, consolidado
+    return resultado
 
 
 def _coe_ext_manual_fields(row):
@@ -16514,7 +17450,20 @@ def _coe_ext_validacion_fecha(app_fecha, fuente_fecha):
     return "VALIDAR"
 
 
-def _coe_ext_networkdays(fecha_inicio, fecha_fin):
+@lru_cache(maxsize=32)
+def _coe_ext_calendario_habil(feriados=frozenset()):
+    """busdaycalendar lunes-viernes con los festivos dados (conjunto hashable de fechas)."""
+    return np.busdaycalendar(
+        weekmask="1111100",
+        holidays=np.array(sorted(feriados), dtype="datetime64[D]"),
+    )
+
+
+def _coe_ext_networkdays(fecha_inicio, fecha_fin, feriados=frozenset()):
+    """
+    NETWORKDAYS de Excel (días hábiles entre ambas fechas, extremos incluidos)
+    en O(1) con numpy.busday_count. Sin `feriados` cuenta lunes a viernes.
+    """
     if not fecha_inicio or not fecha_fin:
         return None
 
@@ -16525,21 +17474,80 @@ def _coe_ext_networkdays(fecha_inicio, fecha_fin):
         if fin < inicio:
             return 0
 
-        dias = 0
-        actual = inicio
+        return int(np.busday_count(
+            inicio,
+            fin + timedelta(days=1),
+            busdaycal=_coe_ext_calendario_habil(frozenset(feriados)),
+        ))
+    except Exception:
+        return None
 
-        while actual <= fin:
-            if actual.weekday() < 5:
-                dias += 1
 
-            actual += timedelta(days=1)
+def _coe_ext_networkdays_lote(inicios, fines, feriados=frozenset()):
+    """
+    Versión vectorizada de _coe_ext_networkdays para listas paralelas de
+    fechas: una sola llamada a busday_count para todo el lote.
+    """
+    def _dias(valores):
+        return np.array(
+            [v.date() if isinstance(v, datetime) else v for v in valores],
+            dtype="datetime64[D]",
+        )
 
-        return dias
-    except Exception:
-        return None
+    a = _dias(inicios)
+    b = _dias(fines)
+    validos = ~(np.isnat(a) | np.isnat(b))
+    conteo = np.zeros(len(a), dtype=np.int64)
+
+    if validos.any():
+        ai, bi = a[validos], b[validos]
+        n = np.busday_count(
+            ai,
+            bi + np.timedelta64(1, "D"),
+            busdaycal=_coe_ext_calendario_habil(frozenset(feriados)),
+        )
+        conteo[validos] = np.where(bi < ai, 0, n)
+
+    return [int(n) if ok else None for n, ok in zip(conteo.tolist(), validos.tolist())]
+
+
+def _coe_ext_sla_habiles_lote(filas, ahora=None):
+    """
+    Calcula dias_entrega_estimacion de un lote de filas a la vez, con la misma
+    regla de _coe_ext_recalcular_row (día siguiente a la asignación hasta la
+    estimación o hoy).
+    """
+    ahora = ahora or datetime.utcnow()
+    con_asignacion = [f for f in filas if getattr(f, "fecha_asignacion", None)]
+
+    dias = _coe_ext_networkdays_lote(
+        [f.fecha_asignacion + timedelta(days=1) for f in con_asignacion],
+        [getattr(f, "fecha_estimacion", None) or ahora for f in con_asignacion],
+    )
+    for fila, valor in zip(con_asignacion, dias):
+        fila.dias_entrega_estimacion = valor
+
+    return filas
+
+
+def _coe_ext_existe_categoria(memo=None, **valores):
+    """True si el catálogo de categorías tiene una fila con esos valores (comparación en mayúsculas)."""
+    clave = ("categoria",) + tuple(sorted(valores.items()))
+    if memo is not None and clave in memo:
+        return memo[clave]
 
+    existe = CoeSapFuncionalCategoriaCatalogo.query.filter(*[
+        func.upper(getattr(CoeSapFuncionalCategoriaCatalogo, campo)) == valor
+        for campo, valor in valores.items()
+    ]).first() is not None
 
-def _coe_ext_validar_categoria(row):
+    if memo is not None:
+        memo[clave] = existe
+
+    return existe
+
+
+def _coe_ext_validar_categoria(row, memo=None):
     modulo = _coe_ext_str(getattr(row, "modulo", None))
     categoria = _coe_ext_str(getattr(row, "categoria", None))
     subcategoria = _coe_ext_str(getattr(row, "subcategoria", None))
@@ -16551,24 +17559,31 @@ def _coe_ext_validar_categoria(row):
         return
 
     if subcategoria:
-        existe_sub = CoeSapFuncionalCategoriaCatalogo.query.filter(
-            func.upper(CoeSapFuncionalCategoriaCatalogo.modulo) == _coe_ext_norm(modulo),
-            func.upper(CoeSapFuncionalCategoriaCatalogo.categoria) == _coe_ext_norm(categoria),
-            func.upper(CoeSapFuncionalCategoriaCatalogo.subcategoria) == _coe_ext_norm(subcategoria),
-        ).first()
+        existe_sub = _coe_ext_existe_categoria(
+            memo,
+            modulo=_coe_ext_norm(modulo),
+            categoria=_coe_ext_norm(categoria),
+            subcategoria=_coe_ext_norm(subcategoria),
+        )
 
         row.validar_subcategoria = "OK" if existe_sub else "VALIDAR"
 
     if articulo:
-        existe_art = CoeSapFuncionalCategoriaCatalogo.query.filter(
-            func.upper(CoeSapFuncionalCategoriaCatalogo.modulo) == _coe_ext_norm(modulo),
-            func.upper(CoeSapFuncionalCategoriaCatalogo.articulo) == _coe_ext_norm(articulo),
-        ).first()
+        existe_art = _coe_ext_existe_categoria(
+            memo,
+            modulo=_coe_ext_norm(modulo),
+            articulo=_coe_ext_norm(articulo),
+        )
 
         row.validar_articulo = "OK" if existe_art else "VALIDAR"
 
 
-def _coe_ext_recalcular_row(row):
+def _coe_ext_recalcular_row(row, memo=None, calcular_habiles=True):
+    """
+    Recalcula los campos derivados de una fila. `memo` (dict compartido entre
+    filas) cachea las consultas a catálogos; con calcular_habiles=False se omite
+    dias_entrega_estimacion para calcularlo por lote (_coe_ext_sla_habiles_lote).
+    """
     numero = _coe_ext_str(getattr(row, "numero", None))
 
     if numero:
@@ -16604,7 +17619,7 @@ def _coe_ext_recalcular_row(row):
     fecha_estimacion = getattr(row, "fecha_estimacion", None)
     fecha_aprobacion_estimacion = getattr(row, "fecha_aprobacion_estimacion", None)
 
-    if fecha_asignacion:
+    if fecha_asignacion and calcular_habiles:
         row.dias_entrega_estimacion = _coe_ext_networkdays(
             fecha_asignacion + timedelta(days=1),
             fecha_estimacion or datetime.utcnow()
@@ -16652,7 +17667,7 @@ def _coe_ext_recalcular_row(row):
         or getattr(row, "estado", None)
     )
 
-    responsable, consolidado = _coe_ext_estado_catalogo(estado_base)
+    responsable, consolidado = _coe_ext_estado_catalogo(estado_base, memo)
 
     if responsable:
         row.responsable_estado = responsable
@@ -16703,7 +17718,7 @@ def _coe_ext_recalcular_row(row):
         getattr(row, "fecha_finalizacion_cierre_sistema_gestion", None)
     )
 
-    _coe_ext_validar_categoria(row)
+    _coe_ext_validar_categoria(row, memo)
 
     # Clasificación controlada: NO modifica el estado original.
     # Solo enlaza cliente, estado principal y subestado usando listas configuradas.
@@ -16712,95 +17727,323 @@ def _coe_ext_recalcular_row(row):
 
     return row
 
-@bp.route("/coe-sap-funcional/calificacion/generar", methods=["POST"])
-@permission_required("BASE_REGISTRO_IMPORTAR")
-def generar_calificacion_coe_sap_funcional():
-    try:
-        usuario = _calificacion_usuario_actual()
+COE_CALIFICACION_LOTE = 1000
 
-        bases = BaseRegistroInfoCoeSapFuncional.query.all()
 
-        creados = 0
-        actualizados = 0
+class _CoeFilaCalificacion:
+    """Fila de calificación en memoria (los helpers _coe_ext_*/_coe_cfg_* solo usan getattr/setattr)."""
 
-        for base in bases:
-            if not base.numero:
+    def __init__(self, valores):
+        self.__dict__.update(valores)
+
+
+def _coe_calificacion_escalas():
+    """Escala decimal de las columnas Numeric de la calificación (para comparar sin ruido de redondeo)."""
+    return {
+        attr.key: attr.columns[0].type.scale
+        for attr in inspect(CoeSapFuncionalCalificacion).column_attrs
+        if isinstance(attr.columns[0].type, db.Numeric) and attr.columns[0].type.scale is not None
+    }
+
+
+def _coe_calificacion_igual(escala, antes, despues):
+    if antes is None or despues is None:
+        return antes is None and despues is None
+    if escala is not None:
+        try:
+            return round(float(antes), escala) == round(float(despues), escala)
+        except (TypeError, ValueError):
+            return False
+    return antes == despues
+
+
+class _CoeCalificacionBulk:
+    """
+    Upsert masivo de CoeSapFuncionalCalificacion:
+    - carga las filas existentes en una sola consulta (dict por número),
+    - los helpers de sincronización/recálculo trabajan sobre copias en memoria,
+    - guardar() compara contra lo leído y escribe solo las diferencias con
+      bulk_insert_mappings / bulk_update_mappings, haciendo commit por lote.
+    """
+
+    def __init__(self, usuario, tamano_lote=COE_CALIFICACION_LOTE):
+        self.usuario = usuario
+        self.tamano_lote = max(int(tamano_lote or COE_CALIFICACION_LOTE), 1)
+
+        mapper = inspect(CoeSapFuncionalCalificacion)
+        self.campos = [attr.key for attr in mapper.column_attrs]
+        self.escalas = _coe_calificacion_escalas()
+
+        self.originales = {}
+        self.filas = {}
+        self.nuevas = set()
+        self.tocadas = set()
+
+        columnas = [getattr(CoeSapFuncionalCalificacion, c) for c in self.campos]
+        for valores in db.session.query(*columnas).all():
+            valores = dict(zip(self.campos, valores))
+            clave = self._clave(valores["numero"])
+            self.originales[clave] = valores
+            self.filas[clave] = _CoeFilaCalificacion(dict(valores))
+
+    @staticmethod
+    def _clave(numero):
+        # numero es UNIQUE en una columna _ci: mayúsculas para no duplicar
+        return (_coe_ext_str(numero) or "").upper()
+
+    def obtener(self, numero, **iniciales):
+        """Devuelve (fila, creada) para `numero`; None si el número está vacío."""
+        clave = self._clave(numero)
+        if not clave:
+            return None, False
+
+        self.tocadas.add(clave)
+        fila = self.filas.get(clave)
+        if fila is not None:
+            return fila, False
+
+        valores = {c: None for c in self.campos}
+        valores.update(iniciales)
+        valores["numero"] = _coe_ext_str(numero)
+        fila = _CoeFilaCalificacion(valores)
+        self.filas[clave] = fila
+        self.nuevas.add(clave)
+        return fila, True
+
+    def _igual(self, campo, antes, despues):
+        return _coe_calificacion_igual(self.escalas.get(campo), antes, despues)
+
+    def guardar(self):
+        """Escribe las diferencias por lotes. Devuelve {insertados, actualizados, sin_cambios}."""
+        ahora = datetime.utcnow()
+        inserts = []
+        updates = []
+        sin_cambios = 0
+
+        for clave in self.tocadas:
+            fila = self.filas[clave].__dict__
+
+            if clave in self.nuevas:
+                valores = {c: fila.get(c) for c in self.campos if c != "id" and fila.get(c) is not None}
+                valores.setdefault("creado_por", self.usuario)
+                valores.setdefault("actualizado_por", self.usuario)
+                valores.setdefault("created_at", ahora)
+                valores.setdefault("updated_at", ahora)
+                inserts.append(valores)
                 continue
 
-            campos = _calificacion_campos_desde_base(base)
+            original = self.originales[clave]
+            cambios = {
+                c: fila.get(c)
+                for c in self.campos
+                if c != "id" and not self._igual(c, original.get(c), fila.get(c))
+            }
+            if not cambios:
+                sin_cambios += 1
+                continue
 
-            existente = CoeSapFuncionalCalificacion.query.filter_by(
-                numero=base.numero
-            ).first()
+            cambios["id"] = original["id"]
+            cambios["actualizado_por"] = self.usuario
+            cambios["updated_at"] = ahora
+            updates.append(cambios)
 
-            if existente:
-                # Se actualizan solo campos automáticos.
-                # Los manuales se conservan.
-                campos_automaticos = [
-                    "base_registro_id",
-                    "sistema",
-                    "caso_sm",
-                    "sociedad",
-                    "asunto",
-                    "observaciones",
-                    "nombre_solicitante",
-                    "impacto",
-                    "urgencia",
-                    "prioridad",
-                    "tipo_solicitud",
-                    "articulo",
-                    "estado",
-                    "estado_herramienta_gestion",
-                    "responsable_estado",
-                    "estado_consolidado",
-                    "asignado_a",
-                    "fecha_asignacion",
-                    "dia_creacion",
-                    "mes_creacion",
-                    "anio_creacion",
-                    "hora_ultima_actualizacion",
-                    "fecha_resolucion",
-                    "fecha_finalizacion_cierre",
-                    "dia_cierre",
-                    "mes_cierre",
-                    "anio_cierre",
-                    "tiempo_resolucion",
-                    "tiempo_finalizacion_cierre",
-                    "dias_entrega_estimacion",
-                    "mes_estimacion",
-                    "anio_estimacion",
-                    "mes_aprobado_estimacion",
-                    "anio_aprobado_estimacion",
-                    "total_horas_funcionales",
-                    "total_horas_estimadas",
-                    "total_horas_estimadas2",
-                ]
+        n = self.tamano_lote
+        for i in range(0, len(inserts), n):
+            db.session.bulk_insert_mappings(CoeSapFuncionalCalificacion, inserts[i:i + n])
+            db.session.commit()
+
+        for i in range(0, len(updates), n):
+            db.session.bulk_update_mappings(CoeSapFuncionalCalificacion, updates[i:i + n])
+            db.session.commit()
+
+        # bulk_*_mappings no dispara eventos ORM: se versiona tras el último lote.
+        if inserts or updates:
+            bump_compartida(db.engine, "calificacion")
+
+        return {
+            "insertados": len(inserts),
+            "actualizados": len(updates),
+            "sin_cambios": sin_cambios,
+        }
+
+
+def _coe_ext_recalcular_calificaciones(usuario=None, tamano_lote=COE_CALIFICACION_LOTE, ahora=None):
+    """
+    Recalcula los campos derivados de todas las calificaciones sin cargar
+    objetos ORM: lee lotes por id como tuplas, aplica _coe_ext_recalcular_row
+    en memoria (catálogos memorizados, días hábiles por lote) y escribe solo
+    las diferencias con bulk_update_mappings, con commit por lote.
+
+    Devuelve {total, actualizados, sin_cambios, cambiosPorCampo}.
+    """
+    tamano_lote = max(int(tamano_lote or COE_CALIFICACION_LOTE), 1)
+    ahora = ahora or datetime.utcnow()
+
+    campos = [attr.key for attr in inspect(CoeSapFuncionalCalificacion).column_attrs]
+    columnas = [getattr(CoeSapFuncionalCalificacion, c) for c in campos]
+    escalas = _coe_calificacion_escalas()
+    memo = {}
+
+    total = 0
+    actualizados = 0
+    cambios_por_campo = defaultdict(int)
+    ultimo_id = 0
+
+    while True:
+        lote = (
+            db.session.query(*columnas)
+            .filter(CoeSapFuncionalCalificacion.id > ultimo_id)
+            .order_by(CoeSapFuncionalCalificacion.id.asc())
+            .limit(tamano_lote)
+            .all()
+        )
+        if not lote:
+            break
+
+        originales = [dict(zip(campos, valores)) for valores in lote]
+        filas = [_CoeFilaCalificacion(dict(valores)) for valores in originales]
+
+        for fila in filas:
+            _coe_ext_recalcular_row(fila, memo, calcular_habiles=False)
+        _coe_ext_sla_habiles_lote(filas, ahora)
+
+        updates = []
+        for original, fila in zip(originales, filas):
+            nuevos = fila.__dict__
+            cambios = {
+                c: nuevos.get(c)
+                for c in campos
+                if c != "id" and not _coe_calificacion_igual(escalas.get(c), original.get(c), nuevos.get(c))
+            }
+            if not cambios:
+                continue
+
+            for campo in cambios:
+                cambios_por_campo[campo] += 1
+
+            cambios["id"] = original["id"]
+            cambios["actualizado_por"] = usuario
+            cambios["updated_at"] = ahora
+            updates.append(cambios)
+
+        if updates:
+            db.session.bulk_update_mappings(CoeSapFuncionalCalificacion, updates)
+            db.session.commit()
+        else:
+            # libera el snapshot de lectura del lote
+            db.session.rollback()
+
+        total += len(lote)
+        actualizados += len(updates)
+        ultimo_id = originales[-1]["id"]
+
+    # bulk_update_mappings no dispara eventos ORM: se versiona al final.
+    if actualizados:
+        bump_compartida(db.engine, "calificacion")
+
+    return {
+        "total": total,
+        "actualizados": actualizados,
+        "sin_cambios": total - actualizados,
+        "cambiosPorCampo": dict(sorted(cambios_por_campo.items())),
+    }
+
+
+@bp.route("/coe-sap-funcional/calificacion/generar", methods=["POST"])
+@permission_required("BASE_REGISTRO_IMPORTAR")
+def generar_calificacion_coe_sap_funcional():
+    """
+    Body JSON (opcional):
+      modo="recalcular" -> solo recalcula derivados de las calificaciones existentes
+      tamano_lote=n     -> filas por commit (por defecto COE_CALIFICACION_LOTE = 1000)
+    Respuesta: {mensaje, base_registros, creados, actualizados, sin_cambios};
+    con modo="recalcular": {mensaje, total, actualizados, sin_cambios, cambiosPorCampo}.
+    sin_cambios cuenta las calificaciones procesadas que no se escribieron
+    porque sus valores ya coincidían.
+    """
+    try:
+        usuario = _calificacion_usuario_actual()
+        data = request.get_json(silent=True) or {}
 
-                for campo in campos_automaticos:
-                    if campo in campos and hasattr(existente, campo):
-                        setattr(existente, campo, campos[campo])
+        # modo "recalcular": solo recalcula derivados de lo ya existente, sin leer la base.
+        if (_coe_ext_str(data.get("modo")) or "").lower() == "recalcular":
+            resultado = _coe_ext_recalcular_calificaciones(usuario, data.get("tamano_lote"))
+            return jsonify({
+                "mensaje": "Campos derivados de la calificación recalculados correctamente",
+                **resultado,
+            }), 200
+
+        bases = BaseRegistroInfoCoeSapFuncional.query.all()
+        motor = _CoeCalificacionBulk(usuario, data.get("tamano_lote"))
+        memo = {}
+
+        # Se actualizan solo campos automáticos. Los manuales se conservan.
+        campos_automaticos = [
+            "base_registro_id",
+            "sistema",
+            "caso_sm",
+            "sociedad",
+            "asunto",
+            "observaciones",
+            "nombre_solicitante",
+            "impacto",
+            "urgencia",
+            "prioridad",
+            "tipo_solicitud",
+            "articulo",
+            "estado",
+            "estado_herramienta_gestion",
+            "responsable_estado",
+            "estado_consolidado",
+            "asignado_a",
+            "fecha_asignacion",
+            "dia_creacion",
+            "mes_creacion",
+            "anio_creacion",
+            "hora_ultima_actualizacion",
+            "fecha_resolucion",
+            "fecha_finalizacion_cierre",
+            "dia_cierre",
+            "mes_cierre",
+            "anio_cierre",
+            "tiempo_resolucion",
+            "tiempo_finalizacion_cierre",
+            "dias_entrega_estimacion",
+            "mes_estimacion",
+            "anio_estimacion",
+            "mes_aprobado_estimacion",
+            "anio_aprobado_estimacion",
+            "total_horas_funcionales",
+            "total_horas_estimadas",
+            "total_horas_estimadas2",
+        ]
 
-                _coe_ext_recalcular_row(existente)
+        for base in bases:
+            if not base.numero:
+                continue
 
-                existente.actualizado_por = usuario
-                existente.updated_at = datetime.utcnow()
-                actualizados += 1
+            campos = _calificacion_campos_desde_base(base)
+            fila, creada = motor.obtener(base.numero)
 
+            if creada:
+                for campo, valor in campos.items():
+                    if hasattr(fila, campo):
+                        setattr(fila, campo, valor)
             else:
-                campos["creado_por"] = usuario
-                campos["actualizado_por"] = usuario
-                nuevo = CoeSapFuncionalCalificacion(**campos)
-                _coe_ext_recalcular_row(nuevo)
-                db.session.add(nuevo)
-                creados += 1
+                for campo in campos_automaticos:
+                    if campo in campos and hasattr(fila, campo):
+                        setattr(fila, campo, campos[campo])
 
-        db.session.commit()
+            _coe_ext_recalcular_row(fila, memo)
+
+        resultado = motor.guardar()
 
         return jsonify({
             "mensaje": "Calificación generada correctamente desde la base COE SAP Funcional",
             "base_registros": len(bases),
-            "creados": creados,
-            "actualizados": actualizados,
+            "creados": resultado["insertados"],
+            "actualizados": resultado["actualizados"],
+            "sin_cambios": resultado["sin_cambios"],
         }), 200
 
     except Exception as e:
@@ -17907,34 +19150,16 @@ def importar_catalogos_coe_sap_funcional():
 # SINCRONIZACION CALIFICACION
 # ============================================================
 
-def _coe_ext_upsert_calificacion(numero, usuario):
-    numero = _coe_ext_str(numero)
-
-    if not numero:
-        return None, False
-
-    row = CoeSapFuncionalCalificacion.query.filter_by(numero=numero).first()
-
-    if row:
-        return row, False
-
-    row = CoeSapFuncionalCalificacion(
-        numero=numero,
-        sistema=numero[:2],
+def _coe_ext_upsert_calificacion(motor, numero):
+    """Fila existente o nueva (con los valores iniciales de siempre) dentro de `motor`."""
+    return motor.obtener(
+        numero,
+        sistema=(_coe_ext_str(numero) or "")[:2],
         tipo_contrato="BOLSA DE HORAS",
-        creado_por=usuario,
-        actualizado_por=usuario,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow(),
         campos_editados_manual_json=_coe_ext_json_dumps({}),
         origen_datos_json=_coe_ext_json_dumps({}),
     )
 
-    db.session.add(row)
-    db.session.flush()
-
-    return row, True
-
 
 def _coe_ext_sync_desde_base(row, base, modo):
     force = modo == "forzar"
@@ -18013,6 +19238,14 @@ def _coe_ext_sync_desde_fuente(row, fuente_row, modo):
 @bp.route("/coe-sap-funcional/calificacion/sincronizar", methods=["POST"])
 @permission_required("BASE_REGISTRO_IMPORTAR")
 def sincronizar_calificacion_coe_sap_funcional():
+    """
+    Body JSON (opcional):
+      modo=preservar_manual|solo_vacios|forzar, crear_desde_base, crear_desde_fuentes
+      tamano_lote=n -> filas por commit (por defecto COE_CALIFICACION_LOTE = 1000)
+    Respuesta: {mensaje, modo, creados, actualizados, sin_cambios, cruzados_base,
+    cruzados_sm, cruzados_itop}. sin_cambios cuenta las calificaciones cruzadas
+    que no se escribieron porque sus valores ya coincidían.
+    """
     try:
         data = request.get_json(silent=True) or {}
 
@@ -18025,9 +19258,9 @@ def sincronizar_calificacion_coe_sap_funcional():
         crear_desde_fuentes = data.get("crear_desde_fuentes", False)
 
         usuario = _coe_ext_usuario()
+        motor = _CoeCalificacionBulk(usuario, data.get("tamano_lote"))
+        memo = {}
 
-        creados = 0
-        actualizados = 0
         cruzados_base = 0
         cruzados_sm = 0
         cruzados_itop = 0
@@ -18040,29 +19273,16 @@ def sincronizar_calificacion_coe_sap_funcional():
                 if not getattr(base, "numero", None):
                     continue
 
-                row, created = _coe_ext_upsert_calificacion(base.numero, usuario)
+                row, _created = _coe_ext_upsert_calificacion(motor, base.numero)
 
                 if not row:
                     continue
 
-                if created:
-                    creados += 1
-                else:
-                    actualizados += 1
-
                 _coe_ext_sync_desde_base(row, base, modo)
-
-                row.actualizado_por = usuario
-                row.updated_at = datetime.utcnow()
-
-                with db.session.no_autoflush:
-                    _coe_ext_recalcular_row(row)
+                _coe_ext_recalcular_row(row, memo)
 
                 cruzados_base += 1
 
-                if cruzados_base % 500 == 0:
-                    db.session.flush()
-
         # 2. Crear/actualizar desde fuentes SM / ITOP
         if crear_desde_fuentes:
             fuentes = CoeSapFuncionalFuenteGestion.query.all()
@@ -18071,27 +19291,16 @@ def sincronizar_calificacion_coe_sap_funcional():
                 if not fuente_row.numero:
                     continue
 
-                row, created = _coe_ext_upsert_calificacion(fuente_row.numero, usuario)
+                row, created = _coe_ext_upsert_calificacion(motor, fuente_row.numero)
 
                 if not row:
                     continue
 
                 if created:
-                    creados += 1
                     row.solo_excel = True
-                else:
-                    actualizados += 1
 
                 _coe_ext_sync_desde_fuente(row, fuente_row, modo)
-
-                row.actualizado_por = usuario
-                row.updated_at = datetime.utcnow()
-
-                with db.session.no_autoflush:
-                    _coe_ext_recalcular_row(row)
-
-                if (cruzados_sm + cruzados_itop + 1) % 500 == 0:
-                    db.session.flush()
+                _coe_ext_recalcular_row(row, memo)
 
                 if fuente_row.fuente == "SM":
                     cruzados_sm += 1
@@ -18099,13 +19308,14 @@ def sincronizar_calificacion_coe_sap_funcional():
                 if fuente_row.fuente == "ITOP":
                     cruzados_itop += 1
 
-        db.session.commit()
+        resultado = motor.guardar()
 
         return jsonify({
             "mensaje": "Sincronización de calificación realizada correctamente",
             "modo": modo,
-            "creados": creados,
-            "actualizados": actualizados,
+            "creados": resultado["insertados"],
+            "actualizados": resultado["actualizados"],
+            "sin_cambios": resultado["sin_cambios"],
             "cruzados_base": cruzados_base,
             "cruzados_sm": cruzados_sm,
             "cruzados_itop": cruzados_itop,
@@ -18898,6 +20108,16 @@ def _coe_rep_group_sum(query, group_column, sum_column, label_key="label", value
 
 
 
+def _coe_rep_open_condition():
+    estado_consolidado = CoeSapFuncionalCalificacion.estado_consolidado
+
+    return or_(
+        estado_consolidado.is_(None),
+        estado_consolidado.ilike("%SIN CERRAR%"),
+        estado_consolidado.ilike("%ABIER%"),
+    )
+
+
 def _coe_rep_closed_condition():
     estado_consolidado = func.upper(func.coalesce(CoeSapFuncionalCalificacion.estado_consolidado, ""))
     estado_original = func.upper(func.coalesce(CoeSapFuncionalCalificacion.estado, ""))
@@ -19486,10 +20706,89 @@ def listar_importaciones_coe_sap_funcional():
         }), 500
 
 
+_COE_DASHBOARD_CACHE = TTLCache(maxsize=256, ttl=60)
+
+# Cualquier escritura ORM sobre la calificación invalida el dashboard en todos
+# los workers (data_version); los upserts masivos de _CoeCalificacionBulk
+# avanzan la versión explícitamente. Cambios en consultores/módulos asignados
+# quedan cubiertos por el TTL.
+version_on_write("calificacion", CoeSapFuncionalCalificacion, compartida=True)
+
+_COE_DASHBOARD_MODULOS_HORAS = (
+    ("FI", CoeSapFuncionalCalificacion.horas_estimadas_fi, CoeSapFuncionalCalificacion.horas_ejecutadas_fi),
+    ("MM", CoeSapFuncionalCalificacion.horas_estimadas_mm, CoeSapFuncionalCalificacion.horas_ejecutadas_mm),
+    ("SD", CoeSapFuncionalCalificacion.horas_estimadas_sd, CoeSapFuncionalCalificacion.horas_ejecutadas_sd),
+    ("CO", CoeSapFuncionalCalificacion.horas_estimadas_co, CoeSapFuncionalCalificacion.horas_ejecutadas_co),
+    ("PS", CoeSapFuncionalCalificacion.horas_estimadas_ps, CoeSapFuncionalCalificacion.horas_ejecutadas_ps),
+    ("PCA", CoeSapFuncionalCalificacion.horas_estimadas_pca, CoeSapFuncionalCalificacion.horas_ejecutadas_pca),
+    ("FM", CoeSapFuncionalCalificacion.horas_estimadas_fm, CoeSapFuncionalCalificacion.horas_ejecutadas_fm),
+    ("HCM", CoeSapFuncionalCalificacion.horas_estimadas_hcm, CoeSapFuncionalCalificacion.horas_ejecutadas_hcm),
+    ("SSFF", CoeSapFuncionalCalificacion.horas_estimadas_ssff, CoeSapFuncionalCalificacion.horas_ejecutadas_ssff),
+    ("FIORI", CoeSapFuncionalCalificacion.horas_estimadas_fiori, CoeSapFuncionalCalificacion.horas_ejecutadas_fiori),
+    ("WF", CoeSapFuncionalCalificacion.horas_estimadas_wf, CoeSapFuncionalCalificacion.horas_ejecutadas_wf),
+    ("ABAP", CoeSapFuncionalCalificacion.horas_estimadas_abap, CoeSapFuncionalCalificacion.horas_ejecutadas_abap),
+    ("BASIS", CoeSapFuncionalCalificacion.horas_estimadas_basis, CoeSapFuncionalCalificacion.horas_ejecutadas_basis),
+)
+
+
+def _coe_dashboard_cache_key():
+    """Filtros normalizados + periodo por defecto (mes actual) + versiones de datos."""
+    filtros = []
+    for key, values in request.args.lists():
+        values = sorted({str(v).strip() for v in values if str(v or "").strip()})
+        if values:
+            filtros.append((key, tuple(values)))
+
+    return (
+        version_compartida(db.session, "calificacion", ttl=5),
+        version_compartida(db.session, "catalogos", ttl=5),
+        _coe_dashboard_periodo_actual(),
+        tuple(sorted(filtros)),
+    )
+
+
+def _coe_dashboard_kpis(query):
+    """
+    Conteos y sumas del resumen en una sola pasada sobre el conjunto filtrado
+    (SUM(CASE ...) por indicador) en lugar de un COUNT/SUM por métrica.
+    """
+    C = CoeSapFuncionalCalificacion
+
+    def contar(cond):
+        return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+    def sumar(col):
+        return func.coalesce(func.sum(col), 0)
+
+    columnas = [
+        func.count(C.id).label("total_casos"),
+        contar(_coe_rep_open_condition()).label("abiertos"),
+        contar(_coe_rep_closed_condition()).label("cerrados"),
+        contar(C.cruce_sm == True).label("con_sm"),
+        contar(C.cruce_itop == True).label("con_itop"),
+        contar(C.solo_excel == True).label("solo_excel"),
+        sumar(C.total_horas_funcionales).label("total_funcionales"),
+        sumar(C.total_horas_estimadas).label("total_estimadas"),
+        sumar(C.horas_garantia).label("garantia"),
+        sumar(C.horas_proyecto_abap).label("proyecto_abap"),
+        sumar(C.valor_ot).label("valor_ot"),
+    ]
+    for modulo, estimada_col, ejecutada_col in _COE_DASHBOARD_MODULOS_HORAS:
+        columnas.append(sumar(estimada_col).label(f"estimadas_{modulo.lower()}"))
+        columnas.append(sumar(ejecutada_col).label(f"ejecutadas_{modulo.lower()}"))
+
+    return query.with_entities(*columnas).order_by(None).one()
+
+
 @bp.route("/coe-sap-funcional/calificacion/dashboard-clientes", methods=["GET"])
 @permission_required("BASE_REGISTRO_VER")
 def dashboard_clientes_coe_sap_funcional():
     try:
+        cache_key = _coe_dashboard_cache_key()
+        cached = _COE_DASHBOARD_CACHE.get(cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
         base_query = CoeSapFuncionalCalificacion.query
 
         # Consulta general del dashboard: conserva el periodo global para métricas,
@@ -19502,29 +20801,7 @@ def dashboard_clientes_coe_sap_funcional():
         # responsable, asignado, tipo de solicitud, control horas y búsqueda.
         query_backlog_estado = _coe_rep_apply_filters(base_query, include_period=False)
 
-        total_casos = query.count()
-
-        abiertos = query.filter(
-            or_(
-                CoeSapFuncionalCalificacion.estado_consolidado.is_(None),
-                CoeSapFuncionalCalificacion.estado_consolidado.ilike("%SIN CERRAR%"),
-                CoeSapFuncionalCalificacion.estado_consolidado.ilike("%ABIER%"),
-            )
-        ).count()
-
-        cerrados = query.filter(_coe_rep_closed_condition()).count()
-
-        con_sm = query.filter(CoeSapFuncionalCalificacion.cruce_sm == True).count()
-        con_itop = query.filter(CoeSapFuncionalCalificacion.cruce_itop == True).count()
-        solo_excel = query.filter(CoeSapFuncionalCalificacion.solo_excel == True).count()
-
-        horas = query.with_entities(
-            func.coalesce(func.sum(CoeSapFuncionalCalificacion.total_horas_funcionales), 0).label("total_funcionales"),
-            func.coalesce(func.sum(CoeSapFuncionalCalificacion.total_horas_estimadas), 0).label("total_estimadas"),
-            func.coalesce(func.sum(CoeSapFuncionalCalificacion.horas_garantia), 0).label("garantia"),
-            func.coalesce(func.sum(CoeSapFuncionalCalificacion.horas_proyecto_abap), 0).label("proyecto_abap"),
-            func.coalesce(func.sum(CoeSapFuncionalCalificacion.valor_ot), 0).label("valor_ot"),
-        ).first()
+        kpis = _coe_dashboard_kpis(query)
 
         cerrados_por_mes_rows = (
             query.with_entities(
@@ -19551,30 +20828,9 @@ def dashboard_clientes_coe_sap_funcional():
         ]
 
         horas_modulos = []
-        modulos_horas = [
-            ("FI", CoeSapFuncionalCalificacion.horas_estimadas_fi, CoeSapFuncionalCalificacion.horas_ejecutadas_fi),
-            ("MM", CoeSapFuncionalCalificacion.horas_estimadas_mm, CoeSapFuncionalCalificacion.horas_ejecutadas_mm),
-            ("SD", CoeSapFuncionalCalificacion.horas_estimadas_sd, CoeSapFuncionalCalificacion.horas_ejecutadas_sd),
-            ("CO", CoeSapFuncionalCalificacion.horas_estimadas_co, CoeSapFuncionalCalificacion.horas_ejecutadas_co),
-            ("PS", CoeSapFuncionalCalificacion.horas_estimadas_ps, CoeSapFuncionalCalificacion.horas_ejecutadas_ps),
-            ("PCA", CoeSapFuncionalCalificacion.horas_estimadas_pca, CoeSapFuncionalCalificacion.horas_ejecutadas_pca),
-            ("FM", CoeSapFuncionalCalificacion.horas_estimadas_fm, CoeSapFuncionalCalificacion.horas_ejecutadas_fm),
-            ("HCM", CoeSapFuncionalCalificacion.horas_estimadas_hcm, CoeSapFuncionalCalificacion.horas_ejecutadas_hcm),
-            ("SSFF", CoeSapFuncionalCalificacion.horas_estimadas_ssff, CoeSapFuncionalCalificacion.horas_ejecutadas_ssff),
-            ("FIORI", CoeSapFuncionalCalificacion.horas_estimadas_fiori, CoeSapFuncionalCalificacion.horas_ejecutadas_fiori),
-            ("WF", CoeSapFuncionalCalificacion.horas_estimadas_wf, CoeSapFuncionalCalificacion.horas_ejecutadas_wf),
-            ("ABAP", CoeSapFuncionalCalificacion.horas_estimadas_abap, CoeSapFuncionalCalificacion.horas_ejecutadas_abap),
-            ("BASIS", CoeSapFuncionalCalificacion.horas_estimadas_basis, CoeSapFuncionalCalificacion.horas_ejecutadas_basis),
-        ]
-
-        for modulo, estimada_col, ejecutada_col in modulos_horas:
-            r = query.with_entities(
-                func.coalesce(func.sum(estimada_col), 0).label("estimadas"),
-                func.coalesce(func.sum(ejecutada_col), 0).label("ejecutadas"),
-            ).first()
-
-            estimadas = _coe_rep_float(r.estimadas)
-            ejecutadas = _coe_rep_float(r.ejecutadas)
+        for modulo, _estimada_col, _ejecutada_col in _COE_DASHBOARD_MODULOS_HORAS:
+            estimadas = _coe_rep_float(getattr(kpis, f"estimadas_{modulo.lower()}"))
+            ejecutadas = _coe_rep_float(getattr(kpis, f"ejecutadas_{modulo.lower()}"))
 
             if estimadas > 0 or ejecutadas > 0:
                 horas_modulos.append({
@@ -19595,19 +20851,19 @@ def dashboard_clientes_coe_sap_funcional():
             .all()
         )
 
-        return jsonify({
+        payload = {
             "resumen": {
-                "totalCasos": int(total_casos or 0),
-                "abiertos": int(abiertos or 0),
-                "cerrados": int(cerrados or 0),
-                "conSm": int(con_sm or 0),
-                "conItop": int(con_itop or 0),
-                "soloExcel": int(solo_excel or 0),
-                "totalHorasFuncionales": _coe_rep_float(horas.total_funcionales if horas else 0),
-                "totalHorasEstimadas": _coe_rep_float(horas.total_estimadas if horas else 0),
-                "horasGarantia": _coe_rep_float(horas.garantia if horas else 0),
-                "horasProyectoAbap": _coe_rep_float(horas.proyecto_abap if horas else 0),
-                "valorOt": _coe_rep_float(horas.valor_ot if horas else 0),
+                "totalCasos": int(kpis.total_casos or 0),
+                "abiertos": int(kpis.abiertos or 0),
+                "cerrados": int(kpis.cerrados or 0),
+                "conSm": int(kpis.con_sm or 0),
+                "conItop": int(kpis.con_itop or 0),
+                "soloExcel": int(kpis.solo_excel or 0),
+                "totalHorasFuncionales": _coe_rep_float(kpis.total_funcionales),
+                "totalHorasEstimadas": _coe_rep_float(kpis.total_estimadas),
+                "horasGarantia": _coe_rep_float(kpis.garantia),
+                "horasProyectoAbap": _coe_rep_float(kpis.proyecto_abap),
+                "valorOt": _coe_rep_float(kpis.valor_ot),
             },
             "estadoGeneralRequerimientos": _coe_rep_estado_general(query_backlog_estado),
             "distribucionModulosConsultores": _coe_rep_distribucion_modulos_consultores(query),
@@ -19641,7 +20897,9 @@ def dashboard_clientes_coe_sap_funcional():
                 for r in ot_facturacion_rows
             ],
             "opciones": _coe_rep_distinct_options(base_query),
-        }), 200
+        }
+        _COE_DASHBOARD_CACHE.set(cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
         app.logger.exception("Error consultando dashboard clientes COE SAP Funcional")
@@ -19831,70 +21089,20 @@ def _coe_xls_filename(name):
 
 
 def _coe_xls_response(filename, sheets):
-    from flask import send_file
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils import get_column_letter
-
-    wb = Workbook()
-    ws_default = wb.active
-    wb.remove(ws_default)
-
-    header_fill = PatternFill("solid", fgColor="DA291C")
-    header_font = Font(color="FFFFFF", bold=True)
-    thin = Side(style="thin", color="E5E7EB")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
+    """
+    Excel de los reportes COE en modo write_only: filas consumidas una a una
+    (pueden venir de un generador con yield_per), mismos bordes y alineación
+    que el formato anterior y archivo temporal servido por bloques.
+    """
+    normalizadas = []
     for sheet in sheets:
-        title = str(sheet.get("title") or "Hoja")[:31]
-        headers = sheet.get("headers") or []
-        rows = sheet.get("rows") or []
-
-        ws = wb.create_sheet(title=title)
-        ws.freeze_panes = "A2"
-
-        for col_idx, header in enumerate(headers, start=1):
-            label = header[0] if isinstance(header, (list, tuple)) else header
-            cell = ws.cell(row=1, column=col_idx, value=str(label))
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-            cell.border = border
-
-        for row_idx, row in enumerate(rows, start=2):
-            for col_idx, header in enumerate(headers, start=1):
-                if isinstance(header, (list, tuple)):
-                    key = header[1]
-                    value = row.get(key) if isinstance(row, dict) else None
-                else:
-                    value = row.get(header) if isinstance(row, dict) else None
-
-                cell = ws.cell(row=row_idx, column=col_idx, value=_coe_xls_cell(value))
-                cell.alignment = Alignment(vertical="top", wrap_text=True)
-                cell.border = border
+        headers = [
+            tuple(h[:2]) if isinstance(h, (list, tuple)) else (h, h)
+            for h in (sheet.get("headers") or [])
+        ]
+        normalizadas.append({**sheet, "headers": headers})
 
-        if headers:
-            ws.auto_filter.ref = ws.dimensions
-
-        for col_idx, header in enumerate(headers, start=1):
-            label = header[0] if isinstance(header, (list, tuple)) else header
-            max_len = len(str(label))
-            for row_idx in range(2, min(ws.max_row, 250) + 1):
-                val = ws.cell(row=row_idx, column=col_idx).value
-                if val is not None:
-                    max_len = max(max_len, min(len(str(val)), 70))
-            ws.column_dimensions[get_column_letter(col_idx)].width = min(max(max_len + 2, 12), 55)
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name=filename,
-    )
+    return _stream_xlsx_response(filename, normalizadas, cell=_coe_xls_cell, muestra_anchos=250, bordes=True)
 
 
 def _coe_xls_bool_text(value):
@@ -19937,12 +21145,12 @@ def _coe_xls_calificacion_query():
     return query
 
 
-def _coe_xls_calificacion_rows(query):
-    rows = query.order_by(CoeSapFuncionalCalificacion.id.desc()).all()
-    out = []
+def _coe_xls_calificacion_rows(query, yield_per=1000):
+    """Generador de filas del export; la consulta se recorre por bloques."""
+    rows = query.order_by(CoeSapFuncionalCalificacion.id.desc()).yield_per(yield_per)
 
     for r in rows:
-        out.append({
+        yield {
             "id_bd": r.id,
             "numero": r.numero,
             "sistema": r.sistema,
@@ -20035,9 +21243,7 @@ def _coe_xls_calificacion_rows(query):
             "solo_excel": _coe_xls_bool_text(getattr(r, "solo_excel", False)),
             "origen_datos_json": getattr(r, "origen_datos_json", None),
             "campos_editados_manual_json": getattr(r, "campos_editados_manual_json", None),
-        })
-
-    return out
+        }
 
 
 def _coe_xls_calificacion_headers():
@@ -20204,16 +21410,28 @@ def exportar_detalle_cliente_coe_sap_funcional_excel():
     try:
         query = _coe_rep_apply_filters(CoeSapFuncionalCalificacion.query)
 
+        # Se consulta antes de abrir el cursor en streaming del detalle.
+        resumen_rows = (
+            query.with_entities(
+                CoeSapFuncionalCalificacion.responsable_estado.label("responsable"),
+                CoeSapFuncionalCalificacion.estado.label("estado"),
+                func.count(CoeSapFuncionalCalificacion.id).label("cantidad"),
+            )
+            .group_by(CoeSapFuncionalCalificacion.responsable_estado, CoeSapFuncionalCalificacion.estado)
+            .order_by(CoeSapFuncionalCalificacion.responsable_estado.asc(), func.count(CoeSapFuncionalCalificacion.id).desc())
+            .all()
+        )
+
         rows = (
             query.order_by(
                 CoeSapFuncionalCalificacion.responsable_estado.asc(),
                 CoeSapFuncionalCalificacion.estado.asc(),
                 CoeSapFuncionalCalificacion.numero.asc(),
             )
-            .all()
+            .yield_per(1000)
         )
 
-        data_rows = [{
+        data_rows = ({
             "responsableEstado": r.responsable_estado,
             "estado": r.estado,
             "estadoPrincipal": getattr(r, "estado_principal", None),
@@ -20240,18 +21458,7 @@ def exportar_detalle_cliente_coe_sap_funcional_excel():
             "cruceSm": _coe_xls_bool_text(getattr(r, "cruce_sm", False)),
             "cruceItop": _coe_xls_bool_text(getattr(r, "cruce_itop", False)),
             "soloExcel": _coe_xls_bool_text(getattr(r, "solo_excel", False)),
-        } for r in rows]
-
-        resumen_rows = (
-            query.with_entities(
-                CoeSapFuncionalCalificacion.responsable_estado.label("responsable"),
-                CoeSapFuncionalCalificacion.estado.label("estado"),
-                func.count(CoeSapFuncionalCalificacion.id).label("cantidad"),
-            )
-            .group_by(CoeSapFuncionalCalificacion.responsable_estado, CoeSapFuncionalCalificacion.estado)
-            .order_by(CoeSapFuncionalCalificacion.responsable_estado.asc(), func.count(CoeSapFuncionalCalificacion.id).desc())
-            .all()
-        )
+        } for r in rows)
 
         return _coe_xls_response(
             _coe_xls_filename("detalle_seguimiento_cliente_coe_sap_funcional"),
@@ -20429,26 +21636,177 @@ def _coe_cfg_estado_texto_original(row):
     )
 
 
-def _coe_cfg_find_cliente_by_nombre(nombre):
-    nombre_norm = _coe_cfg_norm(nombre)
-    if not nombre_norm:
-        return None
+class _CoeClienteRef:
+    """Datos mínimos de un Cliente, seguros de compartir entre sesiones."""
+
+    __slots__ = ("id", "nombre_cliente")
+
+    def __init__(self, id, nombre_cliente):
+        self.id = id
+        self.nombre_cliente = nombre_cliente
+
+
+class _CoeClientesIndice:
+    """
+    Índice de nombres de cliente normalizados (_coe_cfg_norm), en el orden
+    de Cliente.nombre_cliente:
+    - coincidencia exacta -> dict,
+    - cliente contenido en el nombre buscado -> Aho-Corasick (una pasada),
+    - nombre buscado contenido en un cliente -> str.find sobre los nombres
+      concatenados (el primer hallazgo es el primer cliente en orden).
+    Gana el primer cliente en orden, igual que el recorrido lineal anterior.
+    """
+
+    _SEP = "\x00"
+
+    def __init__(self, clientes):
+        self.clientes = []
+        self.exactos = {}
+        contiene = defaultdict(set)
+        normas = []
+
+        for cliente_id, nombre in clientes:
+            pos = len(self.clientes)
+            self.clientes.append(_CoeClienteRef(cliente_id, nombre))
+            norm = _coe_cfg_norm(nombre)
+            normas.append(norm)
+            if not norm:
+                continue
+            self.exactos.setdefault(norm, pos)
+            contiene[norm].add(pos)
+
+        self.automata = AhoCorasick(contiene) if contiene else None
+
+        self.inicios = []
+        partes = []
+        offset = 0
+        for norm in normas:
+            self.inicios.append(offset)
+            partes.append(norm)
+            offset += len(norm) + len(self._SEP)
+        self.texto = self._SEP.join(partes)
+
+    def buscar(self, nombre):
+        nombre_norm = _coe_cfg_norm(nombre)
+        if not nombre_norm:
+            return None
+
+        pos = self.exactos.get(nombre_norm)
+        if pos is not None:
+            return self.clientes[pos]
+
+        candidatos = self.automata.buscar(nombre_norm) if self.automata is not None else set()
+
+        idx = self.texto.find(nombre_norm)
+        if idx >= 0:
+            candidatos.add(bisect_right(self.inicios, idx) - 1)
+
+        return self.clientes[min(candidatos)] if candidatos else None
 
-    clientes = Cliente.query.order_by(Cliente.nombre_cliente.asc()).all()
 
-    # Coincidencia exacta normalizada.
-    for cliente in clientes:
-        if _coe_cfg_norm(getattr(cliente, "nombre_cliente", None)) == nombre_norm:
-            return cliente
+_COE_CLIENTES_INDICE_CACHE = TTLCache(maxsize=1, ttl=3600)
 
-    # Coincidencia flexible.
+# Versión compartida (tabla data_version): un cliente creado en otro worker
+# se ve aquí en cuanto vence la lectura de la versión (segundos).
+version_on_write("clientes", Cliente, compartida=True)
+
+
+def _coe_cfg_clientes_indice():
+    """Índice de clientes por nombre, reconstruido solo cuando cambia la tabla clientes (en cualquier worker)."""
+    version = version_compartida(db.session, "clientes", ttl=5)
+    cached = _COE_CLIENTES_INDICE_CACHE.get("indice")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    indice = _CoeClientesIndice(
+        Cliente.query
+        .with_entities(Cliente.id, Cliente.nombre_cliente)
+        .order_by(Cliente.nombre_cliente.asc())
+        .all()
+    )
+    _COE_CLIENTES_INDICE_CACHE.set("indice", (version, indice))
+    return indice
+
+
+def _coe_cfg_find_cliente_by_nombre(nombre):
+    # Coincidencia exacta normalizada y, si no hay, flexible.
     # Ejemplo: sociedad viene "AIRE S.A.S" y cliente está "AIR-E".
-    for cliente in clientes:
-        cliente_norm = _coe_cfg_norm(getattr(cliente, "nombre_cliente", None))
-        if cliente_norm and (cliente_norm in nombre_norm or nombre_norm in cliente_norm):
-            return cliente
+    return _coe_cfg_clientes_indice().buscar(nombre)
 
-    return None
+
+class _CoeCatalogoRef:
+    """Datos de una fila de CoeSapFuncionalCatalogo, seguros de compartir entre sesiones."""
+
+    __slots__ = ("id", "tipo", "valor", "valor_normalizado", "extra_1", "extra_2", "activo")
+
+    def __init__(self, id, tipo, valor, valor_normalizado, extra_1, extra_2, activo):
+        self.id = id
+        self.tipo = tipo
+        self.valor = valor
+        self.valor_normalizado = valor_normalizado
+        self.extra_1 = extra_1
+        self.extra_2 = extra_2
+        self.activo = activo
+
+
+class _CoeEstadosSnapshot:
+    """Estados principales y subestados en memoria, por id y por valor normalizado."""
+
+    def __init__(self, filas):
+        self.por_id = {}
+        self.por_norm = {}
+        for fila in filas:
+            ref = _CoeCatalogoRef(*fila)
+            self.por_id[(ref.tipo, ref.id)] = ref
+            self.por_norm[(ref.tipo, ref.valor_normalizado)] = ref
+
+    @staticmethod
+    def _filtrar(ref, solo_activos):
+        if ref is None or (solo_activos and ref.activo is not True):
+            return None
+        return ref
+
+    def buscar_id(self, tipo, item_id, solo_activos=False):
+        return self._filtrar(self.por_id.get((tipo, item_id)), solo_activos)
+
+    def buscar_norm(self, tipo, norm, solo_activos=False):
+        return self._filtrar(self.por_norm.get((tipo, norm)), solo_activos)
+
+
+_COE_ESTADOS_CACHE = TTLCache(maxsize=1, ttl=3600)
+
+# El CRUD de estados/subestados escribe por ORM: cada commit avanza la
+# versión (también en data_version, para los demás workers) y la siguiente
+# clasificación recarga la lista controlada.
+version_on_write("coe_estados", CoeSapFuncionalCatalogo, compartida=True)
+
+
+def _coe_cfg_estados_snapshot():
+    """
+    Lista controlada en memoria para la clasificación masiva. Las validaciones
+    por id de los endpoints consultan la BD directamente (ver *_by_id).
+    """
+    version = version_compartida(db.session, "coe_estados", ttl=5)
+    cached = _COE_ESTADOS_CACHE.get("snapshot")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    snapshot = _CoeEstadosSnapshot(
+        CoeSapFuncionalCatalogo.query
+        .with_entities(
+            CoeSapFuncionalCatalogo.id,
+            CoeSapFuncionalCatalogo.tipo,
+            CoeSapFuncionalCatalogo.valor,
+            CoeSapFuncionalCatalogo.valor_normalizado,
+            CoeSapFuncionalCatalogo.extra_1,
+            CoeSapFuncionalCatalogo.extra_2,
+            CoeSapFuncionalCatalogo.activo,
+        )
+        .filter(CoeSapFuncionalCatalogo.tipo.in_([COE_TIPO_ESTADO_PRINCIPAL, COE_TIPO_SUBESTADO]))
+        .all()
+    )
+    _COE_ESTADOS_CACHE.set("snapshot", (version, snapshot))
+    return snapshot
 
 
 def _coe_cfg_find_estado_principal_by_id(estado_id):
@@ -20465,26 +21823,14 @@ def _coe_cfg_find_estado_principal_by_nombre(nombre, solo_activos=True):
     nombre_norm = _coe_cfg_norm(nombre)
     if not nombre_norm:
         return None
-    q = CoeSapFuncionalCatalogo.query.filter(
-        CoeSapFuncionalCatalogo.tipo == COE_TIPO_ESTADO_PRINCIPAL,
-        CoeSapFuncionalCatalogo.valor_normalizado == nombre_norm,
-    )
-    if solo_activos:
-        q = q.filter(CoeSapFuncionalCatalogo.activo == True)
-    return q.first()
+    return _coe_cfg_estados_snapshot().buscar_norm(COE_TIPO_ESTADO_PRINCIPAL, nombre_norm, solo_activos)
 
 
 def _coe_cfg_find_subestado_by_nombre(nombre, solo_activos=True):
     nombre_norm = _coe_cfg_norm(nombre)
     if not nombre_norm:
         return None
-    q = CoeSapFuncionalCatalogo.query.filter(
-        CoeSapFuncionalCatalogo.tipo == COE_TIPO_SUBESTADO,
-        CoeSapFuncionalCatalogo.valor_normalizado == nombre_norm,
-    )
-    if solo_activos:
-        q = q.filter(CoeSapFuncionalCatalogo.activo == True)
-    return q.first()
+    return _coe_cfg_estados_snapshot().buscar_norm(COE_TIPO_SUBESTADO, nombre_norm, solo_activos)
 
 
 def _coe_cfg_find_subestado_by_id(subestado_id, solo_activos=False):
@@ -20585,13 +21931,14 @@ def _coe_cfg_marcar_estado_origen(row, origen="CATALOGO_ESTADOS"):
         row.origen_datos_json = _coe_ext_json_dumps(origen_fields)
 
 
-def _coe_cfg_aplicar_subestado_catalogo(row, subestado, usuario=None, observacion=None, append_observation=False):
+def _coe_cfg_aplicar_subestado_catalogo(row, subestado, usuario=None, observacion=None, append_observation=False, estados=None):
     """
     Aplica el subestado controlado como fuente oficial:
     - llena subestado_catalogo_id y subestado;
     - llena estado_catalogo_id y estado_principal desde el padre;
     - recalcula responsable_estado y estado_consolidado;
     - NO modifica row.estado, porque ese es el estado original de la base.
+    `estados` (snapshot de la clasificación masiva) evita consultar el padre en BD.
     """
     if not row or not subestado:
         return row
@@ -20599,7 +21946,12 @@ def _coe_cfg_aplicar_subestado_catalogo(row, subestado, usuario=None, observacio
     estado_anterior = getattr(row, "estado_principal", None)
     subestado_anterior = getattr(row, "subestado", None)
 
-    estado_padre = _coe_cfg_find_estado_principal_by_id(getattr(subestado, "extra_1", None))
+    if estados is not None:
+        estado_padre = estados.buscar_id(
+            COE_TIPO_ESTADO_PRINCIPAL, _coe_cfg_safe_int(getattr(subestado, "extra_1", None))
+        )
+    else:
+        estado_padre = _coe_cfg_find_estado_principal_by_id(getattr(subestado, "extra_1", None))
 
     estado_principal_valor = (
         getattr(estado_padre, "valor", None)
@@ -20662,11 +22014,12 @@ def _coe_cfg_clasificar_cliente(row):
 def _coe_cfg_clasificar_estado(row):
     # Si la fila ya tiene un subestado_catalogo_id, ese ID manda.
     # Esto evita que una edición manual controlada se pierda al recalcular.
-    subestado_id_actual = getattr(row, "subestado_catalogo_id", None)
+    estados = _coe_cfg_estados_snapshot()
+    subestado_id_actual = _coe_cfg_safe_int(getattr(row, "subestado_catalogo_id", None))
     if subestado_id_actual:
-        subestado_controlado = _coe_cfg_find_subestado_by_id(subestado_id_actual, solo_activos=False)
+        subestado_controlado = estados.buscar_id(COE_TIPO_SUBESTADO, subestado_id_actual)
         if subestado_controlado:
-            _coe_cfg_aplicar_subestado_catalogo(row, subestado_controlado)
+            _coe_cfg_aplicar_subestado_catalogo(row, subestado_controlado, estados=estados)
             return getattr(row, "validar_estado_control", None) or "OK"
 
     estado_original = _coe_cfg_estado_texto_original(row)
@@ -20683,7 +22036,7 @@ def _coe_cfg_clasificar_estado(row):
     # se enlaza a la lista controlada sin modificar row.estado.
     subestado = _coe_cfg_find_subestado_by_nombre(estado_original, solo_activos=True)
     if subestado:
-        _coe_cfg_aplicar_subestado_catalogo(row, subestado)
+        _coe_cfg_aplicar_subestado_catalogo(row, subestado, estados=estados)
         return "OK"
 
     # 2) Si el texto original coincide con un estado principal,
@@ -20728,10 +22081,35 @@ def _coe_cfg_clasificar_calificacion(row):
     return row
 
 
-def _coe_cfg_reclasificar_calificaciones(limit=None):
-    q = CoeSapFuncionalCalificacion.query
-    if limit:
-        q = q.limit(int(limit))
+# Columnas que lee/escribe _coe_cfg_clasificar_calificacion.
+_COE_CFG_CAMPOS_CLASIFICACION = (
+    "sociedad",
+    "estado",
+    "estado_herramienta_gestion",
+    "cliente_id",
+    "cliente_asociado_nombre",
+    "validar_cliente",
+    "estado_catalogo_id",
+    "estado_principal",
+    "subestado_catalogo_id",
+    "subestado",
+    "validar_estado_control",
+    "responsable_estado",
+    "estado_consolidado",
+    "campos_editados_manual_json",
+    "origen_datos_json",
+)
+
+
+def _coe_cfg_reclasificar_calificaciones(limit=None, batch_size=5000):
+    """
+    Reclasifica cliente/estado de toda la calificación sin cargar entidades ORM:
+    lee solo las columnas de clasificación por lotes de id, clasifica en memoria
+    (lista controlada e índice de clientes ya cargados) y escribe un UPDATE por
+    combinación de valores destino para las filas que cambian. No hace commit.
+    """
+    campos = [c for c in _COE_CFG_CAMPOS_CLASIFICACION if hasattr(CoeSapFuncionalCalificacion, c)]
+    columnas = [CoeSapFuncionalCalificacion.id] + [getattr(CoeSapFuncionalCalificacion, c) for c in campos]
 
     total = 0
     clientes_ok = 0
@@ -20742,31 +22120,77 @@ def _coe_cfg_reclasificar_calificaciones(limit=None):
 
     usuario = _coe_ext_usuario() if "_coe_ext_usuario" in globals() else (_calificacion_usuario_actual() if "_calificacion_usuario_actual" in globals() else None)
 
-    for row in q.yield_per(1000):
-        _coe_cfg_clasificar_calificacion(row)
+    # {((campo, valor), ...): [ids]}
+    grupos = defaultdict(list)
 
-        if getattr(row, "validar_cliente", None) == "OK":
-            clientes_ok += 1
-        else:
-            clientes_validar += 1
+    restantes = int(limit) if limit else None
+    last_id = 0
+    while restantes is None or restantes > 0:
+        tamano = batch_size if restantes is None else min(batch_size, restantes)
+        rows = (
+            db.session.query(*columnas)
+            .filter(CoeSapFuncionalCalificacion.id > last_id)
+            .order_by(CoeSapFuncionalCalificacion.id.asc())
+            .limit(tamano)
+            .all()
+        )
+        if not rows:
+            break
 
-        estado_validacion = getattr(row, "validar_estado_control", None)
-        if estado_validacion == "OK":
-            estados_ok += 1
-        elif estado_validacion == "SIN ESTADO":
-            estados_sin_estado += 1
-        else:
-            estados_validar += 1
+        for r in rows:
+            original = dict(zip(campos, r[1:]))
+            fila = _CoeFilaCalificacion(dict(original))
+            _coe_cfg_clasificar_calificacion(fila)
 
-        if hasattr(row, "actualizado_por"):
-            row.actualizado_por = usuario
-        if hasattr(row, "updated_at"):
-            row.updated_at = datetime.utcnow()
+            if getattr(fila, "validar_cliente", None) == "OK":
+                clientes_ok += 1
+            else:
+                clientes_validar += 1
 
-        total += 1
+            estado_validacion = getattr(fila, "validar_estado_control", None)
+            if estado_validacion == "OK":
+                estados_ok += 1
+            elif estado_validacion == "SIN ESTADO":
+                estados_sin_estado += 1
+            else:
+                estados_validar += 1
 
-        if total % 1000 == 0:
-            db.session.flush()
+            cambios = tuple(
+                (c, fila.__dict__[c]) for c in campos
+                if fila.__dict__[c] != original[c]
+            )
+            if cambios:
+                grupos[cambios].append(r[0])
+
+        total += len(rows)
+        last_id = rows[-1][0]
+        if restantes is not None:
+            restantes -= len(rows)
+
+    ahora = datetime.utcnow()
+    extra = {}
+    if hasattr(CoeSapFuncionalCalificacion, "actualizado_por"):
+        extra["actualizado_por"] = usuario
+    if hasattr(CoeSapFuncionalCalificacion, "updated_at"):
+        extra["updated_at"] = ahora
+
+    # Los JSON de origen suelen ser distintos por fila: esos van por executemany.
+    individuales = []
+    for cambios, ids in grupos.items():
+        if len(ids) == 1:
+            individuales.append({"id": ids[0], **dict(cambios), **extra})
+            continue
+        valores = {**dict(cambios), **extra}
+        for k in range(0, len(ids), 1000):
+            CoeSapFuncionalCalificacion.query.filter(
+                CoeSapFuncionalCalificacion.id.in_(ids[k:k + 1000])
+            ).update(valores, synchronize_session=False)
+
+    for k in range(0, len(individuales), 1000):
+        db.session.bulk_update_mappings(CoeSapFuncionalCalificacion, individuales[k:k + 1000])
+
+    if grupos:
+        bump_on_commit(db.session, "calificacion", compartida=True)
 
     return {
         "total": total,
@@ -21147,27 +22571,59 @@ def coe_config_eliminar_subestado(subestado_id):
         return jsonify({"mensaje": "Error eliminando subestado", "error": str(e), "trace": traceback.format_exc()}), 500
 
 
+_COE_CFG_CLIENTES_CACHE = TTLCache(maxsize=64, ttl=300)
+
+
 @bp.route("/coe-sap-funcional/config/clientes", methods=["GET"])
 @permission_required("BASE_REGISTRO_VER")
 def coe_config_listar_clientes():
     try:
         q = _coe_cfg_str(request.args.get("q"))
+        # Versiones compartidas: un cambio en cualquier worker descarta la entrada.
+        cache_key = (
+            version_compartida(db.session, "calificacion", ttl=5),
+            version_compartida(db.session, "clientes", ttl=5),
+            q,
+        )
+        cached = _COE_CFG_CLIENTES_CACHE.get(cache_key)
+        if cached is not None:
+            return jsonify(cached), 200
+
         query = Cliente.query
         if q:
             query = query.filter(Cliente.nombre_cliente.ilike(f"%{q}%"))
 
         clientes = query.order_by(Cliente.nombre_cliente.asc()).all()
-        data = []
 
+        C = CoeSapFuncionalCalificacion
+        sin_clasificar = or_(C.validar_estado_control.is_(None), C.validar_estado_control != "OK")
+        stats = {}
+        if hasattr(C, "cliente_id"):
+            # Un solo GROUP BY para todos los clientes en lugar de un COUNT por cliente.
+            stats = {
+                r.cliente_id: r
+                for r in db.session.query(
+                    C.cliente_id,
+                    func.count(C.id).label("total"),
+                    func.coalesce(func.sum(case((_coe_rep_open_condition(), 1), else_=0)), 0).label("abiertos"),
+                    func.coalesce(func.sum(case((sin_clasificar, 1), else_=0)), 0).label("sin_clasificar"),
+                    func.max(C.fecha_asignacion).label("ultimo_caso"),
+                )
+                .filter(C.cliente_id.isnot(None))
+                .group_by(C.cliente_id)
+            }
+
+        data = []
         for cliente in clientes:
-            asociados = 0
-            if hasattr(CoeSapFuncionalCalificacion, "cliente_id"):
-                asociados = CoeSapFuncionalCalificacion.query.filter_by(cliente_id=cliente.id).count()
+            r = stats.get(cliente.id)
             data.append({
                 "id": cliente.id,
                 "nombreCliente": cliente.nombre_cliente,
                 "nombre_cliente": cliente.nombre_cliente,
-                "totalCasosAsociados": int(asociados or 0),
+                "totalCasosAsociados": int(r.total or 0) if r else 0,
+                "totalCasosAbiertos": int(r.abiertos or 0) if r else 0,
+                "totalCasosSinClasificar": int(r.sin_clasificar or 0) if r else 0,
+                "fechaUltimoCaso": _coe_rep_date(r.ultimo_caso) if r else None,
             })
 
         pendientes = 0
@@ -21179,7 +22635,9 @@ def coe_config_listar_clientes():
                 )
             ).count()
 
-        return jsonify({"data": data, "total": len(data), "pendientes": int(pendientes or 0)}), 200
+        payload = {"data": data, "total": len(data), "pendientes": int(pendientes or 0)}
+        _COE_CFG_CLIENTES_CACHE.set(cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
         app.logger.exception("Error listando clientes COE SAP config")
@@ -0,0 +1,85 @@
+import re
+from pathlib import Path
+
+import pytest
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import StaticPool
+
+from backend import cache, create_app
+from backend.config import Config
+from backend.models import db, Consultor, Equipo, Permiso, Rol, RolPermiso
+
+
+@compiles(LONGTEXT, "sqlite")
+def _longtext_sqlite(_type, _compiler, **_kw):
+    return "TEXT"
+
+
+class ConfigPruebas(Config):
+    """SQLite en memoria compartido por todas las conexiones del proceso."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": StaticPool,
+        "connect_args": {"check_same_thread": False},
+    }
+
+
+def _crear_tablas():
+    # Algunos server_default son expresiones MySQL (current_timestamp(), ...):
+    # si SQLite no las acepta, la tabla se crea sin ellos.
+    for tabla in db.metadata.sorted_tables:
+        try:
+            tabla.create(db.engine)
+        except Exception:
+            for columna in tabla.columns:
+                columna.server_default = None
+                columna.server_onupdate = None
+            tabla.create(db.engine)
+
+
+def _permisos_declarados():
+    fuente = (Path(__file__).resolve().parent.parent / "routes.py").read_text(encoding="utf-8")
+    return sorted(set(re.findall(r'permission_required\("([A-Z_0-9]+)"\)', fuente)))
+
+
+@pytest.fixture
+def app():
+    """App con base vacía, un rol ADMIN con todos los permisos y el consultor u1."""
+    cache._VERSIONES_BD.clear()
+    app = create_app(ConfigPruebas)
+
+    with app.app_context():
+        _crear_tablas()
+
+        rol = Rol(nombre="ADMIN")
+        equipo = Equipo(nombre="BASIS")
+        db.session.add_all([rol, equipo])
+        db.session.flush()
+
+        for codigo in _permisos_declarados():
+            permiso = Permiso(codigo=codigo)
+            db.session.add(permiso)
+            db.session.flush()
+            db.session.add(RolPermiso(rol_id=rol.id, permiso_id=permiso.id))
+
+        db.session.add(Consultor(usuario="u1", nombre="U1", password="x", rol_id=rol.id, equipo_id=equipo.id))
+        db.session.commit()
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    token = client.post("/api/login", json={"usuario": "u1", "password": "x"}).get_json()["token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from backend.routes import _CoeClientesIndice, _coe_cfg_norm
+
+
+def _buscar_lineal(nombre, clientes):
+    """Recorrido lineal que _CoeClientesIndice reemplaza: exacto y luego contención."""
+    nombre_norm = _coe_cfg_norm(nombre)
+    if not nombre_norm:
+        return None
+    for cliente_id, cliente_nombre in clientes:
+        if _coe_cfg_norm(cliente_nombre) == nombre_norm:
+            return cliente_id
+    for cliente_id, cliente_nombre in clientes:
+        norm = _coe_cfg_norm(cliente_nombre)
+        if norm and (norm in nombre_norm or nombre_norm in norm):
+            return cliente_id
+    return None
+
+
+NOMBRES = [
+    "AIRE", "AIR-E", "ÉXITO", "EXITO S.A.", "CLARO", "COLOMBIA", "BANCO",
+    "BANCO DE BOGOTÁ", "BOGOTA", "SAS", "A", "AB", "B A", " claro  colombia ",
+]
+
+
+@pytest.fixture(scope="module")
+def clientes():
+    rnd = random.Random(5)
+    aleatorios = [
+        "".join(rnd.choice("ABCÉ -") for _ in range(rnd.randint(1, 8))) + str(i)
+        for i in range(200)
+    ]
+    # mismo orden que Cliente.nombre_cliente ASC
+    return sorted(enumerate(NOMBRES + aleatorios, start=1), key=lambda c: c[1])
+
+
+@pytest.fixture(scope="module")
+def indice(clientes):
+    return _CoeClientesIndice(clientes)
+
+
+@pytest.mark.parametrize("nombre", NOMBRES + [
+    "aire s.a.s", "banco de bogota sa", "xx claro colombia yy", "", "  ", None, "ZZZ", "É", "C", "BOG",
+])
+def test_casos_conocidos(indice, clientes, nombre):
+    encontrado = indice.buscar(nombre)
+    assert (encontrado.id if encontrado else None) == _buscar_lineal(nombre, clientes)
+
+
+def test_equivale_al_recorrido_lineal(indice, clientes):
+    rnd = random.Random(11)
+    for _ in range(3000):
+        nombre = "".join(rnd.choice("ABCÉ -0123") for _ in range(rnd.randint(1, 10)))
+        encontrado = indice.buscar(nombre)
+        assert (encontrado.id if encontrado else None) == _buscar_lineal(nombre, clientes), nombre
+
+
+def test_sin_clientes():
+    assert _CoeClientesIndice([]).buscar("CLARO") is None
@@ -0,0 +1,87 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from backend.routes import _coe_ext_networkdays, _coe_ext_networkdays_lote, _coe_ext_sla_habiles_lote
+
+
+def _networkdays_dia_a_dia(inicio, fin, feriados=frozenset()):
+    """NETWORKDAYS recorriendo día por día, como el cálculo anterior."""
+    if not inicio or not fin:
+        return None
+    a, b = inicio.date(), fin.date()
+    if b < a:
+        return 0
+    dias = 0
+    while a <= b:
+        if a.weekday() < 5 and a not in feriados:
+            dias += 1
+        a += timedelta(days=1)
+    return dias
+
+
+def _pares(n, semilla=1):
+    rnd = random.Random(semilla)
+    base = datetime(2020, 1, 1)
+
+    def fecha():
+        if rnd.random() < 0.05:
+            return None
+        return base + timedelta(days=rnd.randint(0, 2500), minutes=rnd.randint(0, 1439))
+
+    return [(fecha(), fecha()) for _ in range(n)]
+
+
+PARES = _pares(5000) + [
+    (datetime(2026, 10, 17), datetime(2026, 10, 17)),  # sábado
+    (datetime(2026, 10, 19, 23, 59), datetime(2026, 10, 19, 0, 1)),  # mismo lunes
+    (datetime(2026, 10, 23), datetime(2026, 10, 26)),  # viernes a lunes
+]
+
+
+def test_escalar_equivale_al_recorrido():
+    for inicio, fin in PARES:
+        assert _coe_ext_networkdays(inicio, fin) == _networkdays_dia_a_dia(inicio, fin), (inicio, fin)
+
+
+def test_lote_equivale_al_recorrido():
+    inicios, fines = zip(*PARES)
+    esperado = [_networkdays_dia_a_dia(a, b) for a, b in PARES]
+
+    assert _coe_ext_networkdays_lote(list(inicios), list(fines)) == esperado
+
+
+def test_lote_con_feriados():
+    feriados = frozenset({date(2026, 12, 25), date(2026, 12, 8)})
+    pares = _pares(500, semilla=2) + [(datetime(2026, 12, 1), datetime(2026, 12, 31))]
+    inicios, fines = zip(*pares)
+
+    assert _coe_ext_networkdays_lote(list(inicios), list(fines), feriados) == [
+        _networkdays_dia_a_dia(a, b, feriados) for a, b in pares
+    ]
+
+
+def test_lote_vacio():
+    assert _coe_ext_networkdays_lote([], []) == []
+
+
+@pytest.mark.parametrize("estimacion", [None, datetime(2026, 11, 3, 8, 0)])
+def test_sla_habiles_lote(estimacion):
+    class Fila:
+        pass
+
+    ahora = datetime(2026, 10, 17, 12, 0)
+    filas = []
+    for asignacion in (datetime(2026, 10, 1, 9, 0), datetime(2026, 10, 16, 18, 0), None):
+        fila = Fila()
+        fila.fecha_asignacion = asignacion
+        fila.fecha_estimacion = estimacion
+        filas.append(fila)
+
+    _coe_ext_sla_habiles_lote(filas, ahora=ahora)
+
+    for fila in filas[:2]:
+        esperado = _networkdays_dia_a_dia(fila.fecha_asignacion + timedelta(days=1), estimacion or ahora)
+        assert fila.dias_entrega_estimacion == esperado
+    assert not hasattr(filas[2], "dias_entrega_estimacion")
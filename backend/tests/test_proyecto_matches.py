@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from backend.models import db, Proyecto, ProyectoMapeo, Registro, RegistroProyectoMatch
+from backend.proyecto_matches import recalcular_matches
+
+TEXTOS = ["ABC", "x_z", "Q%1", "abc", "ZZ", "hello", "xaz", "Q11", "p1x", "zz abc p2", None]
+
+
+def _matches():
+    return {(m.registro_id, m.proyecto_id) for m in RegistroProyectoMatch.query.all()}
+
+
+@pytest.fixture
+def proyectos(app):
+    rnd = random.Random(7)
+    with app.app_context():
+        ids = []
+        for i in range(4):
+            proyecto = Proyecto(codigo=f"P{i}", nombre=f"Proyecto {i}")
+            db.session.add(proyecto)
+            db.session.flush()
+            ids.append(proyecto.id)
+        db.session.commit()
+
+        for _ in range(300):
+            db.session.add(Registro(
+                fecha="2026-10-01",
+                cliente="A",
+                usuario_consultor="u1",
+                consultor_id=1,
+                nro_caso_cliente=rnd.choice(TEXTOS),
+                descripcion=rnd.choice(TEXTOS),
+                proyecto_id=rnd.choice([None] + ids),
+            ))
+        db.session.commit()
+        yield ids
+
+
+def test_cambios_de_reglas_equivalen_al_recalculo_completo(proyectos):
+    rnd = random.Random(3)
+    mapeo_id = 0
+    for paso in range(10):
+        proyecto_id = rnd.choice(proyectos)
+        usados = {m.valor_origen for m in ProyectoMapeo.query.filter_by(proyecto_id=proyecto_id)}
+        mapeo_id += 1
+        db.session.add(ProyectoMapeo(
+            id=mapeo_id,
+            proyecto_id=proyecto_id,
+            valor_origen=rnd.choice([t for t in TEXTOS if t and t not in usados] or [f"V{paso}"]),
+            tipo_match=rnd.choice(["EXACT", "CONTAINS"]),
+            activo=True,
+        ))
+        if paso == 5:
+            # comodines de LIKE en el código: el prefiltro debe escaparlos
+            db.session.get(Proyecto, proyectos[0]).codigo = "Q%1"
+        db.session.commit()
+
+        incremental = _matches()
+        recalcular_matches(db.session)
+        db.session.commit()
+        assert incremental == _matches(), paso
+
+
+def test_regex_recalcula_sin_prefiltro(proyectos):
+    db.session.add(ProyectoMapeo(id=1, proyecto_id=proyectos[1], valor_origen="^X.Z$", tipo_match="REGEX", activo=True))
+    db.session.commit()
+
+    incremental = _matches()
+    assert any(p == proyectos[1] for _r, p in incremental)
+
+    recalcular_matches(db.session)
+    db.session.commit()
+    assert incremental == _matches()
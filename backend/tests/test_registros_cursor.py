@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from backend.models import db, Registro
+
+
+@pytest.fixture
+def registros(app):
+    """137 registros; buena parte con fecha no parseable (fecha_date NULL)."""
+    rnd = random.Random(3)
+    with app.app_context():
+        for i in range(137):
+            db.session.add(Registro(
+                fecha=rnd.choice([f"2026-10-{1 + i % 20:02d}", "basura", "31/02/2026"]),
+                cliente="A",
+                usuario_consultor="u1",
+                consultor_id=1,
+            ))
+        db.session.commit()
+        ids = [r.id for r in Registro.query.all()]
+        nulos = Registro.query.filter(Registro.fecha_date.is_(None)).count()
+    assert 0 < nulos < len(ids)
+    return ids
+
+
+def _paginas_cursor(client, headers, per_page):
+    vistos, cursor = [], ""
+    while True:
+        resp = client.get(f"/api/registros?cursor={cursor}&per_page={per_page}", headers=headers)
+        assert resp.status_code == 200
+        body = resp.get_json()
+        vistos += [d["id"] for d in body["data"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            return vistos, body["total"]
+
+
+def _paginas_offset(client, headers, per_page, total):
+    vistos = []
+    for page in range(1, total // per_page + 2):
+        resp = client.get(f"/api/registros?page={page}&per_page={per_page}", headers=headers)
+        assert resp.status_code == 200
+        vistos += [d["id"] for d in resp.get_json()["data"]]
+    return vistos
+
+
+@pytest.mark.parametrize("per_page", [1, 10, 50, 200])
+def test_cursor_recorre_todo_sin_repetir(client, auth_headers, registros, per_page):
+    vistos, total = _paginas_cursor(client, auth_headers, per_page)
+
+    assert total == len(registros)
+    assert len(vistos) == len(set(vistos))
+    assert set(vistos) == set(registros)
+
+
+def test_cursor_y_offset_usan_el_mismo_orden(client, auth_headers, registros):
+    por_cursor, total = _paginas_cursor(client, auth_headers, 10)
+
+    assert _paginas_offset(client, auth_headers, 10, total) == por_cursor
+
+
+def test_cursor_invalido_responde_400(client, auth_headers, registros):
+    resp = client.get("/api/registros?cursor=no-es-un-cursor&per_page=5", headers=auth_headers)
+
+    assert resp.status_code == 400
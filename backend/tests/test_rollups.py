@@ -0,0 +1,94 @@
+import pytest
+
+from backend.models import db, Registro, RegistroResumenDiario
+from backend.rollups import clave_de, diferencias_resumen, dimensiones_de, reconstruir_resumen
+
+
+def _registro(**kw):
+    valores = dict(fecha="2026-10-01", cliente="ACME", usuario_consultor="u1", consultor_id=1, total_horas=2.0)
+    valores.update(kw)
+    return Registro(**valores)
+
+
+def _fila(registro):
+    return RegistroResumenDiario.query.filter_by(clave=clave_de(dimensiones_de(registro))).first()
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+def test_insert_suma_en_el_dia(ctx):
+    db.session.add_all([_registro(), _registro(total_horas=3.0), _registro(fecha="2026-10-02")])
+    db.session.commit()
+
+    fila = _fila(Registro.query.first())
+    assert fila.registros == 2
+    assert float(fila.total_horas) == pytest.approx(5.0)
+    assert RegistroResumenDiario.query.count() == 2
+    assert diferencias_resumen(db.session) == []
+
+
+def test_update_mueve_las_horas_entre_dias(ctx):
+    r = _registro()
+    db.session.add_all([r, _registro()])
+    db.session.commit()
+
+    r.fecha = "02/10/2026"
+    r.total_horas = 4.0
+    db.session.commit()
+
+    assert _fila(Registro.query.filter(Registro.id != r.id).first()).registros == 1
+    movida = _fila(r)
+    assert movida.fecha_date.isoformat() == "2026-10-02"
+    assert float(movida.total_horas) == pytest.approx(4.0)
+    assert diferencias_resumen(db.session) == []
+
+
+def test_update_usa_tiempo_invertido_si_no_hay_total(ctx):
+    r = _registro(total_horas=None, tiempo_invertido=1.5)
+    db.session.add(r)
+    db.session.commit()
+    assert float(_fila(r).horas) == pytest.approx(1.5)
+
+    r.total_horas = 2.5
+    db.session.commit()
+
+    fila = _fila(r)
+    assert float(fila.total_horas) == pytest.approx(2.5)
+    assert float(fila.horas) == pytest.approx(2.5)
+    assert diferencias_resumen(db.session) == []
+
+
+def test_delete_quita_la_fila_al_llegar_a_cero(ctx):
+    a, b = _registro(), _registro(cliente="OTRO")
+    db.session.add_all([a, b])
+    db.session.commit()
+
+    db.session.delete(a)
+    db.session.commit()
+
+    assert _fila(b).registros == 1
+    assert RegistroResumenDiario.query.count() == 1
+    assert diferencias_resumen(db.session) == []
+
+
+def test_deltas_sobre_filas_previas_al_rollup(ctx):
+    # Registros que existían antes del rollup: se reconstruye (como el
+    # backfill de la migración) y los deltas siguientes deben cuadrar.
+    db.session.add_all([_registro(), _registro(), _registro(usuario_consultor=" U1 ")])
+    db.session.commit()
+    db.session.query(RegistroResumenDiario).delete()
+    db.session.commit()
+    reconstruir_resumen(db.session)
+    db.session.commit()
+
+    primero, segundo, tercero = Registro.query.order_by(Registro.id).all()
+    primero.total_horas = 7.0
+    db.session.delete(segundo)
+    tercero.cliente = "OTRO"
+    db.session.commit()
+
+    assert diferencias_resumen(db.session) == []